@@ -1,10 +1,19 @@
 import math
+from collections import OrderedDict
 from PyQt6.QtWidgets import QWidget, QLineEdit
-from PyQt6.QtCore import Qt, QPropertyAnimation, pyqtProperty, QEasingCurve, pyqtSignal
-from PyQt6.QtGui import QPainter, QFontMetrics, QFont, QKeyEvent
+from PyQt6.QtCore import Qt, QPropertyAnimation, pyqtProperty, QEasingCurve, pyqtSignal, QEvent, QPointF, QRectF
+from PyQt6.QtGui import (QPainter, QFontMetrics, QFont, QKeyEvent, QStaticText, QTextOption, QTransform,
+                         QImage)
 
 class CircularView(QWidget):
     line_saved = pyqtSignal()
+
+    LAYOUT_CACHE_SIZE = 512  # Líneas con el texto ya armado (QStaticText) que se conservan
+    STRIP_MARGIN = 12        # Líneas extra arriba y abajo de la tira (cubre una animación de PageUp/PageDown)
+    MASK_BAND = 2            # Alto mínimo en píxeles de cada franja de la máscara de opacidad
+    MASK_TOLERANCE = 0.008   # Diferencia de opacidad máxima dentro de una franja (~2/255)
+    REPEAT_ACCEL_EVERY = 6   # Con la tecla mantenida, cada tantas repeticiones se avanza una línea más por tecla
+    MAX_REPEAT_STEP = 5      # Máximo multiplicador del paso con repetición sostenida
     
     def __init__(self, ring, parent=None):
         super().__init__(parent)
@@ -17,8 +26,21 @@ class CircularView(QWidget):
         
         self.circle_radius = 0
         self.current_animation = None
+        self._target = 0            # Índice destino de la tanda de movimientos en curso
+        self._target_ring = None    # Ring para el que se calculó ese destino
+        self._target_distance = 0   # Líneas (con puntos) desde el índice actual hasta el destino
+        self._repeat_streak = 0     # Teclas recibidas mientras la animación seguía corriendo
         self.edit_mode = False
         self.insert_mode = False  # Nueva: modo insertar línea debajo
+        self.last_edit = None  # ('insert' | 'replace', índice en el ring, texto) del último guardado
+        # (texto, ancho, fuente) -> (QStaticText, alto): la animación solo recompone lo ya armado
+        self._layouts = OrderedDict()
+        # Tira con las líneas alrededor de la actual, dibujada una vez por índice/contenido;
+        # cada cuadro la copia desplazada, franja por franja con la opacidad de la máscara
+        self._strip = None
+        self._strip_key = None
+        self._strip_columns = (0, 0)  # Columnas [x0, x1) donde hay texto en la tira
+        self._mask = None             # [(y, alto, alpha)] de cada franja de la pantalla
         
         # Crear el editor
         self.editor = CustomLineEdit(self)
@@ -49,31 +71,75 @@ class CircularView(QWidget):
         self.update()
 
     def animate_move(self, delta):
+        """
+        Desplaza delta líneas navegables con animación. Las teclas que llegan
+        mientras anima (flecha mantenida) no se descartan: se suman al destino
+        y la animación se redirige hacia él; con repetición sostenida cada
+        tecla avanza más líneas. El índice del ring se asigna una sola vez,
+        al terminar, con el destino ya calculado (puntos salteados incluidos).
+        Quien cambia las líneas del ring (sync_ring_with_file) llama antes a
+        settle(), así el destino pasa al índice y se desplaza con los cambios.
+        """
         if self.edit_mode:
             return
-            
-        if self.current_animation and self.current_animation.state() == QPropertyAnimation.State.Running:
-            return
-        
-        # Animación simple - el move() del ring ya maneja el skip de puntos
+
+        running = self.current_animation is not None and \
+            self.current_animation.state() == QPropertyAnimation.State.Running
+        if running and self._target_ring is not self.ring:
+            # Otro ring (otro archivo, resultados, loop): el destino era de otras líneas
+            self.current_animation.stop()
+            self._offset = 0.0
+            running = False
+        if running:
+            self._repeat_streak += 1
+            # Lo ya recorrido en pantalla pasa al índice: la tira sigue sirviendo
+            passed = int(-self._offset)
+            if passed:
+                self.ring.index = self.ring.index_at(passed)
+                self._offset += passed
+                self._target_distance -= passed
+        else:
+            self._repeat_streak = 0
+            self._target = self.ring.index
+            self._target_ring = self.ring
+            self._target_distance = 0
+
+        step = delta * min(self.MAX_REPEAT_STEP, 1 + self._repeat_streak // self.REPEAT_ACCEL_EVERY)
+        target = self.ring.index_after(step, self._target)
+        self._target_distance += self.ring.distance(self._target, target, forward=step > 0)
+        self._target = target
+
+        if running:
+            self.current_animation.stop()
         anim = QPropertyAnimation(self, b"offset")
         anim.setDuration(180)
         anim.setEasingCurve(QEasingCurve.Type.OutQuad)
         anim.setStartValue(self._offset)
-        anim.setEndValue(self._offset - delta)
-        
-        def on_finished():
-            self.ring.move(delta)  # Esto ya saltea puntos
-            self._offset = 0.0
-            self.update()
-            self.current_animation = None
-        
-        anim.finished.connect(on_finished)
+        anim.setEndValue(float(-self._target_distance))
+        anim.finished.connect(self._finish_move)
         anim.start()
         self.current_animation = anim
 
+    def settle(self):
+        """Termina ya la animación en curso: el índice queda en su destino"""
+        if self.current_animation is not None:
+            self.current_animation.stop()
+            self._finish_move()
+
+    def _finish_move(self):
+        if self._target_ring is self.ring:
+            self.ring.index = self._target  # Una sola asignación por tanda de teclas
+        self._offset = 0.0
+        self._target_distance = 0
+        self._repeat_streak = 0
+        self.current_animation = None
+        self.update()
+
     def enter_edit_mode(self):
         """Entra en modo edición de la línea actual"""
+        if self.ring.read_only:
+            return
+        self.settle()
         self.edit_mode = True
         self.insert_mode = False
         
@@ -93,6 +159,9 @@ class CircularView(QWidget):
 
     def enter_insert_mode(self):
         """Entra en modo insertar nueva línea DEBAJO de la actual"""
+        if self.ring.read_only:
+            return
+        self.settle()
         self.edit_mode = True
         self.insert_mode = True
         
@@ -119,13 +188,14 @@ class CircularView(QWidget):
         if new_text:
             if self.insert_mode:
                 # Insertar NUEVA línea debajo de la actual
-                self.ring.lines.insert(self.ring.index + 1, new_text)
-                # Mover índice a la nueva línea
-                self.ring.index += 1
+                self.last_edit = ('insert', self.ring.index, new_text)
+                # El ring inserta y mueve el índice a la nueva línea (un sub-ring además se agranda)
+                self.ring.insert_below(new_text)
                 print(f"➕ Nueva línea insertada: {new_text}")
             else:
                 # Editar línea actual
-                self.ring.lines[self.ring.index] = new_text
+                self.ring.replace_current(new_text)
+                self.last_edit = ('replace', self.ring.index, new_text)
                 print(f"✅ Línea actualizada: {new_text}")
             
             self.line_saved.emit()
@@ -151,64 +221,134 @@ class CircularView(QWidget):
         
         return max(0.02, min(self.max_alpha, alpha))
 
+    def _layout(self, text, width):
+        """Texto armado (centrado y con word wrap) y su alto, de la cache LRU"""
+        font = self.font()
+        key = (text, width, font.key())
+        layout = self._layouts.get(key)
+        if layout is not None:
+            self._layouts.move_to_end(key)
+            return layout
+        height = QFontMetrics(font).boundingRect(0, 0, width, 1000, Qt.AlignmentFlag.AlignCenter, text).height()
+        static = QStaticText(text)
+        static.setTextFormat(Qt.TextFormat.PlainText)
+        static.setTextWidth(width)
+        option = QTextOption(Qt.AlignmentFlag.AlignHCenter)
+        option.setWrapMode(QTextOption.WrapMode.WordWrap)
+        static.setTextOption(option)
+        static.prepare(QTransform(), font)
+        layout = self._layouts[key] = (static, height)
+        if len(self._layouts) > self.LAYOUT_CACHE_SIZE:
+            self._layouts.popitem(last=False)
+        return layout
+
+    def changeEvent(self, event):
+        if event.type() == QEvent.Type.FontChange:
+            self._layouts.clear()
+            self._strip_key = None
+        super().changeEvent(event)
+
+    def _max_lines(self):
+        if self.circle_radius > 0:
+            return int(self.circle_radius / self.line_height) + 3
+        return 20
+
+    def _render_strip(self, w, margin):
+        """Dibuja las líneas [-margin, margin] alrededor de la actual, opacas, en una imagen"""
+        ratio = self.devicePixelRatioF()
+        height = (2 * margin + 2) * self.line_height
+        strip = QImage(int(w * ratio), int(height * ratio), QImage.Format.Format_ARGB32_Premultiplied)
+        strip.setDevicePixelRatio(ratio)
+        strip.fill(Qt.GlobalColor.transparent)
+        painter = QPainter(strip)
+        painter.setRenderHint(QPainter.RenderHint.TextAntialiasing)
+        painter.setFont(self.font())
+        # El mismo color con que QPainter dibujaría sobre el widget
+        painter.setPen(self.palette().color(self.foregroundRole()))
+        widest = 0
+        for i in range(-margin, margin + 1):
+            static, line_height = self._layout(self.ring.get(i), w)
+            widest = max(widest, static.size().width())
+            painter.drawStaticText(QPointF(0, int(height // 2 + i * self.line_height - line_height / 2)), static)
+        painter.end()
+        # Las líneas están centradas: solo hace falta copiar la columna del texto más ancho
+        x0 = max(0, int((w - widest) / 2) - 2)
+        self._strip_columns = (x0, w - x0)
+        return strip
+
+    def _alpha_mask(self, h):
+        """
+        Caída de opacidad de calculate_alpha precalculada como franjas
+        horizontales de la pantalla: angostas donde la curva cambia rápido
+        (cerca del centro) y anchas donde es casi plana.
+        """
+        bands = []
+        y = 0
+        while y < h:
+            alpha = self.calculate_alpha(abs(y - h // 2))
+            end = y + self.MASK_BAND
+            while end < h and end - y < self.line_height and \
+                    abs(self.calculate_alpha(abs(end - h // 2)) - alpha) < self.MASK_TOLERANCE:
+                end += self.MASK_BAND
+            end = min(end, h)
+            bands.append((y, end - y, self.calculate_alpha(abs((y + end) / 2 - h // 2))))
+            y = end
+        return bands
+
     def paintEvent(self, event):
         painter = QPainter(self)
         painter.setRenderHint(QPainter.RenderHint.TextAntialiasing)
-        fm = QFontMetrics(self.font())
 
         w = self.width()
         h = self.height()
         center_y = h // 2
-        
-        if self.edit_mode:
-            # Si estamos en modo edición/inserción, mostrar líneas con opacidad baja
-            if self.circle_radius > 0:
-                max_lines = int(self.circle_radius / self.line_height) + 3
-            else:
-                max_lines = 20
-            
-            for i in range(-max_lines, max_lines + 1):
-                y_pos = center_y + (i + self._offset) * self.line_height
-                text = self.ring.get(i)
-                text_rect = fm.boundingRect(0, 0, w, 1000, Qt.AlignmentFlag.AlignCenter, text)
-                draw_y = int(y_pos - text_rect.height() / 2)
-                distance_from_center = abs(y_pos - center_y)
-                
-                # En modo edición, todas las líneas con opacidad media
-                alpha = self.calculate_alpha(distance_from_center) * 0.4
-                
-                if alpha < 0.01:
-                    continue
-                
-                painter.setOpacity(alpha)
-                painter.drawText(0, draw_y, w, text_rect.height(),
-                                Qt.AlignmentFlag.AlignCenter | Qt.TextFlag.TextWordWrap,
-                                text)
-        else:
-            # Modo navegación normal
-            if self.circle_radius > 0:
-                max_lines = int(self.circle_radius / self.line_height) + 3
-            else:
-                max_lines = 20
-            
-            for i in range(-max_lines, max_lines + 1):
+        if w <= 0 or h <= 0:
+            return
+
+        max_lines = self._max_lines()
+        margin = max_lines + self.STRIP_MARGIN
+        # En modo edición/inserción, todas las líneas con opacidad baja
+        dim = 0.4 if self.edit_mode else 1.0
+
+        if abs(self._offset) > self.STRIP_MARGIN:
+            # Desplazamiento más largo que la tira: dibujar directamente las líneas que caen en pantalla
+            shift = int(-self._offset)
+            for i in range(shift - max_lines, shift + max_lines + 1):
                 y_pos = center_y + (i + self._offset) * self.line_height
-                text = self.ring.get(i)
-                text_rect = fm.boundingRect(0, 0, w, 1000, Qt.AlignmentFlag.AlignCenter, text)
-                draw_y = int(y_pos - text_rect.height() / 2)
-                distance_from_center = abs(y_pos - center_y)
-                alpha = self.calculate_alpha(distance_from_center)
-                
+                alpha = self.calculate_alpha(abs(y_pos - center_y)) * dim
                 if alpha < 0.01:
                     continue
-                
+                static, height = self._layout(self.ring.get(i), w)
                 painter.setOpacity(alpha)
-                painter.drawText(0, draw_y, w, text_rect.height(),
-                                Qt.AlignmentFlag.AlignCenter | Qt.TextFlag.TextWordWrap,
-                                text)
+                painter.drawStaticText(QPointF(0, int(y_pos - height / 2)), static)
+            return
+
+        # La tira se vuelve a dibujar solo si cambió la línea actual, el contenido o el tamaño
+        key = (id(self.ring), self.ring.index, self.ring.version, w, margin, self.font().key())
+        if self._strip_key != key:
+            self._strip = self._render_strip(w, margin)
+            self._strip_key = key
+        if self._mask is None:
+            self._mask = self._alpha_mask(h)
+
+        # Cuadro: la tira en el desplazamiento de la animación, cada franja con su opacidad
+        ratio = self._strip.devicePixelRatio()
+        strip_height = self._strip.height() / ratio
+        top = round(center_y - strip_height // 2 + self._offset * self.line_height)
+        x0, x1 = self._strip_columns
+        for y, band, alpha in self._mask:
+            source_y = y - top
+            if source_y + band <= 0 or source_y >= strip_height:
+                continue
+            painter.setOpacity(alpha * dim)
+            painter.drawImage(QRectF(x0, y, x1 - x0, band), self._strip,
+                              QRectF(x0 * ratio, source_y * ratio, (x1 - x0) * ratio, band * ratio))
 
     def resizeEvent(self, event):
         super().resizeEvent(event)
+        self._layouts.clear()
+        self._strip_key = None
+        self._mask = None
         screen_width = self.width()
         screen_height = self.height()
         self.circle_radius = min(screen_width, screen_height) // 2 - 35
@@ -1,11 +1,21 @@
 # controls.py - Controles de navegación y líneas aleatorias
 import random
 import os
+from bisect import bisect_left, bisect_right
+
+from document import open_document, request_flush
+from corpus_index import open_corpus_index
+from related_index import open_related_index
 
 def setup_controls(app):
     """Configura los controles de la aplicación."""
     print("Configurando controles...")
     app.first_up_after_submission = False
+    # Líneas relacionadas de la última consulta (Ctrl+R) y cuál se está mostrando
+    app.related_lines = []
+    app.related_position = 0
+    # Índice de líneas del corpus para Ctrl+0 (se abre con mmap y se pone al día al iniciar)
+    open_corpus_index(app.void_dir)
 
 def show_random_line_from_current_file(app, event=None):
     """
@@ -14,25 +24,24 @@ def show_random_line_from_current_file(app, event=None):
     """
     try:
         if os.path.exists(app.current_file_path):
-            with open(app.current_file_path, 'r', encoding='utf-8') as f:
-                lines = [line.strip() for line in f.readlines() if line.strip() and line.strip() != '.']
+            doc = open_document(app.current_file_path)
+            # Se sortea una posición entre las navegables (índice precalculado, o el del
+            # archivo mapeado) en lugar de armar la lista de todas las líneas
+            navigable = doc.navigable_indices()
             
-            if not lines:
+            if not navigable:
                 print(f"El archivo {os.path.basename(app.current_file_path)} no tiene líneas válidas.")
                 return
             
             # Exclude current line if exists and there are other options
             current_line = app.entry.text().strip() if app.entry.text() else None
-            available_lines = [line for line in lines if line != current_line] if current_line and len(lines) > 1 else lines
-            
-            if available_lines:
-                random_line = random.choice(available_lines)
-                app.entry.setText(random_line)
-                app.entry.setCursorPosition(0)
-                print(f"📋 Ctrl+. | Línea copiada del archivo activo: '{random_line}'")
-            else:
-                app.entry.setText(lines[0])
-                app.entry.setCursorPosition(0)
+            for _ in range(8):
+                random_line = doc.lines[random.choice(navigable)].strip()
+                if random_line != current_line or len(navigable) == 1:
+                    break
+            app.entry.setText(random_line)
+            app.entry.setCursorPosition(0)
+            print(f"📋 Ctrl+. | Línea copiada del archivo activo: '{random_line}'")
         else:
             print(f"El archivo {os.path.basename(app.current_file_path)} no existe.")
             app.entry.clear()
@@ -41,113 +50,126 @@ def show_random_line_from_current_file(app, event=None):
         app.entry.clear()
 
 
-def show_random_line_from_random_file(app, event=None):
+def show_random_line_from_random_file(app, event=None, by_file=False):
     """
-    COPIA una línea aleatoria de un archivo .txt aleatorio (EXCLUYENDO 0.txt),
-    incluyendo subcarpetas. La línea se copia al entry para editar.
+    COPIA una línea aleatoria del corpus (.txt EXCLUYENDO 0.txt, incluyendo
+    subcarpetas) al entry para editar. Usa el índice persistente de líneas:
+    todas las líneas tienen la misma probabilidad. Con by_file=True se elige
+    primero el archivo (cada archivo pesa igual, como antes).
     """
     try:
-        # Escanear todos los .txt en void_dir incluyendo subcarpetas
-        all_txt_files = []
-        for root, dirs, files in os.walk(app.void_dir):
-            for file in files:
-                if file.lower().endswith('.txt'):
-                    full_path = os.path.join(root, file)
-                    # Excluir 0.txt
-                    if os.path.basename(full_path) != '0.txt':
-                        all_txt_files.append(full_path)
-        
-        if not all_txt_files:
-            print("❌ No hay archivos .txt disponibles (excluyendo 0.txt).")
+        sampled = open_corpus_index(app.void_dir).sample(by_file=by_file)
+        if sampled is None:
+            print("❌ No hay líneas disponibles en los archivos .txt (excluyendo 0.txt).")
             return
-        
-        # Elegir archivo random
-        random_file = random.choice(all_txt_files)
-        
-        # Leer líneas válidas (excluir puntos)
-        with open(random_file, 'r', encoding='utf-8') as f:
-            lines = [line.strip() for line in f.readlines() if line.strip() and line.strip() != '.']
-        
-        if lines:
-            random_line = random.choice(lines)
-            app.entry.setText(random_line)
-            app.entry.setCursorPosition(0)
-            rel_path = os.path.relpath(random_file, app.void_dir)
-            print(f"📋 Ctrl+0 | Línea copiada de '{rel_path}': '{random_line}'")
-        else:
-            print(f"El archivo {os.path.basename(random_file)} no tiene líneas válidas.")
+
+        rel_path, random_line = sampled
+        app.entry.setText(random_line)
+        app.entry.setCursorPosition(0)
+        print(f"📋 Ctrl+0 | Línea copiada de '{rel_path}': '{random_line}'")
             
     except Exception as e:
         print(f"Error al copiar línea aleatoria de archivo random: {e}")
 
 
+def show_related_line(app, event=None):
+    """
+    COPIA al entry la línea del corpus más parecida (TF-IDF, coseno) al texto
+    del entry o, si está vacío, a la línea actual del ring. Repetir el atajo
+    sobre la línea copiada recorre las siguientes más parecidas al mismo texto.
+    La consulta corre en el hilo de app.related_finder; el resultado llega a
+    show_related_results.
+    """
+    try:
+        text = app.entry.text().strip()
+        if app.related_lines and text == app.related_lines[app.related_position][1]:
+            app.related_position = (app.related_position + 1) % len(app.related_lines)
+            _show_related(app)
+            return
+        query = text or app.line_ring.current().strip()
+        if not query:
+            print("❌ No hay texto para buscar líneas relacionadas.")
+            return
+        # Lo agregado en esta sesión tiene que estar en los .txt (se indexa solo lo nuevo):
+        # el compactador lo vuelca en su hilo y la consulta lo espera en el del finder
+        current = os.path.relpath(app.current_file_path, app.void_dir)
+        also = [] if current.startswith('..') else [current]
+        app.related_lines = []
+        app.related_finder.submit(query, also, ready=request_flush())
+    except Exception as e:
+        print(f"Error al buscar líneas relacionadas: {e}")
+
+
+def show_related_results(app, generation, query, results):
+    """Resultados de Ctrl+R (en el hilo de la interfaz); los de una consulta vieja se descartan."""
+    if generation != app.related_finder.generation:
+        return
+    app.related_lines = results
+    app.related_position = 0
+    if not results:
+        print(f"❌ No hay líneas relacionadas con '{query}'.")
+        return
+    _show_related(app)
+
+
+def _show_related(app):
+    rel_path, related_line = app.related_lines[app.related_position]
+    app.entry.setText(related_line)
+    app.entry.setCursorPosition(0)
+    print(f"🧭 Ctrl+R | Relacionada {app.related_position + 1}/{len(app.related_lines)} "
+          f"de '{rel_path}': '{related_line}'")
+
+
+def _show_navigated_line(app, lines, index, message):
+    app.current_active_line_index = index
+    app.current_active_line = lines[index].strip()
+    app.entry.setText(app.current_active_line)
+    app.entry.setCursorPosition(0)
+    app.first_up_after_submission = False
+    print(f"{message}: {app.current_active_line}")
+
+
+def _clear_navigation(app, message):
+    print(message)
+    app.current_active_line = None
+    app.current_active_line_index = None
+    app.first_up_after_submission = False
+    app.entry.clear()
+
+
 def show_previous_current_file_line(app, event=None):
     """Muestra la línea anterior en el archivo activo, con navegación circular."""
     try:
         if os.path.exists(app.current_file_path):
-            with open(app.current_file_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
+            # Documento residente compartido con void_line (validado por mtime/tamaño, no se relee)
+            doc = open_document(app.current_file_path)
+            lines = doc.lines
             
             if not lines:
-                print(f"El archivo {os.path.basename(app.current_file_path)} está vacío.")
-                app.current_active_line = None
-                app.current_active_line_index = None
-                app.first_up_after_submission = False
-                app.entry.clear()
+                _clear_navigation(app, f"El archivo {os.path.basename(app.current_file_path)} está vacío.")
                 return
             
             # If first Up press after submission, show last inserted line
-            if app.first_up_after_submission and hasattr(app, 'last_inserted_index') and app.last_inserted_index is not None:
-                if app.last_inserted_index < len(lines) and lines[app.last_inserted_index].strip():
-                    app.current_active_line = lines[app.last_inserted_index].strip()
-                    app.current_active_line_index = app.last_inserted_index
-                    app.entry.setText(app.current_active_line)
-                    app.entry.setCursorPosition(0)
-                    app.first_up_after_submission = False
-                    print(f"Primera flecha arriba: Mostrando última línea enviada: {app.current_active_line}")
+            if app.first_up_after_submission and doc.last_inserted_index is not None:
+                if doc.last_inserted_index < len(lines) and lines[doc.last_inserted_index].strip():
+                    _show_navigated_line(app, lines, doc.last_inserted_index,
+                                         "Primera flecha arriba: Mostrando última línea enviada")
                     return
             
-            # Normal navigation: Find previous non-empty line (skip dots)
+            # Índices navegables (sin vacías ni puntos) precalculados: la anterior es un bisect
+            navigable = doc.navigable_indices()
+            if not navigable:
+                _clear_navigation(app, "No hay líneas válidas en el archivo.")
+                return
             current_index = app.current_active_line_index if app.current_active_line_index is not None else len(lines)
-            new_index = current_index - 1
-            
-            # Loop if at start
-            if new_index < 0:
-                new_index = len(lines) - 1
-                while new_index >= 0:
-                    if lines[new_index].strip() and lines[new_index].strip() != '.':
-                        app.current_active_line_index = new_index
-                        app.current_active_line = lines[new_index].strip()
-                        app.entry.setText(app.current_active_line)
-                        app.entry.setCursorPosition(0)
-                        app.first_up_after_submission = False
-                        print(f"Loop a última línea: {app.current_active_line}")
-                        return
-                    new_index -= 1
-            
-            # Find previous non-empty line (skip dots)
-            while new_index >= 0:
-                if lines[new_index].strip() and lines[new_index].strip() != '.':
-                    app.current_active_line_index = new_index
-                    app.current_active_line = lines[new_index].strip()
-                    app.entry.setText(app.current_active_line)
-                    app.entry.setCursorPosition(0)
-                    app.first_up_after_submission = False
-                    print(f"Línea anterior mostrada: {app.current_active_line}")
-                    return
-                new_index -= 1
-            
-            print("No hay líneas válidas en el archivo.")
-            app.current_active_line = None
-            app.current_active_line_index = None
-            app.first_up_after_submission = False
-            app.entry.clear()
+            pos = bisect_left(navigable, current_index) - 1
+            if pos < 0:
+                # Loop a la última línea
+                _show_navigated_line(app, lines, navigable[-1], "Loop a última línea")
+            else:
+                _show_navigated_line(app, lines, navigable[pos], "Línea anterior mostrada")
         else:
-            print(f"El archivo {os.path.basename(app.current_file_path)} no existe.")
-            app.current_active_line = None
-            app.current_active_line_index = None
-            app.first_up_after_submission = False
-            app.entry.clear()
+            _clear_navigation(app, f"El archivo {os.path.basename(app.current_file_path)} no existe.")
     except Exception as e:
         print(f"Error al mostrar línea anterior: {e}")
         app.current_active_line = None
@@ -160,58 +182,30 @@ def show_next_current_file_line(app, event=None):
     """Muestra la línea siguiente en el archivo activo, con navegación circular."""
     try:
         if os.path.exists(app.current_file_path):
-            with open(app.current_file_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
+            # Documento residente compartido con void_line (validado por mtime/tamaño, no se relee)
+            doc = open_document(app.current_file_path)
+            lines = doc.lines
             
             if not lines:
-                print(f"El archivo {os.path.basename(app.current_file_path)} está vacío.")
-                app.current_active_line = None
-                app.current_active_line_index = None
-                app.first_up_after_submission = False
-                app.entry.clear()
+                _clear_navigation(app, f"El archivo {os.path.basename(app.current_file_path)} está vacío.")
                 return
             
             # If index is None, start from last_inserted_index
-            current_index = (app.last_inserted_index if hasattr(app, 'last_inserted_index') and app.last_inserted_index is not None else -1) if app.current_active_line_index is None else app.current_active_line_index
-            new_index = current_index + 1
-            
-            # Loop if past end
-            if new_index >= len(lines):
-                new_index = 0
-                while new_index < len(lines):
-                    if lines[new_index].strip() and lines[new_index].strip() != '.':
-                        app.current_active_line_index = new_index
-                        app.current_active_line = lines[new_index].strip()
-                        app.entry.setText(app.current_active_line)
-                        app.entry.setCursorPosition(0)
-                        app.first_up_after_submission = False
-                        print(f"Loop a primera línea: {app.current_active_line}")
-                        return
-                    new_index += 1
-            
-            # Find next non-empty line (skip dots)
-            while new_index < len(lines):
-                if lines[new_index].strip() and lines[new_index].strip() != '.':
-                    app.current_active_line_index = new_index
-                    app.current_active_line = lines[new_index].strip()
-                    app.entry.setText(app.current_active_line)
-                    app.entry.setCursorPosition(0)
-                    app.first_up_after_submission = False
-                    print(f"Línea siguiente mostrada: {app.current_active_line}")
-                    return
-                new_index += 1
-            
-            print("No hay líneas válidas en el archivo.")
-            app.current_active_line = None
-            app.current_active_line_index = None
-            app.first_up_after_submission = False
-            app.entry.clear()
+            current_index = (doc.last_inserted_index if doc.last_inserted_index is not None else -1) if app.current_active_line_index is None else app.current_active_line_index
+
+            # Índices navegables (sin vacías ni puntos) precalculados: la siguiente es un bisect
+            navigable = doc.navigable_indices()
+            if not navigable:
+                _clear_navigation(app, "No hay líneas válidas en el archivo.")
+                return
+            pos = bisect_right(navigable, current_index)
+            if pos >= len(navigable):
+                # Loop a la primera línea
+                _show_navigated_line(app, lines, navigable[0], "Loop a primera línea")
+            else:
+                _show_navigated_line(app, lines, navigable[pos], "Línea siguiente mostrada")
         else:
-            print(f"El archivo {os.path.basename(app.current_file_path)} no existe.")
-            app.current_active_line = None
-            app.current_active_line_index = None
-            app.first_up_after_submission = False
-            app.entry.clear()
+            _clear_navigation(app, f"El archivo {os.path.basename(app.current_file_path)} no existe.")
     except Exception as e:
         print(f"Error al mostrar línea siguiente: {e}")
         app.current_active_line = None
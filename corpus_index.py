@@ -0,0 +1,246 @@
+# corpus_index.py - Índice persistente (archivo, offset) de todas las líneas del corpus void
+import json
+import mmap
+import os
+import random
+
+import numpy as np
+
+from journal import file_fingerprint
+
+INDEX_NAME = '.void_lines.idx'
+META_NAME = '.void_lines.json'
+
+# Una entrada por línea válida: número de archivo (en la tabla del meta) y offset en bytes
+ENTRY_DTYPE = np.dtype([('file', '<u4'), ('offset', '<u8')])
+
+
+def scan_line_offsets(path):
+    """Offsets en bytes de las líneas válidas (no vacías y que no son solo '.') de un archivo."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    offsets = []
+    pos = 0
+    for raw in data.split(b'\n'):
+        stripped = raw.strip()
+        if stripped and stripped != b'.':
+            offsets.append(pos)
+        pos += len(raw) + 1
+    return offsets
+
+
+def is_corpus_file(rel_path):
+    return rel_path.lower().endswith('.txt') and os.path.basename(rel_path) != '0.txt'
+
+
+def _corpus_files(void_dir):
+    """Todos los .txt de void_dir (incluyendo subcarpetas), excluyendo 0.txt: ruta relativa -> huella."""
+    files = {}
+    for root, dirs, names in os.walk(void_dir):
+        for name in names:
+            if is_corpus_file(name):
+                full_path = os.path.join(root, name)
+                fp = file_fingerprint(full_path)
+                if fp is not None:
+                    files[os.path.relpath(full_path, void_dir)] = fp
+    return files
+
+
+class CorpusIndex:
+    """
+    Índice en disco de cada línea válida del corpus (todos los .txt menos 0.txt)
+    como un arreglo compacto de (archivo, offset) que se abre con mmap. Elegir
+    una línea al azar es un entero aleatorio más un seek y una lectura, sin
+    recorrer el directorio ni leer archivos enteros.
+
+    Cada archivo ocupa un tramo contiguo del arreglo; la tabla de archivos (con
+    su huella mtime/tamaño) vive en un .json al lado. Al refrescar solo se
+    vuelven a leer los archivos cuya huella cambió.
+    """
+
+    def __init__(self, void_dir):
+        self.void_dir = void_dir
+        self.path = os.path.join(void_dir, INDEX_NAME)
+        self.meta_path = os.path.join(void_dir, META_NAME)
+        self.files = []      # [(ruta relativa, huella, inicio, cantidad)] en el orden del arreglo
+        self.entries = np.zeros(0, dtype=ENTRY_DTYPE)
+        self._mm = None
+        self._nonempty = []  # Archivos con al menos una línea (para el muestreo por archivo)
+        self._dir_fp = None
+        self._pending = set()  # Archivos avisados por el watcher, sin aplicar todavía
+        self.watched = False
+        self.load()
+
+    # --- Carga y escritura ---
+
+    def load(self):
+        """Abre el índice guardado (si existe) con mmap."""
+        self.files = []
+        self._nonempty = []
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            files = [tuple(entry) for entry in meta['files']]
+        except (OSError, ValueError, KeyError):
+            return
+        total = sum(entry[3] for entry in files)
+        if total == 0:
+            self.files = files
+            return
+        try:
+            with open(self.path, 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return
+        if len(mm) != total * ENTRY_DTYPE.itemsize:
+            mm.close()
+            print("⚠️ Índice de líneas inconsistente, se reconstruye.")
+            return
+        self._mm = mm
+        self.entries = np.frombuffer(mm, dtype=ENTRY_DTYPE)
+        self.files = files
+        self._nonempty = [entry for entry in files if entry[3]]
+
+    def close(self):
+        self.entries = np.zeros(0, dtype=ENTRY_DTYPE)
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+    def _write(self, files, segments):
+        """Guarda arreglo + tabla de archivos de forma atómica y vuelve a abrirlos con mmap."""
+        entries = np.concatenate(segments) if segments else np.zeros(0, dtype=ENTRY_DTYPE)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(entries.tobytes())
+        tmp_meta = self.meta_path + '.tmp'
+        with open(tmp_meta, 'w', encoding='utf-8') as f:
+            json.dump({'files': files}, f, ensure_ascii=False)
+        # El mmap viejo tiene que estar cerrado antes de reemplazar el archivo (Windows)
+        self.close()
+        os.replace(tmp_path, self.path)
+        os.replace(tmp_meta, self.meta_path)
+        self.load()
+
+    def note_change(self, path):
+        """Evento del watcher: path se creó, cambió o se borró. Se aplica al próximo muestreo."""
+        self.watched = True
+        rel = os.path.relpath(path, self.void_dir)
+        if is_corpus_file(rel):
+            self._pending.add(rel)
+
+    def refresh(self, changed=None):
+        """
+        Sincroniza el índice con el disco releyendo solo los archivos nuevos o
+        modificados. Con changed (rutas relativas, p. ej. de eventos del watcher)
+        solo se consultan esos archivos en lugar de recorrer el directorio.
+        """
+        if changed is None:
+            current = _corpus_files(self.void_dir)
+        else:
+            current = {entry[0]: list(entry[1]) for entry in self.files}
+            for rel in changed:
+                fp = file_fingerprint(os.path.join(self.void_dir, rel))
+                if fp is None:
+                    current.pop(rel, None)
+                else:
+                    current[rel] = fp
+        known = {entry[0]: (file_id, entry) for file_id, entry in enumerate(self.files)}
+
+        files, segments = [], []
+        changed = set(known) != set(current)
+        start = 0
+        for file_id, rel in enumerate(sorted(current)):
+            fp = current[rel]
+            old_id, old = known.get(rel, (None, None))
+            if old is not None and list(old[1]) == fp:
+                # Copia: una vista del mmap impediría cerrarlo en _write
+                offsets = self.entries['offset'][old[2]:old[2] + old[3]].copy()
+                changed = changed or old_id != file_id
+            else:
+                try:
+                    offsets = np.array(scan_line_offsets(os.path.join(self.void_dir, rel)), dtype='<u8')
+                except OSError:
+                    continue
+                changed = True
+            segment = np.empty(len(offsets), dtype=ENTRY_DTYPE)
+            segment['file'] = file_id
+            segment['offset'] = offsets
+            segments.append(segment)
+            files.append((rel, fp, start, len(offsets)))
+            start += len(offsets)
+
+        if changed:
+            self._write(files, segments)
+            print(f"🗂️ Índice de líneas: {start} líneas en {len(files)} archivos")
+        # Lo avisado se descarta recién cuando quedó aplicado
+        self._pending.clear()
+        # Después de escribir: los propios archivos del índice también cambian el directorio
+        self._dir_fp = file_fingerprint(self.void_dir)
+        return self
+
+    # --- Muestreo ---
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _stale(self, file_id):
+        rel, fp = self.files[file_id][:2]
+        return file_fingerprint(os.path.join(self.void_dir, rel)) != list(fp)
+
+    def read_line(self, k):
+        """(ruta relativa, texto) de la entrada k: un seek y una lectura."""
+        file_id, offset = int(self.entries[k]['file']), int(self.entries[k]['offset'])
+        rel = self.files[file_id][0]
+        with open(os.path.join(self.void_dir, rel), 'rb') as f:
+            f.seek(offset)
+            raw = f.readline()
+        return rel, raw.decode('utf-8', errors='replace').strip()
+
+    def sample(self, by_file=False, attempts=3):
+        """
+        Devuelve (ruta relativa, línea) al azar, o None si el corpus no tiene líneas.
+        Por defecto cada línea tiene la misma probabilidad; con by_file=True primero
+        se elige un archivo (uniforme) y después una línea dentro de él.
+        """
+        if self._pending:
+            self.refresh(changed=self._pending)
+        elif not self.watched and file_fingerprint(self.void_dir) != self._dir_fp:
+            # Sin watcher: archivos creados o borrados cambian la huella del directorio
+            self.refresh()
+        for _ in range(attempts):
+            if not len(self.entries):
+                return None
+            if by_file:
+                rel, fp, start, count = random.choice(self._nonempty)
+                k = start + random.randrange(count)
+            else:
+                k = random.randrange(len(self.entries))
+            file_id = int(self.entries[k]['file'])
+            if self._stale(file_id):
+                # El archivo cambió desde que se indexó: reindexarlo y volver a elegir
+                self.refresh(changed={self.files[file_id][0]})
+                continue
+            return self.read_line(k)
+        return None
+
+
+# --- Registro de índices por directorio ---
+
+_indexes = {}
+
+
+def open_corpus_index(void_dir):
+    """Devuelve el índice del directorio; la primera vez lo abre y lo pone al día."""
+    key = os.path.abspath(void_dir)
+    index = _indexes.get(key)
+    if index is None:
+        index = CorpusIndex(void_dir).refresh()
+        _indexes[key] = index
+    return index
+
+
+def close_corpus_indexes():
+    for index in _indexes.values():
+        index.close()
+    _indexes.clear()
@@ -0,0 +1,712 @@
+# document.py - Documento residente por archivo void (líneas + cursor de inserción)
+import os
+from array import array
+from collections import OrderedDict
+from contextlib import nullcontext
+
+from journal import VoidJournal, EDIT_OPS, file_fingerprint, fingerprint_matches
+from line_rope import LineRope, is_separator
+from mapped_lines import MappedLines, MAPPED_MIN_BYTES
+
+# Registro de cambios para el ring (ver ring_changes_since): cuántos se guardan y su tamaño máximo
+CHANGE_LOG_SIZE = 256
+CHANGE_LOG_MAX_LINES = 20_000
+
+
+def edit_record(start, stop, new_lines):
+    """Registro de journal para lines[start:stop] = new_lines."""
+    if stop == start:
+        return {'op': 'insert', 'index': start, 'lines': new_lines}
+    if not new_lines:
+        return {'op': 'delete', 'start': start, 'stop': stop}
+    return {'op': 'replace', 'start': start, 'stop': stop, 'lines': new_lines}
+
+
+class VoidDocument:
+    """
+    Mantiene en memoria las líneas de un archivo void y el cursor
+    last_inserted_index. Las líneas se guardan SIN salto de línea, en un
+    LineRope para que las inserciones en el medio no desplacen todo el archivo.
+
+    Cada edición se aplica en memoria y se registra en el journal del
+    directorio (costo proporcional a la edición); el compactador del journal
+    la vuelca después al .txt. Si el archivo cambia por fuera (mtime/tamaño
+    distintos), se recarga.
+    """
+
+    def __init__(self, path, journal=None):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.journal = journal
+        self.lines = LineRope()
+        self.newline = '\n'
+        self.ends_with_newline = True
+        self.fingerprint = None
+        self.last_inserted_index = None
+        self.version = 0
+        # (versión tras el cambio, posición en el ring, líneas no vacías quitadas, las agregadas)
+        self._changes = []
+        self._changes_base = 0  # Desde esta versión el registro está completo
+        self._navigable = array('q')
+        self._navigable_version = None
+        # Estado respecto del .txt: cuántas líneas tenía al guardarse y desde dónde cambió
+        self.saved_len = 0
+        self.dirty_from = None
+        # Origen vaciado por un movimiento: el compactador elimina el archivo
+        self.unlink_pending = False
+        self.load()
+
+    def _lock(self):
+        return self.journal.lock if self.journal else nullcontext()
+
+    # --- Lectura ---
+
+    def load(self):
+        """(Re)carga el archivo completo desde disco."""
+        self.fingerprint = file_fingerprint(self.path)
+        if self.fingerprint is None:
+            self.lines = LineRope()
+            self.ends_with_newline = True
+            self.version += 1
+            self._forget_changes()
+            self.mark_saved()
+            return
+
+        with open(self.path, 'r', encoding='utf-8', newline='') as f:
+            raw = f.read()
+
+        self.newline = '\r\n' if '\r\n' in raw[:raw.find('\n') + 1] else '\n'
+        self.ends_with_newline = not raw or raw.endswith('\n')
+        lines = raw.split('\n')
+        if raw.endswith('\n'):
+            lines.pop()
+        if self.newline == '\r\n':
+            lines = [l[:-1] if l.endswith('\r') else l for l in lines]
+        self.lines = LineRope(lines if raw else [])
+        self.version += 1
+        self._forget_changes()
+        self.mark_saved()
+
+    def refresh(self):
+        """Recarga solo si el archivo cambió por fuera desde la última lectura/escritura."""
+        with self._lock():
+            if not fingerprint_matches(self.fingerprint, file_fingerprint(self.path)):
+                print(f"🔄 {self.name} cambió en disco, recargando documento.")
+                if self.journal:
+                    # Lo que está en disco gana: los cambios pendientes quedan descartados
+                    self.journal.discard(self)
+                self.load()
+        return self
+
+    def last_nonblank_line(self):
+        """Última línea no vacía (strip), o None. Recorre desde el final."""
+        for l in reversed(self.lines):
+            stripped = l.strip()
+            if stripped:
+                return stripped
+        return None
+
+    def navigable_indices(self):
+        """
+        Índices (ordenados) de las líneas navegables con Up/Down: no vacías y que
+        no son solo '.'. Se calcula una vez por versión del documento.
+        """
+        if self._navigable_version != self.version:
+            self._navigable = array('q', (i for i, l in enumerate(self.lines)
+                                          if l.strip() and not is_separator(l)))
+            self._navigable_version = self.version
+        return self._navigable
+
+    def ring_changes_since(self, version):
+        """
+        Cambios desde version en coordenadas del LineRing (solo líneas no vacías,
+        con strip): [(posición, cuántas quitar, líneas a poner)], en orden. None
+        si el registro no llega hasta ahí (recarga desde disco, cambio enorme o
+        demasiados cambios): hay que comparar el archivo entero.
+        """
+        if not self._changes_base <= version <= self.version:
+            return None
+        k = len(self._changes)
+        while k and self._changes[k - 1][0] > version:
+            k -= 1
+        return [change[1:] for change in self._changes[k:]]
+
+    def _log_change(self, rank, removed, new_lines):
+        added = [l.strip() for l in new_lines if l.strip()]
+        if len(added) > CHANGE_LOG_MAX_LINES:
+            self._forget_changes()
+            return
+        self._changes.append((self.version, rank, removed, added))
+        if len(self._changes) > CHANGE_LOG_SIZE:
+            del self._changes[:CHANGE_LOG_SIZE // 2]
+            self._changes_base = self._changes[0][0] - 1
+
+    def _forget_changes(self):
+        self._changes = []
+        self._changes_base = self.version
+
+    def position_of_nonblank(self, k):
+        """Índice en el archivo de la k-ésima línea no vacía (como las cuenta el LineRing), o None."""
+        if not 0 <= k < self.lines.nonblank_count():
+            return None
+        return self.lines.nonblank_position(k)
+
+    def ring_position(self, number):
+        """Posición en el LineRing de la línea number del archivo (contando las vacías, que el ring no tiene)."""
+        return self.lines.count_nonblank(number)
+
+    # --- Escritura ---
+
+    def mark_saved(self):
+        """El contenido en memoria coincide con el .txt."""
+        self.saved_len = len(self.lines)
+        self.dirty_from = None
+
+    def take_checkpoint(self):
+        """
+        Para el compactador: devuelve (solo_append, líneas). Si solo se agregaron
+        líneas al final, son esas; si no, el documento completo para reescribir.
+        """
+        appending = self.dirty_from is not None and self.dirty_from >= self.saved_len
+        lines = list(self.lines[self.saved_len:]) if appending else list(self.lines)
+        self.mark_saved()
+        return appending, lines
+
+    def checkpoint_failed(self):
+        # El próximo intento reescribe el archivo completo
+        self.dirty_from = 0
+
+    def discard_pending(self):
+        # El disco ganó: el próximo refresh() recarga las líneas
+        pass
+
+    def _apply(self, start, stop, new_lines):
+        """Aplica lines[start:stop] = new_lines solo en memoria. Devuelve (start, stop) efectivos."""
+        start = max(0, min(start, len(self.lines)))
+        stop = max(start, min(stop, len(self.lines)))
+        # Lo mismo visto desde el ring: O(log n) con el índice de líneas vacías del rope
+        rank = self.lines.count_nonblank(start)
+        removed = self.lines.count_nonblank(stop) - rank
+        self.lines[start:stop] = new_lines
+        self.dirty_from = start if self.dirty_from is None else min(self.dirty_from, start)
+        self.version += 1
+        self._log_change(rank, removed, new_lines)
+        return start, stop
+
+    def splice(self, start, stop, new_lines):
+        """Reemplaza lines[start:stop] por new_lines y lo registra en el journal."""
+        new_lines = list(new_lines)
+        with self._lock():
+            start, stop = self._apply(start, stop, new_lines)
+            if self.journal is None:
+                self.save()
+                return
+            self.journal.log(self, edit_record(start, stop, new_lines))
+
+    def _append(self, new_lines):
+        self._apply(len(self.lines), len(self.lines), new_lines)
+
+    def insert(self, index, new_lines):
+        self.splice(index, index, new_lines)
+
+    def append(self, new_lines):
+        self.splice(len(self.lines), len(self.lines), new_lines)
+
+    def replace(self, index, new_lines):
+        self.splice(index, index + 1, new_lines)
+
+    def delete(self, start, stop=None):
+        self.splice(start, start + 1 if stop is None else stop, [])
+
+    def replace_all(self, new_lines):
+        self.splice(0, len(self.lines), new_lines)
+
+    def encode_lines(self, lines):
+        return ''.join(l + self.newline for l in lines).encode('utf-8')
+
+    def save(self):
+        """Escritura completa y atómica del documento (temporal + fsync + os.replace)."""
+        tmp_path = os.path.join(os.path.dirname(self.path), '.' + self.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(self.encode_lines(self.lines))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.ends_with_newline = True
+        self.fingerprint = file_fingerprint(self.path)
+        self.mark_saved()
+
+
+class AppendTarget:
+    """
+    Destino de un movimiento (/archivo) que NO se carga en memoria: solo se lee
+    el final del archivo (leyendo bloques desde el final) para conocer su última
+    línea no vacía, y las líneas movidas se agregan con una sola escritura al
+    compactar el journal. Mover a un archivo enorme cuesta lo mismo que a uno vacío.
+
+    Expone lo que necesitan move_lines y VoidJournal de un VoidDocument.
+    """
+
+    TAIL_BLOCK = 4096
+    unlink_pending = False
+
+    def __init__(self, path, journal=None):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.journal = journal
+        self.newline = '\n'
+        self.ends_with_newline = True
+        self.fingerprint = None
+        self.last_line = None
+        self.pending = []     # Líneas agregadas que todavía no están en el .txt
+        self._inflight = []   # Líneas que el compactador está escribiendo
+        self.load()
+
+    def _lock(self):
+        return self.journal.lock if self.journal else nullcontext()
+
+    def load(self):
+        """Crea el archivo si no existe y lee solo su final."""
+        if not os.path.exists(self.path):
+            with open(self.path, 'ab'):
+                pass
+        self.last_line = None
+        with open(self.path, 'rb') as f:
+            pos = f.seek(0, os.SEEK_END)
+            buf = b''
+            while pos > 0 and self.last_line is None:
+                step = min(self.TAIL_BLOCK, pos)
+                pos -= step
+                f.seek(pos)
+                buf = f.read(step) + buf
+                # La primera línea del buffer puede estar cortada (salvo al llegar al inicio)
+                parts = buf.split(b'\n')
+                for raw in reversed(parts if pos == 0 else parts[1:]):
+                    stripped = raw.decode('utf-8', errors='replace').strip()
+                    if stripped:
+                        self.last_line = stripped
+                        break
+        self.ends_with_newline = not buf or buf.endswith(b'\n')
+        self.newline = '\r\n' if b'\r\n' in buf else '\n'
+        self.fingerprint = file_fingerprint(self.path)
+
+    def refresh(self):
+        """Vuelve a leer el final solo si el archivo cambió por fuera."""
+        with self._lock():
+            if not fingerprint_matches(self.fingerprint, file_fingerprint(self.path)):
+                if self.journal:
+                    self.journal.discard(self)
+                self.pending = []
+                self.load()
+        return self
+
+    def last_nonblank_line(self):
+        return self.last_line
+
+    def _append(self, new_lines):
+        self.pending.extend(new_lines)
+        for l in reversed(new_lines):
+            if l.strip():
+                self.last_line = l.strip()
+                break
+
+    def append(self, new_lines):
+        new_lines = list(new_lines)
+        with self._lock():
+            self._append(new_lines)
+            if self.journal is None:
+                self._write_pending()
+                return
+            self.journal.log(self, {'op': 'append', 'lines': new_lines})
+
+    def _write_pending(self):
+        data = self.encode_lines(self.pending)
+        if not self.ends_with_newline:
+            data = self.newline.encode('utf-8') + data
+        with open(self.path, 'ab') as f:
+            f.write(data)
+        self.pending = []
+        self.ends_with_newline = True
+        self.fingerprint = file_fingerprint(self.path)
+
+    def encode_lines(self, lines):
+        return ''.join(l + self.newline for l in lines).encode('utf-8')
+
+    def take_checkpoint(self):
+        self._inflight, self.pending = self.pending, []
+        return True, self._inflight
+
+    def checkpoint_failed(self):
+        self.pending = self._inflight + self.pending
+        self._inflight = []
+
+    def discard_pending(self):
+        self.pending = []
+
+
+class _NavigablePositions:
+    """Índices navegables de un MappedLines como secuencia (sirve para bisect), sin armar la lista."""
+
+    __slots__ = ('lines',)
+
+    def __init__(self, lines):
+        self.lines = lines
+
+    def __len__(self):
+        return self.lines.navigable_count()
+
+    def __getitem__(self, k):
+        if k < 0:
+            k += len(self)
+        if not 0 <= k < len(self):
+            raise IndexError("navigable index out of range")
+        return self.lines.navigable_position(k)
+
+
+class MappedDocument:
+    """
+    Documento de un archivo de MAPPED_MIN_BYTES o más. No se carga en un
+    LineRope: sus líneas son un MappedLines (mmap + índice de NumPy + tabla
+    de piezas), el MISMO objeto que muestra el ring de F2/F3. Así el archivo
+    tiene un solo escritor: lo que se edita desde F1 va a la misma tabla de
+    piezas que las ediciones de F2 y se vuelca con el mismo guardado, nunca
+    por el journal. Los índices son los del ring (solo líneas no vacías).
+
+    lines espera al indexado completo (F1 usa el final del archivo y la
+    vuelta de la navegación); mapped es lo indexado hasta ahora, para que el
+    ring muestre la primera pantalla al instante.
+
+    Expone lo que usan void_line, la navegación y move_lines de un VoidDocument.
+    """
+
+    journal = None
+    unlink_pending = False
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.mapped = MappedLines(path)
+        self.last_inserted_index = None
+
+    @property
+    def lines(self):
+        self.mapped.wait()
+        return self.mapped
+
+    @property
+    def version(self):
+        return self.mapped.version
+
+    def refresh(self):
+        """
+        Vuelve a mapear si el archivo cambió por fuera. Con ediciones sin
+        volcar (o un guardado en curso) no: lo editado se vuelca encima.
+        Las líneas anteriores no se cierran acá: el ring que las muestre las
+        suelta al sincronizarse (ver sync_mapped_ring).
+        """
+        if not self.mapped.dirty and file_fingerprint(self.path) != self.mapped.fp:
+            print(f"🔄 {self.name} cambió en disco, volviendo a mapearlo.")
+            self.mapped = MappedLines(self.path, self.mapped.on_progress)
+        return self
+
+    def last_nonblank_line(self):
+        lines = self.lines
+        return lines[-1] if lines else None
+
+    def navigable_indices(self):
+        """Índices navegables (los que no son '.'), respondidos por el índice de separadores."""
+        return _NavigablePositions(self.lines)
+
+    def ring_position(self, number):
+        """Posición en el ring de la línea number del archivo, desde el índice de números de línea."""
+        return self.mapped.file_line_position(number)
+
+    def splice(self, start, stop, new_lines):
+        """
+        Reemplaza lines[start:stop] por las líneas no vacías de new_lines y
+        pide el volcado (al saver de la app, o en el acto si no hay).
+        """
+        lines = self.lines
+        lines[start:stop] = [l.strip() for l in new_lines if l.strip()]
+        if _mapped_saver is not None:
+            _mapped_saver(lines)
+        else:
+            lines.save()
+
+    def insert(self, index, new_lines):
+        self.splice(index, index, new_lines)
+
+    def append(self, new_lines):
+        self.splice(len(self.lines), len(self.lines), new_lines)
+
+    def replace(self, index, new_lines):
+        self.splice(index, index + 1, new_lines)
+
+    def delete(self, start, stop=None):
+        self.splice(start, start + 1 if stop is None else stop, [])
+
+
+def move_lines(source, start, stop, replacement, target, moved_lines, remove_if_empty=False):
+    """
+    Mueve líneas entre dos documentos como una transacción: source[start:stop]
+    pasa a ser replacement y moved_lines se agregan al final de target (un
+    VoidDocument o un AppendTarget de open_target). Se registra como UNA
+    operación del journal con un solo fsync; tras un corte, el replay aplica
+    las dos mitades o ninguna.
+
+    Con remove_if_empty, si el origen queda sin líneas su archivo se elimina
+    dentro de la misma operación (el compactador lo borra). Devuelve True en
+    ese caso.
+    """
+    moved_lines = list(moved_lines)
+    replacement = list(replacement)
+    if source.journal is None or source.journal is not target.journal:
+        # Directorios distintos: cada archivo registra su parte por separado
+        target.append(moved_lines)
+        source.splice(start, stop, replacement)
+        if remove_if_empty and not source.lines:
+            os.remove(source.path)
+            forget_document(source.path)
+            return True
+        return False
+
+    with source._lock():
+        start, stop = source._apply(start, stop, replacement)
+        target._append(moved_lines)
+        record = {
+            'op': 'move', 'start': start, 'stop': stop,
+            'replacement': replacement, 'lines': moved_lines,
+        }
+        removed = remove_if_empty and not source.lines and source is not target
+        if removed:
+            record['unlink_source'] = True
+            source.unlink_pending = True
+            # Deja de ser residente; el journal lo conserva hasta borrar el archivo
+            _documents.pop(os.path.abspath(source.path), None)
+        source.journal.log_move(source, target, record)
+    return removed
+
+
+# --- Registro de documentos y journals ---
+
+# Documentos residentes en orden de uso (LRU); los que tienen cambios sin volcar no se desalojan
+MAX_RESIDENT_DOCUMENTS = 32
+_documents = OrderedDict()
+_targets = {}
+_journals = {}
+# Documentos mapeados (MappedDocument): no se desalojan, se sueltan al dejar de mostrarse
+_mapped = {}
+_mapped_saver = None
+
+
+def set_mapped_saver(schedule):
+    """
+    Quién vuelca las ediciones de los documentos mapeados: schedule(lines)
+    (la app lo manda a su guardado en segundo plano). Sin él, cada edición
+    se vuelca en el acto.
+    """
+    global _mapped_saver
+    _mapped_saver = schedule
+
+
+def _apply_record(doc, record, role):
+    op = record['op']
+    if op == 'insert':
+        doc._apply(record['index'], record['index'], record['lines'])
+    elif op == 'replace':
+        doc._apply(record['start'], record['stop'], record['lines'])
+    elif op == 'delete':
+        doc._apply(record['start'], record['stop'], [])
+    elif op == 'append' or (op == 'move' and role == 'target'):
+        doc._append(record['lines'])
+    elif op == 'move' and role == 'source':
+        doc._apply(record['start'], record['stop'], record['replacement'])
+
+
+def replay_journal(journal):
+    """
+    Reproduce el journal que quedó de una sesión interrumpida.
+    Para cada archivo se busca el ancla más reciente que coincide con el disco
+    y se aplican solo las operaciones posteriores.
+    """
+    records = journal.read_records()
+    by_file = {}
+    for record in records:
+        if record.get('op') == 'move':
+            by_file.setdefault(record['file'], []).append((record, 'source'))
+            by_file.setdefault(record['target'], []).append((record, 'target'))
+        elif 'file' in record:
+            by_file.setdefault(record['file'], []).append((record, 'file'))
+
+    for name, entries in by_file.items():
+        path = os.path.join(journal.void_dir, name)
+        disk_fp = file_fingerprint(path)
+
+        anchor_pos = None
+        for pos in range(len(entries) - 1, -1, -1):
+            record = entries[pos][0]
+            if record['op'] in ('base', 'checkpoint') and fingerprint_matches(record['fp'], disk_fp):
+                anchor_pos = pos
+                break
+        if anchor_pos is None:
+            print(f"⚠️ Journal: {name} cambió fuera de voider, no se reproducen sus operaciones.")
+            continue
+
+        anchor = entries[anchor_pos][0]
+        if anchor['op'] == 'checkpoint':
+            pending = [(r, role) for r, role in entries
+                       if r['op'] in EDIT_OPS and r['seq'] > anchor['upto']]
+        else:
+            pending = [(r, role) for r, role in entries[anchor_pos + 1:] if r['op'] in EDIT_OPS]
+        if not pending:
+            continue
+
+        doc = VoidDocument(path)
+        for record, role in pending:
+            _apply_record(doc, record, role)
+        last, role = pending[-1]
+        if role == 'source' and last.get('unlink_source') and not doc.lines:
+            # El movimiento había vaciado el origen: se completa su borrado
+            os.remove(path)
+        else:
+            doc.save()
+        print(f"♻️ Journal: {len(pending)} operaciones recuperadas en {name}")
+
+
+def open_journal(void_dir):
+    """Devuelve el journal del directorio; la primera vez reproduce lo pendiente de un corte."""
+    key = os.path.abspath(void_dir)
+    journal = _journals.get(key)
+    if journal is None:
+        journal = VoidJournal(void_dir)
+        replay_journal(journal)
+        journal.start()
+        _journals[key] = journal
+    return journal
+
+
+def _settled_journal(key):
+    """
+    Journal del directorio de key, con lo pendiente de ese archivo ya volcado
+    (líneas agregadas como destino, el borrado de un origen vaciado), para que
+    un objeto nuevo lea el archivo tal como quedó.
+    """
+    journal = open_journal(os.path.dirname(key))
+    pending = journal.pending_for(os.path.basename(key))
+    if pending is not None:
+        journal.checkpoint(pending)
+    return journal
+
+
+def open_document(path):
+    """
+    Devuelve el documento residente para path (creándolo o recargándolo si
+    hace falta). Un archivo de MAPPED_MIN_BYTES o más se abre como
+    MappedDocument; un documento conserva su tipo mientras sea residente.
+    """
+    key = os.path.abspath(path)
+    mapped = _mapped.get(key)
+    if mapped is not None:
+        return mapped.refresh()
+    doc = _documents.get(key)
+    if doc is None:
+        _targets.pop(key, None)
+        journal = _settled_journal(key)
+        fp = file_fingerprint(path)
+        if fp is not None and fp[1] >= MAPPED_MIN_BYTES:
+            doc = _mapped[key] = MappedDocument(path)
+            return doc
+        doc = VoidDocument(path, journal=journal)
+        _documents[key] = doc
+        _evict_documents()
+        return doc
+    _documents.move_to_end(key)
+    return doc.refresh()
+
+
+def _evict_documents():
+    excess = len(_documents) - MAX_RESIDENT_DOCUMENTS
+    for key, doc in list(_documents.items()):
+        if excess <= 0:
+            break
+        if doc.journal and doc.journal.is_dirty(doc):
+            continue
+        del _documents[key]
+        excess -= 1
+
+
+def open_target(path):
+    """
+    Devuelve dónde agregar líneas movidas a path: el documento residente si ya
+    está cargado, o un AppendTarget que solo conoce el final del archivo.
+    """
+    key = os.path.abspath(path)
+    doc = _mapped.get(key) or _documents.get(key)
+    if doc is not None:
+        return doc.refresh()
+    target = _targets.get(key)
+    if target is None:
+        target = AppendTarget(path, journal=_settled_journal(key))
+        _targets[key] = target
+        return target
+    return target.refresh()
+
+
+def forget_document(path):
+    """Descarta el documento residente (por ejemplo, cuando el archivo se elimina)."""
+    key = os.path.abspath(path)
+    for registry in (_documents, _targets):
+        doc = registry.pop(key, None)
+        if doc is not None and doc.journal:
+            doc.journal.discard(doc)
+    mapped = _mapped.pop(key, None)
+    if mapped is not None:
+        mapped.mapped.close()
+
+
+def close_mapped(lines):
+    """
+    Suelta unas líneas mapeadas (el ring dejó de mostrarlas): vuelca lo que
+    quede sin guardar y las cierra. Si eran las de un documento mapeado, el
+    documento deja de ser residente (se vuelve a mapear al abrirlo). Si el
+    volcado falla, las ediciones siguen en memoria y no se cierra nada.
+    """
+    if lines.dirty:
+        try:
+            lines.save()
+        except OSError as e:
+            print(f"❌ Error al volcar {os.path.basename(lines.path)}: {e}")
+            return False
+    key = os.path.abspath(lines.path)
+    doc = _mapped.get(key)
+    if doc is not None and doc.mapped is lines:
+        del _mapped[key]
+    lines.close()
+    return True
+
+
+def flush_documents():
+    """Vuelca a disco todo lo pendiente de todos los journals."""
+    for journal in list(_journals.values()):
+        journal.flush()
+
+
+def request_flush():
+    """
+    Pide a todos los journals que vuelquen lo pendiente en segundo plano y
+    devuelve sus Event (ver VoidJournal.request_flush), para que una consulta
+    que necesita los .txt al día los espere en su propio hilo.
+    """
+    return [journal.request_flush() for journal in list(_journals.values())]
+
+
+def close_documents():
+    """Vuelca lo pendiente y detiene los hilos de los journals (al salir)."""
+    for doc in list(_mapped.values()):
+        close_mapped(doc.mapped)
+    _mapped.clear()
+    for journal in list(_journals.values()):
+        journal.close()
+    _journals.clear()
+    _documents.clear()
+    _targets.clear()
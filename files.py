@@ -5,12 +5,17 @@ import re
 import datetime
 import sys
 
+from document import open_document, open_target, open_journal, move_lines, request_flush, is_separator
+
 def setup_file_handling(app):
     """Initializes file handling for the active file and ensures void_dir exists."""
     # Ensure void_dir exists
     if not os.path.exists(app.void_dir):
         os.makedirs(app.void_dir)
     
+    # Replay the operation journal left by an interrupted session (before touching any file)
+    open_journal(app.void_dir)
+    
     # Ensure the active file (current_file_path) exists
     if not os.path.exists(app.current_file_path):
         with open(app.current_file_path, 'w', encoding='utf-8') as f:
@@ -26,7 +31,6 @@ def setup_file_handling(app):
     # Initialize navigation state
     app.current_active_line = None
     app.current_active_line_index = None
-    app.last_inserted_index = None
     print(f"File handling initialized. Active file: {app.current_file_path}")
 
 def void_line(app, event=None):
@@ -42,31 +46,20 @@ def void_line(app, event=None):
             app.current_active_line = None
             
             # --- MODIFICACIÓN AQUÍ: Mover al final del archivo si la entrada está vacía ---
-            lines_in_file = []
-            if os.path.exists(app.current_file_path):
-                with open(app.current_file_path, 'r', encoding='utf-8') as f:
-                    lines_in_file = f.readlines()
+            doc = open_document(app.current_file_path)
             
             # Establecer last_inserted_index al índice de la última línea (o -1 si está vacío)
             # Esto asegura que la próxima inserción se haga al final del archivo.
-            app.last_inserted_index = len(lines_in_file) - 1 
+            doc.last_inserted_index = len(doc.lines) - 1 
 
-            print(f"Input vacío: Reiniciando índice de línea activa y estableciendo last_inserted_index a {app.last_inserted_index} (final del archivo).")
+            print(f"Input vacío: Reiniciando índice de línea activa y estableciendo last_inserted_index a {doc.last_inserted_index} (final del archivo).")
             return # No hacer nada más si la línea está vacía
         # --- FIN MODIFICACIÓN ---
 
         # --- Nuevo: Verificar si se intenta añadir un punto consecutivo ---
-        last_line_in_file = None
-        if os.path.exists(app.current_file_path):
-            with open(app.current_file_path, 'r', encoding='utf-8') as f:
-                # Leer líneas en reversa para encontrar la última línea no vacía eficientemente
-                # y evitar cargar todo el archivo en memoria si es muy grande.
-                lines = f.readlines()
-                for l in reversed(lines):
-                    stripped_l = l.strip()
-                    if stripped_l: # Encontrar la última línea que no esté vacía
-                        last_line_in_file = stripped_l
-                        break
+        # El documento residente ya tiene las líneas en memoria: no se relee el archivo.
+        doc = open_document(app.current_file_path)
+        last_line_in_file = doc.last_nonblank_line()
 
         # Si la entrada es un solo punto y la última línea en el archivo también es un solo punto,
         # entonces no se procesa esta entrada.
@@ -74,9 +67,24 @@ def void_line(app, event=None):
             print("Se evitó añadir puntos únicos consecutivos.")
             app.current_active_line_index = None
             app.current_active_line = None
-            app.last_inserted_index = None
+            doc.last_inserted_index = None
             return # No procesar esta entrada
 
+        # --- 0. Búsqueda en todo el corpus (?término) ---
+        if line.startswith("?"):
+            query = line[1:].strip()
+            app.current_active_line = None
+            app.current_active_line_index = None
+            doc.last_inserted_index = None
+            if not query:
+                print("Búsqueda vacía. Escribe ?término")
+                return
+            # Lo editado en esta sesión tiene que estar en los .txt para encontrarse: el
+            # compactador lo vuelca en su hilo y la búsqueda (en el de app.search_finder)
+            # lo espera; los resultados llegan a show_search_command_results
+            app.search_finder.submit(query, ready=request_flush())
+            return # Finalizar procesamiento de esta línea
+
         # --- 1. Manejo de comandos de cambio de archivo (//) ---
         if line.startswith("//"):
             target_filename = line[2:].strip()
@@ -108,7 +116,7 @@ def void_line(app, event=None):
                 # Resetear el estado de navegación para el nuevo archivo
                 app.current_active_line = None
                 app.current_active_line_index = None
-                app.last_inserted_index = None
+                # El cursor de inserción es de cada documento: el nuevo archivo sigue donde quedó el suyo
             else:
                 print(f"Ya estás en el archivo: {os.path.basename(app.current_file_path)}")
             return # Finalizar procesamiento de esta línea
@@ -130,44 +138,29 @@ def void_line(app, event=None):
                 target_filename += ".txt"
             target_file_path = os.path.join(app.void_dir, target_filename)
 
-            # Asegurar que el archivo de destino exista
-            if not os.path.exists(target_file_path):
-                with open(target_file_path, 'w', encoding='utf-8') as f:
-                    f.write('')
-            
-            # Mover el contenido al archivo de destino
-            with open(target_file_path, 'a', encoding='utf-8') as target_f:
-                target_f.write(content_to_move + '\n')
+            # Mover el contenido al final del destino (sin leerlo: open_target crea el archivo
+            # si falta y solo mira su final) y, si fue una edición/reemplazo, eliminar la
+            # línea original del archivo de origen: UNA operación del journal. Si el origen
+            # queda vacío (y no es 0.txt), su borrado va en la misma transacción.
+            target_doc = open_target(target_file_path)
+            source_removed = False
+            if app.current_active_line_index is not None and app.current_active_line_index < len(doc.lines):
+                source_removed = move_lines(doc, app.current_active_line_index, app.current_active_line_index + 1, [],
+                                            target_doc, [content_to_move],
+                                            remove_if_empty=app.current_file_path != app.void_file_path)
+            else:
+                target_doc.append([content_to_move])
             print(f"Línea '{content_to_move}' movida a {os.path.basename(target_file_path)}")
 
-            # Ahora, eliminar la línea del archivo de origen si fue una edición/reemplazo
-            if app.current_active_line_index is not None:
-                all_file_lines = []
-                if os.path.exists(app.current_file_path):
-                    with open(app.current_file_path, 'r', encoding='utf-8') as f:
-                        all_file_lines = f.readlines()
-                
-                # Eliminar la línea original que contenía el comando
-                if app.current_active_line_index < len(all_file_lines):
-                    del all_file_lines[app.current_active_line_index]
-                
-                # Reescribir el archivo de origen
-                with open(app.current_file_path, 'w', encoding='utf-8') as current_f:
-                    current_f.writelines(all_file_lines)
-                    current_f.flush()
-                    os.fsync(current_f.fileno())
-                
-                # Si el archivo de origen queda vacío después de eliminar la línea (y no es 0.txt), eliminarlo
-                if not all_file_lines and app.current_file_path != app.void_file_path:
-                    os.remove(app.current_file_path)
-                    print(f"Archivo {os.path.basename(app.current_file_path)} vacío y eliminado.")
-                    app.current_file_path = app.void_file_path # Volver a 0.txt
-                    app.current_file_index = app.txt_files.index(app.current_file_path)
-                    print(f"Regresando al archivo: {os.path.basename(app.current_file_path)}")
+            if source_removed:
+                print(f"Archivo {os.path.basename(app.current_file_path)} vacío y eliminado.")
+                app.current_file_path = app.void_file_path # Volver a 0.txt
+                app.current_file_index = app.txt_files.index(app.current_file_path)
+                print(f"Regresando al archivo: {os.path.basename(app.current_file_path)}")
 
             app.current_active_line = None
             app.current_active_line_index = None
-            app.last_inserted_index = None
+            doc.last_inserted_index = None
             return # Finalizar procesamiento de esta línea
 
         # --- 3. Manejo de "Mover Bloque Completo" (Ej: "/nombre_archivo" en una línea sola) ---
@@ -182,22 +175,18 @@ def void_line(app, event=None):
                 target_filename += ".txt"
             target_file_path = os.path.join(app.void_dir, target_filename)
 
-            all_file_lines = []
-            if os.path.exists(app.current_file_path):
-                with open(app.current_file_path, 'r', encoding='utf-8') as f:
-                    all_file_lines = f.readlines()
+            all_file_lines = doc.lines
             
             # Determinar el índice donde el comando fue/será insertado
             command_insert_index = len(all_file_lines) # Por defecto, al final
             if app.current_active_line_index is not None:
                 command_insert_index = app.current_active_line_index
             
-            # Encontrar el inicio del bloque a mover (último punto antes de command_insert_index)
-            block_start_index = 0
-            for i in range(command_insert_index - 1, -1, -1):
-                if all_file_lines[i].strip() == '.':
-                    block_start_index = i
-                    break
+            # Encontrar el inicio del bloque a mover (último punto antes de command_insert_index),
+            # consultando el índice de separadores del documento en vez de recorrer hacia atrás
+            block_start_index = all_file_lines.prev_separator(command_insert_index)
+            if block_start_index is None:
+                block_start_index = 0
             
             # Extraer el bloque a mover
             block_to_move = all_file_lines[block_start_index : command_insert_index]
@@ -207,40 +196,28 @@ def void_line(app, event=None):
                 print(f"No se encontró un bloque para mover con el comando '{line}'. No se realizó ninguna acción en el archivo.")
                 app.current_active_line = None
                 app.current_active_line_index = None
-                app.last_inserted_index = None
+                doc.last_inserted_index = None
                 return # Simplemente retornar, sin modificar el archivo de origen.
 
-            # Asegurar que el archivo de destino exista
-            if not os.path.exists(target_file_path):
-                with open(target_file_path, 'w', encoding='utf-8') as f:
-                    f.write('')
-            
             # >>> NUEVA LÓGICA: Añadir punto al inicio del bloque en el archivo de destino <<<
-            with open(target_file_path, 'r+', encoding='utf-8') as target_f: # Abrir para leer y escribir
-                target_content = target_f.read()
-                # Si el archivo está vacío o no termina con un punto, añadir un punto antes del bloque
-                if not target_content.strip() or target_content.strip().endswith('.'):
-                    # Si termina con un punto, o está vacío, añadir el bloque directamente
-                    # (el punto inicial del bloque se añadirá al escribir)
-                    pass 
-                else: # Si termina sin punto, pero no está vacío, asegurar que haya un punto antes de añadir el nuevo bloque
-                    target_f.write('.\n') # Añadir un punto para separar el bloque anterior del nuevo
-
-                # Mover el puntero al final del archivo para añadir el nuevo contenido
-                target_f.seek(0, os.SEEK_END)
-                
-                # El bloque debe empezar con un punto en el destino
-                final_block_to_write = []
-                if not block_to_move[0].strip() == '.': # Si el bloque no empieza ya con un punto, añadir uno
-                    final_block_to_write.append('.\n')
-                final_block_to_write.extend(block_to_move)
+            # Solo se consulta la última línea no vacía del destino (leída desde el final y cacheada)
+            target_doc = open_target(target_file_path)
+            target_last_line = target_doc.last_nonblank_line()
+            final_block_to_write = []
+            # Si el archivo está vacío o termina con un punto, añadir el bloque directamente.
+            # Si termina sin punto, pero no está vacío, separar el bloque anterior del nuevo.
+            if target_last_line is not None and not target_last_line.endswith('.'):
+                final_block_to_write.append('.')
 
-                target_f.writelines(final_block_to_write)
+            # El bloque debe empezar con un punto en el destino
+            if not is_separator(block_to_move[0]): # Si el bloque no empieza ya con un punto, añadir uno
+                final_block_to_write.append('.')
+            final_block_to_write.extend(block_to_move)
             
-            # --- CORRECCIÓN: El comando NO se incluye en new_source_lines aquí. ---
-            # Construir las nuevas líneas del archivo de origen:
-            # Líneas antes del bloque + líneas después de la línea del comando (excluyendo el comando)
-            new_source_lines = all_file_lines[:block_start_index] + all_file_lines[command_insert_index + 1:]
+            # --- CORRECCIÓN: El comando NO se incluye en el archivo de origen. ---
+            # Se quitan del origen las líneas del bloque y la línea del comando (si existía);
+            # lo anterior al bloque y lo posterior al comando queda igual.
+            source_replacement = []
 
             # >>> NUEVA LÓGICA: Reinsertar punto en el archivo de origen si es necesario <<<
             # Esto ocurre si había contenido antes Y después del bloque extraído,
@@ -253,21 +230,20 @@ def void_line(app, event=None):
                 
                 # Si la línea justo ANTES de la brecha no era un punto
                 # Y hay contenido ANTES y DESPUÉS de la brecha.
-                if all_file_lines[block_start_index - 1].strip() != '.':
+                if not is_separator(all_file_lines[block_start_index - 1]):
                     # Insertar un punto en la posición donde solía comenzar el bloque movido
-                    new_source_lines.insert(block_start_index, '.\n')
+                    source_replacement.append('.')
 
-            # Reescribir el archivo de origen
-            with open(app.current_file_path, 'w', encoding='utf-8') as current_f:
-                current_f.writelines(new_source_lines)
-                current_f.flush()
-                os.fsync(current_f.fileno())
+            # Quitar el bloque del origen y agregarlo al destino: UNA operación del journal.
+            # Si el origen queda completamente vacío (incluyendo la ausencia del comando), y no es 0.txt,
+            # se elimina en la misma transacción.
+            source_removed = move_lines(doc, block_start_index, command_insert_index + 1, source_replacement,
+                                        target_doc, final_block_to_write,
+                                        remove_if_empty=app.current_file_path != app.void_file_path)
 
             print(f"Bloque movido de {os.path.basename(app.current_file_path)} a {os.path.basename(target_file_path)}")
             
-            # Si el archivo de origen queda completamente vacío (incluyendo la ausencia del comando), y no es 0.txt, eliminarlo.
-            if not new_source_lines and app.current_file_path != app.void_file_path:
-                os.remove(app.current_file_path)
+            if source_removed:
                 print(f"Archivo {os.path.basename(app.current_file_path)} vacío y eliminado.")
                 app.current_file_path = app.void_file_path # Volver a 0.txt
                 app.current_file_index = app.txt_files.index(app.current_file_path)
@@ -275,7 +251,7 @@ def void_line(app, event=None):
 
             app.current_active_line = None
             app.current_active_line_index = None
-            app.last_inserted_index = None
+            doc.last_inserted_index = None
             return # Finalizar procesamiento de esta línea
 
         # --- 4. Manejo de texto normal (si no es un comando) ---
@@ -297,47 +273,50 @@ def void_line(app, event=None):
                 formatted_lines.append(s) 
         formatted_text = '\n'.join(formatted_lines)
 
-        # Leer líneas del archivo activo
-        with open(app.current_file_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines() 
+        # Líneas del archivo activo (documento residente, sin releer el archivo)
+        lines = doc.lines
 
         if hasattr(app, 'current_active_line_index') and app.current_active_line_index is not None:
             # Si estamos editando una línea existente (navegación previa/siguiente)
             if app.current_active_line_index < len(lines): 
-                lines[app.current_active_line_index] = formatted_text + '\n'
-                app.last_inserted_index = app.current_active_line_index
+                doc.replace(app.current_active_line_index, formatted_lines)
+                doc.last_inserted_index = app.current_active_line_index
                 app.current_active_line = formatted_text
                 app.current_active_line_index = None  # Reset to allow appending next time
             else:
                 # Si el índice está fuera de rango, añadir como nueva línea
                 insert_index = len(lines)
-                lines.append(formatted_text + '\n')
-                app.last_inserted_index = insert_index
+                doc.insert(insert_index, formatted_lines)
+                doc.last_inserted_index = insert_index
                 app.current_active_line = formatted_text
                 app.current_active_line_index = None
         else:
             # Si estamos añadiendo una nueva línea
-            insert_index = (app.last_inserted_index + 1) if hasattr(app, 'last_inserted_index') and app.last_inserted_index is not None else len(lines)
+            insert_index = (doc.last_inserted_index + 1) if doc.last_inserted_index is not None else len(lines)
             
             # Asegurarse de que el índice de inserción no exceda el número de líneas existentes + 1
             if insert_index > len(lines):
                 insert_index = len(lines)
 
-            lines[insert_index:insert_index] = [line_to_add + '\n' for line_to_add in formatted_lines]
-            app.last_inserted_index = insert_index + len(formatted_lines) - 1 
+            doc.insert(insert_index, formatted_lines)
+            doc.last_inserted_index = insert_index + len(formatted_lines) - 1 
             app.current_active_line = formatted_text
             app.current_active_line_index = None  # Reset to allow appending next time
 
-        # Escribir todas las líneas de vuelta al archivo activo
-        with open(app.current_file_path, 'w', encoding='utf-8') as f:
-            f.writelines(lines)
-            f.flush()
-            os.fsync(f.fileno())
-        
+        # El documento registró el cambio en el journal; el compactador lo vuelca al .txt
         print(f"Líneas insertadas/modificadas en {os.path.basename(app.current_file_path)}.") 
         app.first_up_after_submission = True  # Enable special navigation for first Up press
 
     except Exception as e:
         print(f"Error en void_line: {e}") 
         app.entry.clear()
-        app.entry.setFocus()
\ No newline at end of file
+        app.entry.setFocus()
+
+
+def show_search_command_results(app, generation, query, results):
+    """Resultados de ?término (en el hilo de la interfaz); los de una búsqueda vieja se descartan."""
+    if generation != app.search_finder.generation:
+        return
+    print(f"🔎 '{query}': {len(results)} resultados")
+    if results:
+        app.show_search_results(query, results)
@@ -0,0 +1,299 @@
+# fuzzy_index.py - Búsqueda aproximada por trigramas (tolera errores de tipeo) en el corpus void
+import os
+import re
+import threading
+
+import numpy as np
+
+from journal import file_fingerprint
+from search_index import fold
+
+MAX_MATCHES = 8
+MIN_SIMILARITY = 0.4   # Fracción mínima de los trigramas de la consulta que tiene que tener la línea
+MIN_QUERY_CHARS = 3
+
+_NON_WORD_RE = re.compile(r'[^\w\n]+')
+
+
+def normalize(text):
+    """Sin tildes, en minúsculas y con la puntuación colapsada a un espacio (preserva los saltos de línea)."""
+    return _NON_WORD_RE.sub(' ', fold(text))
+
+
+def _codepoints(text):
+    return np.frombuffer(text.encode('utf-32-le'), dtype='<u4').astype(np.uint64)
+
+
+def _encode(codes):
+    """Trigrama (a, b, c) -> un entero de 63 bits (21 bits por carácter Unicode): sin colisiones."""
+    return (codes[:-2] << np.uint64(42)) | (codes[1:-1] << np.uint64(21)) | codes[2:]
+
+
+def query_trigrams(text):
+    """
+    Trigramas únicos de una consulta. La consulta es un fragmento (se está
+    tipeando): se marca el comienzo de la primera palabra pero no el final.
+    """
+    text = ' '.join(normalize(text).split())
+    if len(text) < MIN_QUERY_CHARS:
+        return np.zeros(0, dtype=np.uint64)
+    return np.unique(_encode(_codepoints(' ' + text)))
+
+
+class _FileTrigrams:
+    """
+    Trigramas de un archivo en forma compacta: pares (trigrama, línea) ordenados
+    por trigrama en dos arreglos de NumPy, más la cantidad de trigramas
+    distintos de cada línea y su número de línea y offset en bytes.
+    """
+
+    __slots__ = ('fp', 'trigrams', 'lines', 'sizes', 'numbers', 'offsets')
+
+    def __init__(self, path):
+        self.fp = file_fingerprint(path)
+        with open(path, 'rb') as f:
+            data = f.read()
+        normalized = normalize(data.decode('utf-8', errors='replace')).split('\n')
+
+        numbers, offsets, padded = [], [], []
+        pos = 0
+        for number, raw in enumerate(data.split(b'\n')):
+            stripped = raw.strip()
+            text = ' '.join(normalized[number].split())
+            if stripped and stripped != b'.' and text:
+                numbers.append(number)
+                offsets.append(pos)
+                padded.append(' ' + text + ' ')
+            pos += len(raw) + 1
+        self.numbers = np.array(numbers, dtype=np.uint32)
+        self.offsets = np.array(offsets, dtype=np.uint64)
+
+        if not padded:
+            self.trigrams = np.zeros(0, dtype=np.uint64)
+            self.lines = np.zeros(0, dtype=np.uint32)
+            self.sizes = np.zeros(0, dtype=np.uint32)
+            return
+
+        # Todas las líneas en un solo arreglo de code points: los trigramas se
+        # calculan de una vez y se descartan los que cruzan de una línea a otra
+        lengths = np.array([len(p) for p in padded], dtype=np.int64)
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        trigrams = _encode(_codepoints(''.join(padded)))
+        owner = np.repeat(np.arange(len(padded), dtype=np.uint32), lengths)[:len(trigrams)]
+        inside = np.arange(len(trigrams)) - starts[owner] <= lengths[owner] - 3
+        trigrams, owner = trigrams[inside], owner[inside]
+
+        # Ordenar por (trigrama, línea) y quedarse con los pares distintos
+        order = np.lexsort((owner, trigrams))
+        trigrams, owner = trigrams[order], owner[order]
+        distinct = np.ones(len(trigrams), dtype=bool)
+        distinct[1:] = (trigrams[1:] != trigrams[:-1]) | (owner[1:] != owner[:-1])
+        self.trigrams = trigrams[distinct]
+        self.lines = owner[distinct]
+        self.sizes = np.bincount(self.lines, minlength=len(padded)).astype(np.uint32)
+
+    def score(self, query):
+        """
+        (líneas, similitud, jaccard) de las líneas que comparten trigramas con la
+        consulta. Similitud = fracción de los trigramas de la consulta presentes.
+        """
+        lo = np.searchsorted(self.trigrams, query, side='left')
+        hi = np.searchsorted(self.trigrams, query, side='right')
+        hits = [self.lines[a:b] for a, b in zip(lo, hi) if b > a]
+        if not hits:
+            return None
+        counts = np.bincount(np.concatenate(hits), minlength=len(self.sizes))
+        candidates = np.flatnonzero(counts)
+        shared = counts[candidates].astype(np.float64)
+        similarity = shared / len(query)
+        jaccard = shared / (len(query) + self.sizes[candidates] - shared)
+        return candidates, similarity, jaccard
+
+
+class FuzzyIndex:
+    """
+    Índice de trigramas de cada línea válida de todos los .txt de void_dir,
+    para encontrar una frase recordada a medias o mal escrita. Se mantiene por
+    archivo como SearchIndex: solo se recalculan los archivos que cambiaron.
+    El primer armado corre en un hilo de fondo.
+    """
+
+    def __init__(self, void_dir):
+        self.void_dir = void_dir
+        self.files = {}          # ruta relativa -> _FileTrigrams
+        self.watched = False
+        self._pending = set()
+        self._pending_lock = threading.Lock()  # Solo cuida _pending: el hilo de la interfaz nunca toma _lock
+        self._dir_fp = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._build, name="void-fuzzy-index", daemon=True).start()
+        return self
+
+    def _build(self):
+        try:
+            with self._lock:
+                self._refresh_all()
+            pairs = sum(len(entry.trigrams) for entry in self.files.values())
+            print(f"🧩 Índice de trigramas: {len(self.files)} archivos, {pairs} pares")
+        except Exception as e:
+            print(f"❌ Error armando el índice de trigramas: {e}")
+        finally:
+            self._ready.set()
+
+    def _refresh_all(self):
+        self._dir_fp = file_fingerprint(self.void_dir)
+        current = set()
+        for root, dirs, names in os.walk(self.void_dir):
+            for name in names:
+                if name.lower().endswith('.txt') and not name.startswith('.'):
+                    current.add(os.path.relpath(os.path.join(root, name), self.void_dir))
+        for rel in set(self.files) - current:
+            del self.files[rel]
+        for rel in current:
+            self._refresh_file(rel)
+
+    def _refresh_file(self, rel):
+        entry = self.files.get(rel)
+        path = os.path.join(self.void_dir, rel)
+        fp = file_fingerprint(path)
+        if fp is None:
+            self.files.pop(rel, None)
+        elif entry is None or entry.fp != fp:
+            try:
+                self.files[rel] = _FileTrigrams(path)
+            except OSError:
+                self.files.pop(rel, None)
+
+    def note_change(self, path):
+        """Evento del watcher: path se creó, cambió o se borró."""
+        self.watched = True
+        rel = os.path.relpath(path, self.void_dir)
+        if rel.lower().endswith('.txt'):
+            with self._pending_lock:
+                self._pending.add(rel)
+
+    def _sync(self):
+        if not self.watched and file_fingerprint(self.void_dir) != self._dir_fp:
+            self._refresh_all()
+            return
+        with self._pending_lock:
+            pending, self._pending = self._pending, set()
+        for rel in pending | set(self.files):
+            self._refresh_file(rel)
+
+    def match(self, text, limit=MAX_MATCHES):
+        """
+        Líneas más parecidas a text, de mayor a menor similitud.
+        Devuelve [(ruta relativa, número de línea, texto)].
+        """
+        query = query_trigrams(text)
+        if not len(query):
+            return []
+        self._ready.wait()
+        with self._lock:
+            self._sync()
+            rels, lines, similarity, jaccard = [], [], [], []
+            for rel in sorted(self.files):
+                scored = self.files[rel].score(query)
+                if scored is None:
+                    continue
+                candidates, sim, jac = scored
+                keep = sim >= MIN_SIMILARITY
+                rels.extend([rel] * int(keep.sum()))
+                lines.append(candidates[keep])
+                similarity.append(sim[keep])
+                jaccard.append(jac[keep])
+            if not rels:
+                return []
+            lines = np.concatenate(lines)
+            similarity, jaccard = np.concatenate(similarity), np.concatenate(jaccard)
+            # Primero la fracción de la consulta encontrada; a igualdad, la línea más corta
+            best = np.lexsort((-jaccard, -similarity))[:limit]
+            return self._read_lines([(rels[k], int(lines[k])) for k in best])
+
+    def _read_lines(self, hits):
+        """Texto de cada resultado: un seek por línea."""
+        results = []
+        for rel, line in hits:
+            entry = self.files[rel]
+            with open(os.path.join(self.void_dir, rel), 'rb') as f:
+                f.seek(int(entry.offsets[line]))
+                text = f.readline().decode('utf-8', errors='replace').strip()
+            results.append((rel, int(entry.numbers[line]), text))
+        return results
+
+
+class FuzzyFinder:
+    """
+    Búsqueda mientras se escribe: submit(texto) encola la consulta y devuelve
+    su generación. Un hilo de fondo atiende siempre la más reciente (las que
+    quedaron viejas mientras se tipeaba se descartan sin ejecutarse) y entrega
+    callback(generación, texto, resultados). Quien recibe compara la
+    generación con la actual para ignorar respuestas que llegan tarde.
+    """
+
+    def __init__(self, index, callback):
+        self.index = index
+        self.callback = callback
+        self.generation = 0
+        self._query = None
+        self._wake = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="void-fuzzy-finder", daemon=True)
+        self._thread.start()
+
+    def submit(self, text):
+        with self._wake:
+            self.generation += 1
+            self._query = (self.generation, text)
+            self._wake.notify()
+            return self.generation
+
+    def cancel(self):
+        """Invalida la consulta en curso (el texto ya no es el que se tipeó)."""
+        with self._wake:
+            self.generation += 1
+            self._query = None
+
+    def stop(self):
+        with self._wake:
+            self._stopped = True
+            self._query = None
+            self._wake.notify()
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout=2.0)
+
+    def _run(self):
+        while True:
+            with self._wake:
+                while self._query is None and not self._stopped:
+                    self._wake.wait()
+                if self._stopped:
+                    return
+                generation, text = self._query
+                self._query = None
+            try:
+                results = self.index.match(text)
+            except Exception as e:
+                print(f"❌ Error en la búsqueda aproximada: {e}")
+                continue
+            if generation == self.generation:
+                self.callback(generation, text, results)
+
+
+# --- Registro de índices por directorio ---
+
+_indexes = {}
+
+
+def open_fuzzy_index(void_dir):
+    """Devuelve el índice de trigramas del directorio; la primera vez lo arma en segundo plano."""
+    key = os.path.abspath(void_dir)
+    index = _indexes.get(key)
+    if index is None:
+        index = FuzzyIndex(void_dir).start()
+        _indexes[key] = index
+    return index
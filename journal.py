@@ -0,0 +1,318 @@
+# journal.py - Journal de operaciones (write-ahead log) por directorio void
+import json
+import os
+import threading
+import time
+
+JOURNAL_NAME = '.void_journal'
+
+# Operaciones que modifican líneas (las demás son anclas: 'base' y 'checkpoint')
+EDIT_OPS = ('insert', 'replace', 'delete', 'append', 'move')
+
+
+class VoidJournal:
+    """
+    Journal append-only con las ediciones de los archivos de un directorio void.
+
+    Cada operación (insert, replace, delete, append, move) se agrega como una línea JSON y
+    se entrega al sistema operativo en el acto. El fsync se agrupa: se hace como
+    mucho cada commit_interval_ms o apenas se acumulan commit_ops operaciones.
+
+    Un hilo compactador vuelca los documentos modificados a sus .txt después de
+    compact_delay segundos sin ediciones y luego vacía el journal. Las anclas
+    'base' y 'checkpoint' guardan el (mtime_ns, size) del .txt para saber, al
+    reproducir el journal tras un corte, qué operaciones ya están en cada archivo.
+    """
+
+    def __init__(self, void_dir, commit_interval_ms=100, commit_ops=16, compact_delay=2.0):
+        self.void_dir = void_dir
+        self.path = os.path.join(void_dir, JOURNAL_NAME)
+        self.commit_interval = commit_interval_ms / 1000
+        self.commit_ops = commit_ops
+        self.compact_delay = compact_delay
+
+        self.lock = threading.RLock()
+        self._wakeup = threading.Condition(self.lock)
+        self.seq = 0
+        self._uncommitted = 0
+        self._last_edit_time = 0.0
+        self._dirty = {}        # nombre de archivo -> documento con cambios sin volcar
+        self._anchored = set()  # archivos que ya tienen ancla en el journal actual
+        self._file = None
+        self._thread = None
+        self._closed = False
+        self._flush_waiters = []  # Eventos de request_flush que el hilo marca al terminar de volcar
+
+    # --- Lectura / arranque ---
+
+    def read_records(self):
+        """Lee los registros del journal. Una última línea cortada (crash) se ignora."""
+        records = []
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, 'rb') as f:
+            for raw in f:
+                try:
+                    records.append(json.loads(raw.decode('utf-8')))
+                except (ValueError, UnicodeDecodeError):
+                    print(f"⚠️ Registro del journal incompleto, se ignora el resto.")
+                    break
+        if records:
+            self.seq = max(self.seq, max(r.get('seq', 0) for r in records))
+        return records
+
+    def start(self):
+        """Abre el journal (vacío) y arranca el hilo de commit/compactación."""
+        with self.lock:
+            self._file = open(self.path, 'wb')
+            self._fsync_dir()
+        self._thread = threading.Thread(target=self._run, name="void-journal", daemon=True)
+        self._thread.start()
+
+    # --- Escritura ---
+
+    def _append(self, record):
+        self.seq += 1
+        record['seq'] = self.seq
+        self._file.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n')
+        self._file.flush()
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_ops:
+            self._wakeup.notify()
+
+    def _anchor(self, doc):
+        if doc.name not in self._anchored:
+            self._append({'op': 'base', 'file': doc.name, 'fp': doc.fingerprint})
+            self._anchored.add(doc.name)
+
+    def log(self, doc, record):
+        """Registra una edición sobre doc (el documento ya la aplicó en memoria)."""
+        with self.lock:
+            self._anchor(doc)
+            record['file'] = doc.name
+            self._append(record)
+            self._mark_dirty(doc)
+
+    def log_move(self, source, target, record):
+        """
+        Registra un movimiento entre dos documentos como UNA sola operación y la
+        hace durable en el acto: un único fsync cubre origen y destino (y el
+        borrado del origen si quedó vacío). Los .txt se actualizan al compactar.
+        """
+        with self.lock:
+            self._anchor(source)
+            self._anchor(target)
+            record['file'] = source.name
+            record['target'] = target.name
+            self._append(record)
+            self._mark_dirty(source)
+            self._mark_dirty(target)
+            self.commit()
+
+    def _mark_dirty(self, doc):
+        self._dirty[doc.name] = doc
+        self._last_edit_time = time.monotonic()
+
+    def discard(self, doc):
+        """Olvida los cambios pendientes de doc (archivo eliminado o recargado desde disco)."""
+        with self.lock:
+            if self._dirty.get(doc.name) is doc:
+                del self._dirty[doc.name]
+            # La próxima edición necesita un ancla nueva con el estado actual del disco
+            self._anchored.discard(doc.name)
+
+    def is_dirty(self, doc):
+        with self.lock:
+            return self._dirty.get(doc.name) is doc
+
+    def pending_for(self, name):
+        """Documento con cambios sin volcar para ese nombre de archivo, o None."""
+        with self.lock:
+            return self._dirty.get(name)
+
+    def commit(self):
+        """Hace durable todo lo escrito hasta ahora (un solo fsync para el grupo)."""
+        with self.lock:
+            if self._uncommitted and self._file:
+                os.fsync(self._file.fileno())
+                self._uncommitted = 0
+
+    # --- Compactación ---
+
+    def compact(self):
+        """Vuelca los documentos modificados a sus .txt y vacía el journal si quedó todo al día."""
+        with self.lock:
+            docs = list(self._dirty.values())
+        for doc in docs:
+            try:
+                self._checkpoint(doc)
+            except Exception as e:
+                print(f"❌ Error compactando {doc.name}: {e}")
+                with self.lock:
+                    # Reintentar más tarde (el documento decide cómo: p. ej. reescritura completa)
+                    doc.checkpoint_failed()
+                    self._dirty.setdefault(doc.name, doc)
+        with self.lock:
+            if not self._dirty and self._file and self._file.tell() > 0:
+                self._file.seek(0)
+                self._file.truncate()
+                os.fsync(self._file.fileno())
+                self._uncommitted = 0
+                self._anchored.clear()
+
+    def checkpoint(self, doc):
+        """Vuelca ya los cambios pendientes de un solo documento."""
+        self._checkpoint(doc)
+
+    def _checkpoint(self, doc):
+        with self.lock:
+            if self._dirty.get(doc.name) is not doc:
+                return
+            if not fingerprint_matches(doc.fingerprint, file_fingerprint(doc.path)):
+                # Alguien modificó el .txt por fuera: como en VoidDocument.refresh, gana el disco
+                print(f"⚠️ {doc.name} cambió en disco antes de compactar; se descartan los cambios pendientes.")
+                self.discard(doc)
+                doc.discard_pending()
+                return
+            upto = self.seq
+            del self._dirty[doc.name]
+            if doc.unlink_pending:
+                self._checkpoint_unlink(doc, upto)
+                return
+            appending, lines = doc.take_checkpoint()
+
+        if appending:
+            self._checkpoint_append(doc, lines, upto)
+        else:
+            self._checkpoint_rewrite(doc, lines, upto)
+
+    def _checkpoint_append(self, doc, tail, upto):
+        """Solo hubo líneas agregadas al final: se agregan al .txt con una sola escritura."""
+        data = doc.encode_lines(tail)
+        if not doc.ends_with_newline:
+            data = doc.newline.encode('utf-8') + data
+        with self.lock:
+            size = doc.fingerprint[1] if doc.fingerprint else 0
+            # El ancla se registra ANTES de escribir: si el disco llega a este tamaño, el append se hizo
+            self._append({'op': 'checkpoint', 'file': doc.name, 'upto': upto,
+                          'fp': [None, size + len(data)]})
+            self.commit()
+            with open(doc.path, 'ab') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            doc.ends_with_newline = True
+            doc.fingerprint = file_fingerprint(doc.path)
+
+    def _checkpoint_rewrite(self, doc, snapshot, upto):
+        """Escritura atómica: archivo temporal + fsync + os.replace."""
+        tmp_path = os.path.join(self.void_dir, '.' + doc.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(doc.encode_lines(snapshot))
+            f.flush()
+            os.fsync(f.fileno())
+        # os.replace conserva mtime y tamaño del temporal: es la huella que tendrá el .txt
+        fp = file_fingerprint(tmp_path)
+        with self.lock:
+            self._append({'op': 'checkpoint', 'file': doc.name, 'upto': upto, 'fp': fp})
+            self.commit()
+            os.replace(tmp_path, doc.path)
+            self._fsync_dir()
+            doc.ends_with_newline = True
+            doc.fingerprint = fp
+
+    def _checkpoint_unlink(self, doc, upto):
+        """El origen de un movimiento quedó vacío: se elimina el .txt (ancla sin archivo)."""
+        self._append({'op': 'checkpoint', 'file': doc.name, 'upto': upto, 'fp': None})
+        self.commit()
+        try:
+            os.remove(doc.path)
+        except FileNotFoundError:
+            pass
+        self._fsync_dir()
+        doc.unlink_pending = False
+        doc.fingerprint = None
+        doc.mark_saved()
+
+    def _fsync_dir(self):
+        if hasattr(os, 'O_DIRECTORY'):
+            fd = os.open(self.void_dir, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    # --- Hilo de fondo ---
+
+    def _run(self):
+        while True:
+            with self.lock:
+                if self._closed:
+                    return
+                self._wakeup.wait(self.commit_interval)
+                if self._closed:
+                    return
+                idle = time.monotonic() - self._last_edit_time
+                waiters, self._flush_waiters = self._flush_waiters, []
+                should_compact = bool(self._dirty) and (idle >= self.compact_delay or bool(waiters))
+            try:
+                self.commit()
+                if should_compact:
+                    self.compact()
+            except Exception as e:
+                print(f"❌ Error en el journal de {self.void_dir}: {e}")
+            finally:
+                for done in waiters:
+                    done.set()
+
+    def request_flush(self):
+        """
+        Pide al hilo compactador que vuelque ya lo pendiente, sin esperar a
+        compact_delay. Devuelve un Event que se marca cuando lo pedido está en
+        los .txt: lo espera quien lo necesite, fuera del hilo de la interfaz.
+        """
+        done = threading.Event()
+        with self.lock:
+            if self._closed or self._thread is None:
+                done.set()  # Sin hilo: close() ya volcó todo (o nunca se escribió nada)
+            else:
+                self._flush_waiters.append(done)
+                self._wakeup.notify()
+        return done
+
+    def flush(self):
+        """Commit + compactación inmediata (al salir o cuando se necesita el .txt al día)."""
+        self.commit()
+        self.compact()
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self._closed = True
+            for done in self._flush_waiters:
+                done.set()
+            self._flush_waiters = []
+            self._wakeup.notify()
+            if self._file:
+                self._file.close()
+                self._file = None
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+
+
+def file_fingerprint(path):
+    """Devuelve [st_mtime_ns, st_size] del archivo, o None si no existe."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def fingerprint_matches(anchor_fp, disk_fp):
+    """Compara la huella de un ancla con la del disco (mtime None = solo tamaño)."""
+    if anchor_fp is None or disk_fp is None:
+        return anchor_fp is None and disk_fp is None
+    if anchor_fp[0] is None:
+        return anchor_fp[1] == disk_fp[1]
+    return list(anchor_fp) == list(disk_fp)
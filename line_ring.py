@@ -1,39 +1,103 @@
 # line_ring.py - Estructura circular de líneas con navegación mejorada
+from difflib import SequenceMatcher
+
+from line_rope import LineRope, CompactLineRope, is_separator
+
+DIFF_MAX_LINES = 20_000  # Tramo distinto más largo que se compara línea a línea (SequenceMatcher es cuadrático)
+
+
 class LineRing:
-    def __init__(self, lines=None):
-        self.lines = list(lines) if lines else [""]
+    __slots__ = ('lines', 'index', 'read_only')
+
+    def __init__(self, lines=None, read_only=False, compact=False):
+        # LineRope: inserciones y borrados O(log n) en cualquier posición.
+        # compact=True guarda el texto en blobs UTF-8 (archivos de millones de líneas);
+        # lines puede ser un generador: se consume por bloques, sin armar una lista entera
+        rope = CompactLineRope if compact else LineRope
+        self.lines = rope(lines if lines is not None else [])
+        if not self.lines:
+            self.lines = rope([""])
         self.index = 0
+        # Ring de solo lectura (p. ej. resultados de búsqueda): F2 no permite editarlo
+        self.read_only = read_only
+
+    @classmethod
+    def mapped(cls, lines):
+        """Ring de un archivo enorme: las líneas (un MappedLines) se leen del mmap a medida que se muestran"""
+        ring = cls.__new__(cls)
+        ring.lines = lines
+        ring.index = 0
+        ring.read_only = False
+        return ring
+
+    @property
+    def version(self):
+        """Versión de las líneas: cambia con cada modificación (no con mover el índice)"""
+        return self.lines.version
 
     def current(self):
         return self.lines[self.index]
 
+    def _bounds(self):
+        """Rango [start, end) de líneas por el que circula el ring"""
+        return 0, len(self.lines)
+
     def move(self, delta):
-        """Mueve el índice saltando líneas que son solo puntos '.'"""
-        if not self.lines:
-            return
-        
-        # Guardar posición inicial para evitar loops infinitos
-        start_index = self.index
-        moves = 0
-        max_moves = len(self.lines)
-        
-        while moves < max_moves:
-            self.index = (self.index + delta) % len(self.lines)
-            moves += 1
-            
-            # Si la línea no es solo un punto, detener
-            if self.lines[self.index].strip() != '.':
-                return
-            
-            # Si todas las líneas son puntos, volver al inicio
-            if moves >= max_moves:
-                self.index = start_index
-                return
+        """
+        Mueve el índice delta líneas navegables, saltando las que son solo puntos '.'
+        Usa el índice de separadores del LineRope: O(log n) para cualquier delta
+        (PageUp/PageDown incluidos), sin recorrer los puntos uno por uno.
+        """
+        self.index = self.index_after(delta)
+
+    def index_after(self, delta, index=None):
+        """Índice al que llevaría move(delta) desde index (por defecto el actual), sin moverse"""
+        index = self.index if index is None else index
+        start, end = self._bounds()
+        if start >= end or not delta:
+            return index
+        first = self.lines.count_navigable(start)
+        total = self.lines.count_navigable(end) - first
+        if not total:
+            # Todas las líneas son puntos: quedarse donde está
+            return index
+
+        # Navegables antes del índice; parado en un punto, avanzar 1 ya es llegar a la siguiente
+        rank = self.lines.count_navigable(index) - first
+        if is_separator(self.lines[index]) and delta > 0:
+            rank -= 1
+        return self.lines.navigable_position(first + (rank + delta) % total)
+
+    def index_at(self, offset):
+        """Índice de la línea a offset líneas (con puntos) de la actual, dando la vuelta"""
+        start, end = self._bounds()
+        if start >= end:
+            return self.index
+        return start + (self.index - start + offset) % (end - start)
+
+    def distance(self, source, target, forward=True):
+        """Líneas (con puntos) de source a target yendo hacia adelante o hacia atrás, dando la vuelta"""
+        start, end = self._bounds()
+        if start >= end:
+            return 0
+        if forward:
+            return (target - source) % (end - start)
+        return -((source - target) % (end - start))
 
     def get(self, offset=0):
-        if not self.lines:
+        start, end = self._bounds()
+        if start >= end:
             return ""
-        return self.lines[(self.index + offset) % len(self.lines)]
+        return self.lines[self.index_at(offset)]
+
+    def insert_below(self, text):
+        """Inserta text debajo de la línea actual y la deja como actual (F2, Enter)"""
+        self.lines.insert(self.index + 1, text)
+        self.index += 1
+
+    def replace_current(self, text):
+        """Reemplaza el texto de la línea actual (F2, Shift+Enter)"""
+        self.lines[self.index] = text
 
     def insert(self, text, after_current=False):
         pos = self.index + 1 if after_current else self.index
@@ -43,13 +107,128 @@ class LineRing:
 
     def remove_current(self):
         if len(self.lines) <= 1:
-            self.lines = [""]
+            if self.lines:
+                self.lines[0] = ""
+            else:
+                self.lines.insert(0, "")
             self.index = 0
             return
         del self.lines[self.index]
         if self.index >= len(self.lines):
             self.index = len(self.lines) - 1
 
+    def apply_changes(self, changes):
+        """
+        Aplica cambios ya conocidos (VoidDocument.ring_changes_since):
+        [(posición, cuántas quitar, líneas a poner)], en orden. Cada uno es una
+        asignación de slice del rope, sin comparar nada. El índice queda en la
+        misma línea lógica, como con apply_diff. Devuelve cuántas líneas cambiaron.
+        """
+        if len(self.lines) == 1 and not self.lines[0]:
+            # El [""] de un archivo sin líneas no es una línea del archivo
+            del self.lines[0]
+        changed = 0
+        index = self.index
+        for rank, removed, added in changes:
+            self.lines[rank:rank + removed] = added
+            changed += max(removed, len(added))
+            if index >= rank + removed:
+                index += len(added) - removed
+            elif index >= rank:
+                index = rank + min(index - rank, max(0, len(added) - 1))
+        if not self.lines:
+            self.lines.insert(0, "")
+        self.index = min(max(0, index), len(self.lines) - 1)
+        return changed
+
+    def apply_diff(self, new_lines):
+        """
+        Lleva el ring a new_lines editando solo lo que cambió: se recortan el
+        principio y el final comunes (recorriendo el rope, sin copiarlo) y el
+        medio se compara línea a línea (SequenceMatcher). El índice queda en la
+        misma línea lógica aunque se hayan insertado o borrado líneas antes.
+        Devuelve cuántas líneas cambiaron.
+        """
+        n, m = len(self.lines), len(new_lines)
+        lo = 0
+        for old_line, new_line in zip(self.lines, new_lines):
+            if old_line != new_line:
+                break
+            lo += 1
+        hi = 0
+        for old_line, new_line in zip(reversed(self.lines), reversed(new_lines)):
+            if hi >= min(n, m) - lo or old_line != new_line:
+                break
+            hi += 1
+        a, b = self.lines[lo:n - hi], new_lines[lo:m - hi]
+        if len(a) + len(b) <= DIFF_MAX_LINES:
+            opcodes = SequenceMatcher(None, a, b, autojunk=False).get_opcodes()
+        else:
+            opcodes = [('replace', 0, len(a), 0, len(b))]
+
+        # De atrás hacia adelante: los tramos anteriores no cambian de posición
+        changed = 0
+        for tag, i1, i2, j1, j2 in reversed(opcodes):
+            if tag != 'equal':
+                self.lines[lo + i1:lo + i2] = b[j1:j2]
+                changed += max(i2 - i1, j2 - j1)
+
+        # La línea actual: desplazada si sigue, o la que quedó en su lugar si cambió
+        index = self.index
+        if lo <= index < n - hi:
+            k = index - lo
+            for tag, i1, i2, j1, j2 in opcodes:
+                if i1 <= k < i2:
+                    index = lo + j1 + (k - i1 if tag == 'equal' else min(k - i1, max(0, j2 - j1 - 1)))
+                    break
+        elif index >= n - hi:
+            index += m - n
+        self.index = min(max(0, index), max(0, len(self.lines) - 1))
+        return changed
+
     def to_list_from_current(self):
         """Para exportar/imprimir con la línea actual primero"""
-        return self.lines[self.index:] + self.lines[:self.index]
\ No newline at end of file
+        return self.lines[self.index:] + self.lines[:self.index]
+
+
+class SubRing(LineRing):
+    """
+    Vista de un bloque [start, end) de otro ring (F3 → Enter: loopear ese
+    bloque en F2). No copia: comparte el LineRope del padre y usa sus mismos
+    índices, así que lo que se edita acá ya está en el padre (y auto_save
+    traduce el índice como siempre). La navegación da la vuelta dentro del
+    rango; insertar y borrar lo agrandan o achican.
+    """
+
+    __slots__ = ('parent', 'start', 'end')
+
+    def __init__(self, parent, start, end):
+        self.parent = parent
+        self.lines = parent.lines
+        self.start = start
+        self.end = end
+        self.index = min(max(parent.index, start), end - 1)
+        self.read_only = parent.read_only
+
+    def _bounds(self):
+        return self.start, self.end
+
+    def insert_below(self, text):
+        super().insert_below(text)
+        self.end += 1
+
+    def insert(self, text, after_current=False):
+        self.end += 1
+        super().insert(text, after_current)
+
+    def remove_current(self):
+        if self.end - self.start <= 1:
+            self.replace_current("")
+            return
+        del self.lines[self.index]
+        self.end -= 1
+        if self.index >= self.end:
+            self.index = self.end - 1
+
+    def to_list_from_current(self):
+        return self.lines[self.index:self.end] + self.lines[self.start:self.index]
@@ -0,0 +1,537 @@
+# line_rope.py - Secuencia de líneas en bloques balanceados (inserciones O(log n))
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate, chain, islice
+
+
+def is_separator(line):
+    """Un separador de bloque es una línea que contiene solo '.'"""
+    return line.strip() == '.'
+
+
+def is_blank(line):
+    """Una línea vacía (o solo espacios): el LineRing no la incluye"""
+    return not line.strip()
+
+
+def _mark_offsets(chunk, base=0):
+    """(separadores, vacías): posiciones base + i de las líneas de chunk, en una sola pasada."""
+    seps, blanks = [], []
+    for i, line in enumerate(chunk):
+        stripped = line.strip()
+        if not stripped:
+            blanks.append(base + i)
+        elif stripped == '.':
+            seps.append(base + i)
+    return seps, blanks
+
+
+def _shift_insert(offsets, pos, added, n):
+    """Offsets de un bloque tras insertar n líneas en pos (added: las marcadas entre ellas)."""
+    k = bisect_left(offsets, pos)
+    offsets[k:] = added + [o + n for o in offsets[k:]]
+
+
+def _shift_delete(offsets, pos, take):
+    """Offsets de un bloque tras borrar take líneas desde pos. Devuelve cuántas marcadas se fueron."""
+    k1, k2 = bisect_left(offsets, pos), bisect_left(offsets, pos + take)
+    offsets[k1:] = [o - take for o in offsets[k2:]]
+    return k2 - k1
+
+
+def _split_offsets(offsets, half):
+    k = bisect_left(offsets, half)
+    return [offsets[:k], [o - half for o in offsets[k:]]]
+
+
+class _Fenwick:
+    """Árbol de Fenwick sobre los tamaños de los bloques: sumas prefijas y búsqueda en O(log n)."""
+
+    __slots__ = ('tree', 'size')
+
+    def __init__(self, values):
+        self.size = len(values)
+        tree = [0] + list(values)
+        for i in range(1, self.size + 1):
+            j = i + (i & -i)
+            if j <= self.size:
+                tree[j] += tree[i]
+        self.tree = tree
+
+    def add(self, i, delta):
+        i += 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def total(self):
+        return self.prefix(self.size)
+
+    def prefix(self, i):
+        """Suma de los primeros i valores."""
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def find(self, k):
+        """Devuelve (bloque, resto): el bloque donde cae el elemento k (0-based) y su posición dentro."""
+        pos = 0
+        bit = 1 << self.size.bit_length()
+        while bit:
+            nxt = pos + bit
+            if nxt <= self.size and self.tree[nxt] <= k:
+                pos = nxt
+                k -= self.tree[nxt]
+            bit >>= 1
+        return pos, k
+
+
+class LineRope:
+    """
+    Lista de líneas guardada en bloques de tamaño acotado, con un índice de
+    Fenwick sobre el tamaño de cada bloque. Acceso, inserción y borrado en
+    cualquier posición cuestan O(log n) más el movimiento dentro de un bloque
+    (como mucho 2*LOAD elementos), en lugar del O(n) de list.insert.
+
+    Se comporta como una lista para lo que usan LineRing, VoidDocument y las
+    vistas: len, índices y slices, insert, del, iteración y comparación.
+
+    Además mantiene, al día con cada edición, el índice ordenado de los
+    separadores '.': cada bloque guarda las posiciones locales de sus
+    separadores y otro Fenwick cuenta cuántos hay por bloque. Así, ubicar el
+    bloque de una línea o el k-ésimo separador es O(log n) sin recorrer líneas.
+    Las líneas vacías se indexan igual: el documento traduce en O(log n)
+    entre sus posiciones y las del LineRing (que solo tiene las no vacías).
+    """
+
+    LOAD = 512
+
+    def __init__(self, lines=None):
+        # Contador de modificaciones: sube con cada edición (las vistas cachean por versión)
+        self.version = 0
+        self._build(lines if lines is not None else [])
+
+    @staticmethod
+    def _new_chunk(items):
+        """Convierte una lista de líneas en un bloque (aquí, la lista misma)."""
+        return items
+
+    def _build(self, items):
+        # Se consume de a LOAD líneas: un generador nunca se materializa entero
+        self._chunks, self._seps, self._blanks = [], [], []
+        self._len = 0
+        self.version += 1
+        it = iter(items)
+        while True:
+            batch = list(islice(it, self.LOAD))
+            if not batch:
+                break
+            seps, blanks = _mark_offsets(batch)
+            self._seps.append(seps)
+            self._blanks.append(blanks)
+            self._chunks.append(self._new_chunk(batch))
+            self._len += len(batch)
+        self._reindex()
+
+    def _reindex(self):
+        self._fenwick = _Fenwick([len(c) for c in self._chunks])
+        self._sep_fenwick = _Fenwick([len(o) for o in self._seps])
+        self._blank_fenwick = _Fenwick([len(o) for o in self._blanks])
+
+    def _locate(self, index):
+        """Traduce un índice global a (bloque, posición dentro del bloque)."""
+        return self._fenwick.find(index)
+
+    def _normalize(self, index):
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("LineRope index out of range")
+        return index
+
+    # --- Lectura ---
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        return chain.from_iterable(self._chunks)
+
+    def __reversed__(self):
+        for chunk in reversed(self._chunks):
+            yield from reversed(chunk)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._len)
+            if step != 1:
+                return list(self)[index]
+            return self._slice(start, stop)
+        ci, pos = self._locate(self._normalize(index))
+        return self._chunks[ci][pos]
+
+    def _slice(self, start, stop):
+        if start >= stop:
+            return []
+        ci, pos = self._locate(start)
+        out = []
+        remaining = stop - start
+        while remaining > 0:
+            part = self._chunks[ci][pos:pos + remaining]
+            out.extend(part)
+            remaining -= len(part)
+            ci += 1
+            pos = 0
+        return out
+
+    def __eq__(self, other):
+        try:
+            if len(other) != self._len:
+                return False
+        except TypeError:
+            return NotImplemented
+        return all(a == b for a, b in zip(self, other))
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __contains__(self, value):
+        return any(value in chunk for chunk in self._chunks)
+
+    def __repr__(self):
+        preview = list(islice(self, 5))
+        more = ", ..." if self._len > 5 else ""
+        return f"LineRope({preview!r}{more} len={self._len})"
+
+    # --- Escritura ---
+
+    def __setitem__(self, index, value):
+        self.version += 1
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._len)
+            if step != 1:
+                items = list(self)
+                items[index] = value
+                self._build(items)
+                return
+            value = list(value)
+            self._delete_range(start, max(start, stop))
+            self._insert_many(start, value)
+            return
+        ci, pos = self._locate(self._normalize(index))
+        old = self._chunks[ci][pos]
+        self._chunks[ci][pos] = value
+        for marks, offsets, fenwick in ((is_separator, self._seps[ci], self._sep_fenwick),
+                                        (is_blank, self._blanks[ci], self._blank_fenwick)):
+            was, now = marks(old), marks(value)
+            if was != now:
+                if now:
+                    offsets.insert(bisect_left(offsets, pos), pos)
+                    fenwick.add(ci, 1)
+                else:
+                    offsets.remove(pos)
+                    fenwick.add(ci, -1)
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._len)
+            if step != 1:
+                items = list(self)
+                del items[index]
+                self._build(items)
+                return
+            self._delete_range(start, max(start, stop))
+            return
+        self._delete_range(self._normalize(index), self._normalize(index) + 1)
+
+    def insert(self, index, value):
+        if index < 0:
+            index = max(0, index + self._len)
+        self._insert_many(min(index, self._len), [value])
+
+    def append(self, value):
+        self._insert_many(self._len, [value])
+
+    def extend(self, values):
+        self._insert_many(self._len, list(values))
+
+    def _insert_many(self, index, items):
+        if not items:
+            return
+        self.version += 1
+        if not self._chunks:
+            self._build(items)
+            return
+
+        if index == self._len:
+            ci, pos = len(self._chunks) - 1, len(self._chunks[-1])
+        else:
+            ci, pos = self._locate(index)
+        chunk = self._chunks[ci]
+
+        if len(chunk) + len(items) <= 2 * self.LOAD:
+            n = len(items)
+            chunk[pos:pos] = items
+            seps, blanks = _mark_offsets(items, pos)
+            _shift_insert(self._seps[ci], pos, seps, n)
+            _shift_insert(self._blanks[ci], pos, blanks, n)
+            self._len += n
+            if len(chunk) > self.LOAD * 2 - 1:
+                self._split(ci)
+            else:
+                self._fenwick.add(ci, n)
+                if seps:
+                    self._sep_fenwick.add(ci, len(seps))
+                if blanks:
+                    self._blank_fenwick.add(ci, len(blanks))
+            return
+
+        # Inserción grande: se rearman solo los bloques afectados
+        merged = chunk[:pos] + items + chunk[pos:]
+        load = self.LOAD
+        pieces = [merged[i:i + load] for i in range(0, len(merged), load)]
+        self._chunks[ci:ci + 1] = [self._new_chunk(p) for p in pieces]
+        marks = [_mark_offsets(p) for p in pieces]
+        self._seps[ci:ci + 1] = [m[0] for m in marks]
+        self._blanks[ci:ci + 1] = [m[1] for m in marks]
+        self._len += len(items)
+        self._reindex()
+
+    def _split(self, ci):
+        chunk = self._chunks[ci]
+        half = len(chunk) // 2
+        self._chunks[ci:ci + 1] = [self._new_chunk(chunk[:half]), self._new_chunk(chunk[half:])]
+        self._seps[ci:ci + 1] = _split_offsets(self._seps[ci], half)
+        self._blanks[ci:ci + 1] = _split_offsets(self._blanks[ci], half)
+        self._reindex()
+
+    def _delete_range(self, start, stop):
+        if start >= stop:
+            return
+        self.version += 1
+        ci, pos = self._locate(start)
+        remaining = stop - start
+        touched = ci
+        structural = False
+        while remaining > 0:
+            chunk = self._chunks[ci]
+            take = min(remaining, len(chunk) - pos)
+            del chunk[pos:pos + take]
+            seps = _shift_delete(self._seps[ci], pos, take)
+            blanks = _shift_delete(self._blanks[ci], pos, take)
+            remaining -= take
+            if not structural:
+                self._fenwick.add(ci, -take)
+                self._sep_fenwick.add(ci, -seps)
+                self._blank_fenwick.add(ci, -blanks)
+            if not chunk:
+                del self._chunks[ci]
+                del self._seps[ci]
+                del self._blanks[ci]
+                structural = True
+            else:
+                ci += 1
+                if remaining > 0:
+                    structural = True
+            pos = 0
+        self._len -= stop - start
+
+        # Bloques demasiado chicos se funden con el vecino para mantener el balance
+        if touched < len(self._chunks) and len(self._chunks[touched]) < self.LOAD // 4 and len(self._chunks) > 1:
+            neighbor = touched - 1 if touched > 0 else touched + 1
+            lo, hi = sorted((touched, neighbor))
+            size_lo = len(self._chunks[lo])
+            self._chunks[lo:hi + 1] = [self._new_chunk(self._chunks[lo][:] + self._chunks[hi][:])]
+            self._seps[lo:hi + 1] = [self._seps[lo] + [o + size_lo for o in self._seps[hi]]]
+            self._blanks[lo:hi + 1] = [self._blanks[lo] + [o + size_lo for o in self._blanks[hi]]]
+            structural = True
+            if len(self._chunks[lo]) > 2 * self.LOAD - 1:
+                self._split(lo)
+                return
+        if structural:
+            self._reindex()
+
+    # --- Índice de separadores '.' ---
+
+    def separator_count(self):
+        """Cantidad total de separadores."""
+        return self._sep_fenwick.total()
+
+    def count_separators(self, stop):
+        """Cantidad de separadores en lines[0:stop]."""
+        if stop >= self._len:
+            return self.separator_count()
+        if stop <= 0:
+            return 0
+        ci, pos = self._locate(stop)
+        return self._sep_fenwick.prefix(ci) + bisect_left(self._seps[ci], pos)
+
+    def separator_position(self, k):
+        """Índice de línea del k-ésimo separador (0-based)."""
+        ci, r = self._sep_fenwick.find(k)
+        return self._fenwick.prefix(ci) + self._seps[ci][r]
+
+    def prev_separator(self, index):
+        """Último separador ANTES de index, o None."""
+        k = self.count_separators(index)
+        return self.separator_position(k - 1) if k > 0 else None
+
+    def next_separator(self, index):
+        """Primer separador en index o DESPUÉS, o None."""
+        k = self.count_separators(index)
+        return self.separator_position(k) if k < self.separator_count() else None
+
+    # --- Líneas navegables (todas las que no son separador) ---
+
+    def navigable_count(self):
+        """Cantidad de líneas que no son separador."""
+        return self._len - self.separator_count()
+
+    def count_navigable(self, stop):
+        """Cantidad de líneas que no son separador en lines[0:stop]."""
+        stop = max(0, min(stop, self._len))
+        return stop - self.count_separators(stop)
+
+    def navigable_position(self, k):
+        """
+        Índice de línea de la k-ésima línea que no es separador (0-based).
+        Baja por los dos Fenwick a la vez (tamaño - separadores de cada bloque).
+        """
+        return self._unmarked_position(k, self._sep_fenwick, self._seps)
+
+    def _unmarked_position(self, k, marks, marked):
+        """Índice de línea de la k-ésima línea sin marca (marks/marked: Fenwick y offsets de las marcadas)."""
+        sizes = self._fenwick
+        ci = 0
+        bit = 1 << sizes.size.bit_length()
+        while bit:
+            nxt = ci + bit
+            if nxt <= sizes.size:
+                free = sizes.tree[nxt] - marks.tree[nxt]
+                if free <= k:
+                    ci = nxt
+                    k -= free
+            bit >>= 1
+        # Dentro del bloque: antes de la marcada j hay offsets[j] - j líneas sin marca
+        offsets = marked[ci]
+        skipped = bisect_right(range(len(offsets)), k, key=lambda j: offsets[j] - j)
+        return sizes.prefix(ci) + k + skipped
+
+    # --- Líneas no vacías (las que tiene el LineRing) ---
+
+    def nonblank_count(self):
+        """Cantidad de líneas no vacías."""
+        return self._len - self._blank_fenwick.total()
+
+    def count_nonblank(self, stop):
+        """Cantidad de líneas no vacías en lines[0:stop]."""
+        stop = max(0, min(stop, self._len))
+        if stop == self._len:
+            return self.nonblank_count()
+        if stop == 0:
+            return 0
+        ci, pos = self._locate(stop)
+        return stop - self._blank_fenwick.prefix(ci) - bisect_left(self._blanks[ci], pos)
+
+    def nonblank_position(self, k):
+        """Índice de línea de la k-ésima línea no vacía (0-based)."""
+        return self._unmarked_position(k, self._blank_fenwick, self._blanks)
+
+    def separator_positions(self):
+        """Posiciones de todos los separadores, en orden (sin mirar las demás líneas)."""
+        base = 0
+        for chunk, offsets in zip(self._chunks, self._seps):
+            for o in offsets:
+                yield base + o
+            base += len(chunk)
+
+
+class _PackedLines:
+    """
+    Bloque de líneas guardado como UN blob UTF-8 más el offset final de cada
+    línea (array de enteros de 4 bytes), en vez de un objeto str por línea.
+    Las líneas se decodifican recién cuando se leen. Se comporta como la lista
+    que usa LineRope para sus bloques: índices, slices (devuelven listas),
+    asignación, borrado e iteración.
+    """
+
+    __slots__ = ('_blob', '_ends')
+
+    def __init__(self, lines=()):
+        encoded = [line.encode('utf-8') for line in lines]
+        self._blob = b''.join(encoded)
+        self._ends = array('I', accumulate(map(len, encoded)))
+
+    def __len__(self):
+        return len(self._ends)
+
+    def _line(self, i):
+        start = self._ends[i - 1] if i else 0
+        return self._blob[start:self._ends[i]].decode('utf-8')
+
+    def _bounds(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self._ends))
+            if step != 1:
+                raise ValueError("_PackedLines solo admite slices contiguos")
+            return start, max(start, stop)
+        if index < 0:
+            index += len(self._ends)
+        if not 0 <= index < len(self._ends):
+            raise IndexError("_PackedLines index out of range")
+        return index, index + 1
+
+    def __getitem__(self, index):
+        start, stop = self._bounds(index)
+        if isinstance(index, slice):
+            return [self._line(i) for i in range(start, stop)]
+        return self._line(start)
+
+    def __iter__(self):
+        for i in range(len(self._ends)):
+            yield self._line(i)
+
+    def __reversed__(self):
+        for i in reversed(range(len(self._ends))):
+            yield self._line(i)
+
+    def __contains__(self, value):
+        return any(line == value for line in self)
+
+    def __setitem__(self, index, value):
+        start, stop = self._bounds(index)
+        self._replace(start, stop, value if isinstance(index, slice) else [value])
+
+    def __delitem__(self, index):
+        start, stop = self._bounds(index)
+        self._replace(start, stop, [])
+
+    def _replace(self, start, stop, lines):
+        """Reemplaza las líneas [start, stop) operando sobre los bytes, sin decodificar el resto."""
+        ends = self._ends
+        head = ends[start - 1] if start else 0
+        tail = ends[stop - 1] if stop else 0
+        encoded = [line.encode('utf-8') for line in lines]
+        middle = b''.join(encoded)
+        shift = len(middle) - (tail - head)
+        self._blob = self._blob[:head] + middle + self._blob[tail:]
+        new_ends = array('I', ends[:start])
+        new_ends.extend(head + end for end in accumulate(map(len, encoded)))
+        new_ends.extend(end + shift for end in ends[stop:])
+        self._ends = new_ends
+
+
+class CompactLineRope(LineRope):
+    """
+    LineRope cuyos bloques son _PackedLines: un millón de líneas ocupan su
+    texto en UTF-8 más 4 bytes de offset cada una, sin el costo fijo de un
+    str por línea. Misma API (incluido el índice de separadores); los str se
+    crean solo para las líneas que se leen (las que dibuja la vista).
+    """
+
+    @staticmethod
+    def _new_chunk(items):
+        return _PackedLines(items)
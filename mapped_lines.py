@@ -0,0 +1,537 @@
+# mapped_lines.py - Líneas de un archivo enorme servidas desde mmap, con índice en segundo plano
+import mmap
+import os
+import threading
+from bisect import bisect_right
+
+import numpy as np
+
+from journal import file_fingerprint
+from line_rope import is_separator
+
+MAPPED_MIN_BYTES = 64 * 1024 * 1024  # Desde este tamaño el ring del archivo no se carga en memoria
+WINDOW = 16 * 1024 * 1024            # Bytes que procesa cada paso del indexado
+
+_WHITESPACE = np.zeros(256, dtype=bool)
+_WHITESPACE[[9, 10, 11, 12, 13, 32]] = True
+_NEWLINE, _DOT = 10, 46
+
+
+class _GrowArray:
+    """Arreglo de NumPy que crece duplicando su capacidad; view() es lo escrito hasta ahora."""
+
+    __slots__ = ('_buffer', 'count')
+
+    def __init__(self, dtype):
+        self._buffer = np.zeros(1024, dtype=dtype)
+        self.count = 0
+
+    def extend(self, values):
+        needed = self.count + len(values)
+        if needed > len(self._buffer):
+            grown = np.zeros(max(needed, 2 * len(self._buffer)), dtype=self._buffer.dtype)
+            grown[:self.count] = self._buffer[:self.count]
+            self._buffer = grown
+        self._buffer[self.count:needed] = values
+        # count se actualiza después de escribir: un lector nunca ve posiciones sin llenar
+        self.count = needed
+
+    def view(self):
+        return self._buffer[:self.count]
+
+
+class MappedLines:
+    """
+    Las líneas no vacías (sin espacios a los costados) de un archivo, como las
+    arma sync_ring_with_file, pero servidas desde un mmap: solo se decodifican
+    las que se leen. Un hilo recorre el archivo por ventanas con NumPy y va
+    publicando dónde empieza y termina cada línea y cuáles son separadores
+    '.'; mientras tanto ya se puede leer lo indexado (la vista muestra la
+    primera pantalla al instante).
+
+    Las ediciones no tocan el archivo: van a una tabla de piezas (tramos del
+    archivo y listas de líneas nuevas) que save() vuelca a disco. Después de
+    la última pieza sigue la cola del archivo sin editar, que crece mientras
+    se indexa: editar solo espera a que esté indexada la línea que se toca.
+    Con sumas acumuladas de líneas, separadores y navegables por pieza, las
+    consultas de la API de LineRope (la que usan LineRing y las vistas) son
+    una búsqueda binaria.
+    """
+
+    def __init__(self, path, on_progress=None):
+        self.path = path
+        self.on_progress = on_progress
+        self.dirty = False
+        self.version = 0   # Sube con cada edición y con cada avance del indexado
+        self._map()
+
+    # --- Mapeo e indexado ---
+
+    def _map(self, index=None):
+        """
+        Mapea el archivo y lo indexa en segundo plano o, si ya se conoce su
+        índice (starts, ends, seps, numbers: lo calcula write_snapshot), lo instala.
+        """
+        self._starts = _GrowArray(np.uint64)
+        self._ends = _GrowArray(np.uint64)
+        self._numbers = _GrowArray(np.uint64)   # número de línea en el archivo (contando las vacías)
+        self._seps = _GrowArray(np.uint64)      # índices (entre las líneas del archivo) de los separadores
+        self._sep_rank = _GrowArray(np.int64)   # seps[j] - j: navegables antes del separador j
+        self._set_pieces([], 0)
+        self._done = threading.Event()
+        self._progress = threading.Condition()
+        self._stop = False
+        self._thread = None
+        self.fp = file_fingerprint(self.path)  # Huella del archivo mapeado
+        with open(self.path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        if index is not None:
+            starts, ends, seps, numbers = index
+            self._seps.extend(seps)
+            self._sep_rank.extend(seps.astype(np.int64) - np.arange(len(seps)))
+            self._numbers.extend(numbers)
+            self._ends.extend(ends)
+            self._starts.extend(starts)
+            self._done.set()
+            return
+        self.version += 1
+        self._thread = threading.Thread(target=self._index, name="void-mapped-lines", daemon=True)
+        self._thread.start()
+
+    def _index(self):
+        try:
+            if self._mm is not None:
+                self._scan(np.frombuffer(self._mm, dtype=np.uint8))
+        except (ValueError, BufferError):
+            pass  # El mmap se cerró mientras se indexaba
+        finally:
+            with self._progress:
+                self._done.set()
+                self._progress.notify_all()
+            if self.on_progress:
+                self.on_progress()
+
+    def _scan(self, data):
+        size = len(data)
+        pos = 0
+        number = 0   # Líneas del archivo (con las vacías) antes de la ventana
+        while pos < size and not self._stop:
+            stop = min(size, pos + WINDOW)
+            window = data[pos:stop]
+            newlines = np.flatnonzero(window == _NEWLINE)
+            if stop < size:
+                if not len(newlines):
+                    stop = size if pos + 4 * WINDOW >= size else pos + 4 * WINDOW
+                    window = data[pos:stop]
+                    newlines = np.flatnonzero(window == _NEWLINE)
+                if stop < size and len(newlines):
+                    # La última línea incompleta queda para la próxima ventana
+                    window = window[:newlines[-1] + 1]
+                    stop = pos + len(window)
+            starts = np.concatenate(([0], newlines + 1))
+            ends = np.concatenate((newlines, [len(window)]))
+            numbers = np.arange(number, number + len(starts), dtype=np.uint64)
+            if starts[-1] == len(window):
+                starts, ends, numbers = starts[:-1], ends[:-1], numbers[:-1]
+            number += len(newlines)
+
+            # Caracteres no blancos y puntos de cada línea con sumas acumuladas
+            solid = np.concatenate(([0], np.cumsum(~_WHITESPACE[window], dtype=np.int64)))
+            dots = np.concatenate(([0], np.cumsum(window == _DOT, dtype=np.int64)))
+            filled = solid[ends] - solid[starts]
+            keep = filled > 0
+            starts, ends, numbers = starts[keep], ends[keep], numbers[keep]
+            separator = (filled[keep] == 1) & (dots[ends] - dots[starts] == 1)
+
+            first = self._starts.count
+            separators = np.flatnonzero(separator).astype(np.uint64) + first
+            self._seps.extend(separators)
+            self._sep_rank.extend(separators.astype(np.int64) - np.arange(self._seps.count - len(separators),
+                                                                          self._seps.count))
+            self._numbers.extend(numbers)
+            self._ends.extend(ends.astype(np.uint64) + pos)
+            self._starts.extend(starts.astype(np.uint64) + pos)
+            pos = stop
+            self.version += 1
+            with self._progress:
+                self._progress.notify_all()
+            if self.on_progress:
+                self.on_progress()
+
+    @property
+    def indexed(self):
+        return self._done.is_set()
+
+    def wait(self, count=None):
+        """Espera a que el indexado termine (o a que haya al menos count líneas)."""
+        with self._progress:
+            while not self._done.is_set() and (count is None or self._starts.count < count):
+                self._progress.wait()
+
+    def close(self):
+        self._stop = True
+        if self._thread is not None:
+            self._thread.join()
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+    # --- Archivo base ---
+
+    def _base_line(self, x):
+        starts, ends = self._starts.view(), self._ends.view()
+        return self._mm[int(starts[x]):int(ends[x])].decode('utf-8', errors='replace').strip()
+
+    def _base_separators(self, a, b):
+        seps = self._seps.view()
+        return int(np.searchsorted(seps, b) - np.searchsorted(seps, a))
+
+    def _base_navigable_position(self, rank):
+        """Línea del archivo que es la navegable número rank."""
+        return rank + int(np.searchsorted(self._sep_rank.view(), rank, side='right'))
+
+    # --- Tabla de piezas ---
+    # Cada pieza es (a, b): líneas [a, b) del archivo, o una lista de líneas
+    # nuevas. Después de las piezas va la cola: las líneas del archivo desde
+    # _tail hasta donde llegó el indexado.
+
+    def _set_pieces(self, pieces, tail, first=0):
+        """Instala las piezas y recalcula las sumas acumuladas desde la pieza first."""
+        if first == 0:
+            self._offsets, self._sep_offsets, self._nav_offsets = [0], [0], [0]
+        else:
+            del self._offsets[first + 1:], self._sep_offsets[first + 1:], self._nav_offsets[first + 1:]
+        for piece in pieces[first:]:
+            n, seps = self._piece_len(piece), self._piece_separators(piece)
+            self._offsets.append(self._offsets[-1] + n)
+            self._sep_offsets.append(self._sep_offsets[-1] + seps)
+            self._nav_offsets.append(self._nav_offsets[-1] + n - seps)
+        self._pieces = pieces
+        self._tail = tail
+
+    def _tail_piece(self):
+        return (self._tail, self._starts.count)
+
+    def _locate(self, index):
+        """(pieza, posición dentro) del índice global."""
+        if index < self._offsets[-1]:
+            k = bisect_right(self._offsets, index) - 1
+            return self._pieces[k], index - self._offsets[k]
+        return self._tail_piece(), index - self._offsets[-1]
+
+    def _reach(self, index):
+        """Espera a que la línea index esté indexada (o a que el indexado termine)."""
+        if index >= len(self):
+            self.wait(self._tail + index + 1 - self._offsets[-1])
+
+    @staticmethod
+    def _piece_len(piece):
+        return piece[1] - piece[0] if isinstance(piece, tuple) else len(piece)
+
+    @staticmethod
+    def _piece_slice(piece, i, j):
+        return (piece[0] + i, piece[0] + j) if isinstance(piece, tuple) else piece[i:j]
+
+    def _piece_line(self, piece, i):
+        return self._base_line(piece[0] + i) if isinstance(piece, tuple) else piece[i]
+
+    def _piece_separators(self, piece, stop=None):
+        """Separadores en las primeras stop líneas de la pieza."""
+        n = self._piece_len(piece) if stop is None else stop
+        if isinstance(piece, tuple):
+            return self._base_separators(piece[0], piece[0] + n)
+        return sum(1 for line in piece[:n] if is_separator(line))
+
+    def _piece_separator_position(self, piece, k):
+        """Posición dentro de la pieza de su separador número k."""
+        if isinstance(piece, tuple):
+            seps = self._seps.view()
+            j = int(np.searchsorted(seps, piece[0])) + k
+            if j >= len(seps) or seps[j] >= piece[1]:
+                raise IndexError("separator index out of range")
+            return int(seps[j]) - piece[0]
+        return [i for i, line in enumerate(piece) if is_separator(line)][k]
+
+    def _piece_navigable_position(self, piece, k):
+        """Posición dentro de la pieza de su navegable número k."""
+        if isinstance(piece, tuple):
+            base_rank = piece[0] - self._base_separators(0, piece[0])
+            position = self._base_navigable_position(base_rank + k) - piece[0]
+            if position >= self._piece_len(piece):
+                raise IndexError("navigable index out of range")
+            return position
+        return [i for i, line in enumerate(piece) if not is_separator(line)][k]
+
+    def _edit(self, start, stop, new_lines):
+        """Reemplaza las líneas [start, stop) por new_lines en la tabla de piezas."""
+        self._reach(max(start, stop - 1))
+        stop = min(stop, len(self))
+        start = min(start, stop)
+        pieces, offsets, tail = list(self._pieces), self._offsets, self._tail
+        if stop > offsets[-1]:
+            # Pasar de la cola a las piezas lo que llega hasta stop
+            grown = tail + stop - offsets[-1]
+            if pieces and isinstance(pieces[-1], tuple) and pieces[-1][1] == tail:
+                pieces[-1] = (pieces[-1][0], grown)
+            else:
+                pieces.append((tail, grown))
+            tail = grown
+            self._set_pieces(pieces, tail, max(0, len(pieces) - 1))
+            pieces, offsets = list(self._pieces), self._offsets
+
+        if start < offsets[-1]:
+            k0 = bisect_right(offsets, start) - 1
+            k1 = bisect_right(offsets, stop - 1) - 1 if stop > start else k0
+            before = self._piece_slice(pieces[k0], 0, start - offsets[k0])
+            after = self._piece_slice(pieces[k1], stop - offsets[k1], self._piece_len(pieces[k1]))
+            middle = [before, list(new_lines), after]
+        else:
+            k0 = k1 = len(pieces)   # Justo antes de la cola
+            middle = [list(new_lines)]
+        pieces[k0:k1 + 1] = [p for p in middle if self._piece_len(p)]
+        self._set_pieces(pieces, tail, k0)
+        self.dirty = True
+        self.version += 1
+
+    # --- API de LineRope ---
+
+    def __len__(self):
+        return self._offsets[-1] + self._starts.count - self._tail
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def _normalize(self, index):
+        if index < 0:
+            self.wait()
+            index += len(self)
+        self._reach(index)
+        if not 0 <= index < len(self):
+            raise IndexError("MappedLines index out of range")
+        return index
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            return [self[i] for i in range(start, stop, step)]
+        piece, i = self._locate(self._normalize(index))
+        return self._piece_line(piece, i)
+
+    def __iter__(self):
+        i = 0
+        while i < len(self) or not self.indexed:
+            if i >= len(self):
+                self._reach(i)
+                if i >= len(self):
+                    return
+            yield self[i]
+            i += 1
+
+    def __eq__(self, other):
+        try:
+            if len(other) != len(self):
+                return False
+        except TypeError:
+            return NotImplemented
+        return all(a == b for a, b in zip(self, other))
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            self._edit(start, max(start, stop), list(value))
+            return
+        index = self._normalize(index)
+        self._edit(index, index + 1, [value])
+
+    def __delitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            self._edit(start, max(start, stop), [])
+            return
+        index = self._normalize(index)
+        self._edit(index, index + 1, [])
+
+    def insert(self, index, value):
+        if index < 0:
+            self.wait()
+            index = max(0, index + len(self))
+        self._reach(index)
+        index = min(index, len(self))
+        self._edit(index, index, [value])
+
+    def append(self, value):
+        self.wait()
+        self.insert(len(self), value)
+
+    # --- Separadores y navegables (sobre lo indexado hasta ahora) ---
+
+    def separator_count(self):
+        return self._sep_offsets[-1] + self._base_separators(*self._tail_piece())
+
+    def count_separators(self, stop):
+        stop = max(0, min(stop, len(self)))
+        if stop >= self._offsets[-1]:
+            return self._sep_offsets[-1] + self._base_separators(self._tail, self._tail + stop - self._offsets[-1])
+        k = bisect_right(self._offsets, stop) - 1
+        return self._sep_offsets[k] + self._piece_separators(self._pieces[k], stop - self._offsets[k])
+
+    def separator_position(self, k):
+        if k < self._sep_offsets[-1]:
+            j = bisect_right(self._sep_offsets, k) - 1
+            return self._offsets[j] + self._piece_separator_position(self._pieces[j], k - self._sep_offsets[j])
+        position = self._piece_separator_position(self._tail_piece(), k - self._sep_offsets[-1])
+        return self._offsets[-1] + position
+
+    def prev_separator(self, index):
+        k = self.count_separators(index)
+        return self.separator_position(k - 1) if k > 0 else None
+
+    def next_separator(self, index):
+        k = self.count_separators(index)
+        return self.separator_position(k) if k < self.separator_count() else None
+
+    def separator_positions(self):
+        if not self._pieces and not self._tail:
+            return iter(self._seps.view().tolist())
+        return iter([self.separator_position(k) for k in range(self.separator_count())])
+
+    def navigable_count(self):
+        return len(self) - self.separator_count()
+
+    def count_navigable(self, stop):
+        stop = max(0, min(stop, len(self)))
+        return stop - self.count_separators(stop)
+
+    def navigable_position(self, k):
+        if k < self._nav_offsets[-1]:
+            j = bisect_right(self._nav_offsets, k) - 1
+            return self._offsets[j] + self._piece_navigable_position(self._pieces[j], k - self._nav_offsets[j])
+        position = self._piece_navigable_position(self._tail_piece(), k - self._nav_offsets[-1])
+        return self._offsets[-1] + position
+
+    def file_line_position(self, number):
+        """
+        Índice entre las líneas de ahora de la línea number del archivo en
+        disco (contando las vacías, como la numeran los índices de búsqueda).
+        Si es vacía o se borró, la siguiente que quede. Espera solo a que el
+        indexado llegue hasta esa línea.
+        """
+        with self._progress:
+            while not self._done.is_set() and (not self._numbers.count or self._numbers.view()[-1] < number):
+                self._progress.wait()
+        x = int(np.searchsorted(self._numbers.view(), number))
+        # Los tramos del archivo siguen en las piezas en su orden original
+        for k, piece in enumerate(self._pieces):
+            if isinstance(piece, tuple) and piece[1] > x:
+                return self._offsets[k] + max(0, x - piece[0])
+        return self._offsets[-1] + max(0, x - self._tail)
+
+    # --- Guardado ---
+
+    def snapshot(self):
+        """
+        Lo necesario para escribir el archivo con las ediciones de ahora
+        (versión, mmap, piezas e índice), para que otro hilo lo escriba
+        mientras se sigue editando. Las piezas no se modifican en su lugar:
+        alcanza con copiar la lista.
+        """
+        self.wait()
+        pieces = self._pieces + ([self._tail_piece()] if self._starts.count > self._tail else [])
+        return (self.version, self._mm, pieces, self._starts.view(), self._ends.view(), self._seps.view(),
+                self._numbers.view())
+
+    def temp_path(self, version=None):
+        """Temporal de un guardado; con la versión, cada foto escribe el suyo."""
+        directory, name = os.path.split(self.path)
+        suffix = f'.{version}' if version is not None else ''
+        return os.path.join(directory, f'.{name}{suffix}.mapped.tmp')
+
+    @staticmethod
+    def write_snapshot(snapshot, tmp_path):
+        """
+        Escribe el archivo nuevo copiando los tramos sin cambios directo del
+        mmap (con sus líneas vacías y espacios originales) y las líneas
+        nuevas, con fsync. De paso arma el índice del archivo escrito
+        (starts, ends, seps, numbers), para no tener que volver a recorrerlo.
+        Puede correr en un hilo de fondo; si falla no deja el temporal.
+        """
+        version, mm, pieces, starts, ends, seps, numbers = snapshot
+        new_starts, new_ends, new_seps, new_numbers = [], [], [], []
+        cursor, count, raw_count = 0, 0, 0   # Bytes, líneas no vacías y líneas escritos
+        try:
+            with open(tmp_path, 'wb') as f:
+                for piece in pieces:
+                    if isinstance(piece, tuple):
+                        a, b = piece
+                        origin, stop = int(starts[a]), int(ends[b - 1])
+                        f.write(mm[origin:stop])
+                        f.write(b'\n')
+                        new_starts.append(starts[a:b] - np.uint64(origin) + np.uint64(cursor))
+                        new_ends.append(ends[a:b] - np.uint64(origin) + np.uint64(cursor))
+                        moved = seps[np.searchsorted(seps, a):np.searchsorted(seps, b)]
+                        new_seps.append(moved - np.uint64(a) + np.uint64(count))
+                        first, last = int(numbers[a]), int(numbers[b - 1])
+                        new_numbers.append(numbers[a:b] - np.uint64(first) + np.uint64(raw_count))
+                        cursor += stop - origin + 1
+                        count += b - a
+                        raw_count += last - first + 1
+                        continue
+                    # Líneas nuevas: las mismas reglas que el indexado (vacías afuera, '.' separa)
+                    added_starts, added_ends, added_seps, added_numbers = [], [], [], []
+                    for line in piece:
+                        data = line.encode('utf-8')
+                        f.write(data + b'\n')
+                        for raw in data.split(b'\n'):
+                            stripped = raw.strip()
+                            if stripped:
+                                if stripped == b'.':
+                                    added_seps.append(count)
+                                added_starts.append(cursor)
+                                added_ends.append(cursor + len(raw))
+                                added_numbers.append(raw_count)
+                                count += 1
+                            cursor += len(raw) + 1
+                            raw_count += 1
+                    new_starts.append(np.array(added_starts, dtype=np.uint64))
+                    new_ends.append(np.array(added_ends, dtype=np.uint64))
+                    new_seps.append(np.array(added_seps, dtype=np.uint64))
+                    new_numbers.append(np.array(added_numbers, dtype=np.uint64))
+                f.flush()
+                os.fsync(f.fileno())
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        def joined(parts):
+            return np.concatenate(parts).astype(np.uint64) if parts else np.zeros(0, dtype=np.uint64)
+        return joined(new_starts), joined(new_ends), joined(new_seps), joined(new_numbers)
+
+    def commit_snapshot(self, snapshot, tmp_path, index):
+        """
+        Reemplaza el archivo por el ya escrito y lo vuelve a mapear con el
+        índice que armó write_snapshot: las líneas son las mismas, así que
+        el ring sigue donde estaba y no hay que reindexar. Si hubo ediciones
+        después de la foto, el temporal ya no sirve: se descarta (quedan
+        pendientes para el próximo guardado). Devuelve si se aplicó.
+        """
+        if snapshot[0] != self.version:
+            os.remove(tmp_path)
+            return False
+        # El mmap tiene que estar cerrado antes de reemplazar el archivo (Windows)
+        self.close()
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+        print(f"💾 {os.path.basename(self.path)}: ediciones volcadas al archivo")
+        self._map(index)
+        return True
+
+    def save(self):
+        """Vuelca las ediciones en el acto: escribe el temporal, reemplaza y vuelve a mapear."""
+        if not self.dirty:
+            return
+        snapshot, tmp_path = self.snapshot(), self.temp_path()
+        self.commit_snapshot(snapshot, tmp_path, self.write_snapshot(snapshot, tmp_path))
@@ -1,21 +1,44 @@
 # new_interface.py - App principal con sistema de 3 vistas sincronizadas
+import bisect
 import os
 import sys
 from PyQt6.QtWidgets import QApplication, QMainWindow, QStackedWidget
 from PyQt6.QtGui import QFont, QCursor
-from PyQt6.QtCore import Qt
-
-from files import setup_file_handling, void_line
-from controls import setup_controls, show_previous_current_file_line, show_next_current_file_line
+from PyQt6.QtCore import Qt, pyqtSignal
+
+from files import setup_file_handling, void_line, show_search_command_results
+from document import open_document, close_documents, set_mapped_saver
+from corpus_index import open_corpus_index, close_corpus_indexes
+from search_index import open_search_index, SearchFinder
+from fuzzy_index import open_fuzzy_index, FuzzyFinder, MIN_QUERY_CHARS
+from related_index import open_related_index, close_related_indexes, RelatedFinder
+from watcher import VoidWatcher, ADDED, REMOVED, MODIFIED
+from controls import (setup_controls, show_previous_current_file_line, show_next_current_file_line,
+                      show_related_results)
 from noise_controls import NoiseController
-from line_ring import LineRing
+from line_ring import LineRing, SubRing
+from mapped_lines import MappedLines
+from saver import BackgroundSaver
 from circular_view import CircularView
 from widgets import CustomLineEdit, NoiseOverlay
 from views import NormalView, VersesView, sync_ring_with_file
 
+PAGE_LINES = 10  # PageUp/PageDown: líneas navegables por salto
+
 
 class FullscreenCircleApp(QMainWindow):
     """Aplicación principal fullscreen con 3 vistas (F1/F2/F3) sincronizadas"""
+
+    # (tipo, ruta) desde el hilo del watcher; Qt lo entrega en el hilo de la interfaz
+    file_event = pyqtSignal(str, str)
+    # (generación, texto, resultados) desde el hilo de la búsqueda aproximada
+    fuzzy_results = pyqtSignal(int, str, object)
+    # (generación, texto, resultados) desde el hilo de las líneas relacionadas (Ctrl+R)
+    related_results = pyqtSignal(int, str, object)
+    # (generación, texto, resultados) desde el hilo de la búsqueda ?término
+    search_results = pyqtSignal(int, str, object)
+    # Avance del índice de líneas de un archivo mapeado (desde su hilo)
+    ring_indexed = pyqtSignal()
     
     def __init__(self, read_dir=None, void_dir=None, file_to_open=None):
         super().__init__()
@@ -60,6 +83,27 @@ class FullscreenCircleApp(QMainWindow):
 
         # Ring de líneas (estructura de datos central)
         self.line_ring = LineRing()
+        self.ring_sync_key = None  # (archivo, versión del documento) con que se armó el ring
+        self.watcher = None
+        # Volcado de los archivos mapeados: agrupa ráfagas de ediciones de F2 en una escritura de fondo
+        self.saver = BackgroundSaver(parent=self)
+        self.saver.failed.connect(self.on_save_failed)
+        self._mapped_save = None  # (ruta, versión) del último volcado pedido al saver
+
+        # Búsqueda (?término): resultados en un ring de solo lectura que F2 muestra
+        # en lugar del ring del archivo, que queda guardado hasta salir de la búsqueda
+        self.search_ring = None
+        self.search_sources = []   # (ruta, número de línea) de cada resultado
+        self._file_ring = None
+
+        # Loop de un bloque (F3 → Enter): sub-ring sobre el ring del archivo, solo en F2
+        self.block_ring = None
+
+        # Búsqueda aproximada mientras se escribe en F1: candidatos que NormalView dibuja
+        self.fuzzy_finder = None
+        self.related_finder = None
+        self.search_finder = None
+        self.fuzzy_matches = []    # [(ruta relativa, número de línea, texto)]
 
         # Stack de vistas
         self.stack = QStackedWidget()
@@ -84,6 +128,11 @@ class FullscreenCircleApp(QMainWindow):
         self.switch_to_view(0)
         self.entry.clear()
 
+    @property
+    def document(self):
+        """Documento residente del archivo activo (líneas + cursor de inserción)"""
+        return open_document(self.current_file_path)
+
     def _print_void_mode_status(self):
         """Imprime el modo de void actual"""
         print("VOID MODE:", "Spacebar" if self.use_spacebar_for_void else "Enter")
@@ -124,10 +173,25 @@ class FullscreenCircleApp(QMainWindow):
         """
         old_view = self.current_view
         self.current_view = view_index
+        if self.circular_view:
+            # Un desplazamiento animado a medio camino termina antes de cambiar de vista o de ring
+            self.circular_view.settle()
+        self.flush_mapped_ring(wait=False)
+
+        searching = self.search_ring is not None and self.line_ring is self.search_ring
+        if searching and view_index != 1:
+            # Los resultados de búsqueda solo se ven en F2
+            self._leave_search()
+            searching = False
+        looping = self.block_ring is not None and self.line_ring is self.block_ring
+        if looping and view_index != 1:
+            self._leave_block_loop()
+            looping = False
         
         # SIEMPRE sincronizar ring con archivo cuando cambias de vista
         # Esto asegura que F2/F3 vean los cambios hechos en F1
-        sync_ring_with_file(self)
+        if not searching and not looping:
+            sync_ring_with_file(self)
         
         print(f"📍 F{old_view+1} → F{view_index+1} | Índice: {self.line_ring.index} | Línea: '{self.line_ring.current()}'")
 
@@ -167,8 +231,9 @@ class FullscreenCircleApp(QMainWindow):
                 # Actualizar referencia al ring (mantiene índice)
                 self.verses_view.ring = self.line_ring
 
-            verses = self.verses_view.calculate_verses()
-            verse_idx = self.verses_view.find_current_verse()
+            self.verses_view.recalculate_verses_if_needed()
+            verses = self.verses_view.verses
+            verse_idx = self.verses_view.current_verse_index
             print(f"   └─ Verso {verse_idx+1}/{len(verses)}")
 
             self.stack.setCurrentWidget(self.verses_view)
@@ -176,17 +241,130 @@ class FullscreenCircleApp(QMainWindow):
             self.verses_view.setFocus()
             self.verses_view.update()
 
+    def show_search_results(self, query, results):
+        """Muestra en F2 los resultados de ?término como un ring navegable de solo lectura"""
+        if self.search_ring is None or self.line_ring is not self.search_ring:
+            self._file_ring = self.line_ring
+        self.search_ring = LineRing([text for rel, number, text in results], read_only=True)
+        self.search_sources = [(os.path.join(self.void_dir, rel), number) for rel, number, text in results]
+        self.line_ring = self.search_ring
+        print(f"🔎 F2: {len(results)} resultados para '{query}' (Enter abre el archivo, Esc sale)")
+        self.switch_to_view(1)
+
+    def _leave_search(self):
+        if self.search_ring is not None and self.line_ring is self.search_ring:
+            self.line_ring = self._file_ring or LineRing()
+        self.search_ring = None
+        self.search_sources = []
+        self._file_ring = None
+
+    def loop_current_block(self):
+        """F3 → Enter: F2 recorre en loop solo el bloque actual (sin copiar sus líneas)"""
+        self.verses_view.recalculate_verses_if_needed()
+        verse = self.verses_view.verses[self.verses_view.current_verse_index]
+        if verse['end'] < verse['start']:
+            self.switch_to_view(1)
+            return
+        self.block_ring = SubRing(self.line_ring, verse['start'], verse['end'] + 1)
+        self.line_ring = self.block_ring
+        print(f"🔁 F3→F2: Loop del bloque {self.verses_view.current_verse_index + 1} "
+              f"(líneas {verse['start']}-{verse['end']})")
+        self.switch_to_view(1)
+
+    def _leave_block_loop(self):
+        """El ring del archivo vuelve a ser el actual, en la línea donde quedó el loop"""
+        if self.block_ring is not None and self.line_ring is self.block_ring:
+            self.block_ring.parent.index = self.block_ring.index
+            self.line_ring = self.block_ring.parent
+        self.block_ring = None
+
+    def open_search_result(self):
+        """Enter sobre un resultado: abre su archivo en F2 con esa línea como actual"""
+        self.circular_view.settle()
+        path, number = self.search_sources[self.line_ring.index]
+        self._leave_search()
+        if path not in self.txt_files:
+            bisect.insort(self.txt_files, path)
+        self.switch_to_file(path)
+        # El ring tiene solo las líneas no vacías: el documento traduce el número de línea
+        ring_index = self.document.ring_position(number)
+        self.line_ring.index = min(ring_index, len(self.line_ring.lines) - 1)
+        self.switch_to_view(1)
+
     def auto_save_circular(self):
         """Guarda cambios desde F2 sin recargar"""
+        if isinstance(self.line_ring.lines, MappedLines):
+            # Archivo mapeado: reescribirlo entero es caro, una ráfaga de ediciones se vuelca una vez
+            self.schedule_mapped_save()
+            print(f"📝 Edición en memoria (índice={self.line_ring.index}), guardado en segundo plano")
+            return
         try:
-            with open(self.current_file_path, 'w', encoding='utf-8') as f:
-                for line in self.line_ring.lines:
-                    f.write(line + '\n')
+            doc = self.document
+            edit = self.circular_view.last_edit if self.circular_view else None
+            # El ring solo tiene las líneas no vacías del archivo: traducir su índice al del documento
+            doc_index = doc.position_of_nonblank(edit[1]) if edit else None
+            if doc_index is None:
+                doc.replace_all(self.line_ring.lines)
+            elif edit[0] == 'insert':
+                doc.insert(doc_index + 1, [edit[2]])
+            else:
+                doc.replace(doc_index, [edit[2]])
             print(f"💾 Guardado desde F2 (índice={self.line_ring.index})")
             # NO resincronizar - el ring ya tiene los cambios correctos
+            self.ring_sync_key = (doc.path, id(doc), doc.version)
         except Exception as e:
             print(f"❌ Error al guardar: {e}")
 
+    def schedule_mapped_save(self, delay=None, lines=None):
+        """
+        Programa el volcado de un archivo mapeado (por defecto, el del ring):
+        el archivo nuevo se escribe en el hilo del saver y solo el reemplazo
+        vuelve a este hilo. Cada edición reemplaza al guardado pendiente, así
+        que si hubo otra después de la foto el guardado viejo se descarta y
+        queda el nuevo.
+        """
+        if lines is None:
+            lines = self.line_ring.lines if self.line_ring else None
+        if not isinstance(lines, MappedLines) or not lines.dirty or not lines.indexed:
+            return  # Sin indexar todavía: se vuelca con flush_mapped_ring
+        if self._mapped_save == (lines.path, lines.version) and self.saver.writing(lines.path):
+            return  # Esta misma versión ya se está escribiendo
+        snapshot = lines.snapshot()
+        tmp_path = lines.temp_path(snapshot[0])
+        self._mapped_save = (lines.path, snapshot[0])
+
+        def commit(index):
+            if lines.commit_snapshot(snapshot, tmp_path, index) and self.line_ring and self.line_ring.lines is lines:
+                self.ring_sync_key = (lines.path, 'mapped', tuple(lines.fp))
+
+        self.saver.request(lines.path, lambda: MappedLines.write_snapshot(snapshot, tmp_path), commit, delay)
+
+    def flush_mapped_ring(self, wait=True):
+        """Vuelca al archivo las ediciones del ring mapeado (si las hay)"""
+        lines = self.line_ring.lines if self.line_ring else None
+        if not isinstance(lines, MappedLines):
+            return
+        if not wait:
+            self.schedule_mapped_save(delay=0)
+            return
+        self.saver.flush(lines.path)
+        if not lines.dirty:
+            return
+        try:
+            lines.save()
+            self.ring_sync_key = (lines.path, 'mapped', tuple(lines.fp))
+        except Exception as e:
+            print(f"❌ Error al volcar las ediciones: {e}")
+
+    def on_save_failed(self, path, error):
+        """Un guardado en segundo plano falló: las ediciones siguen en memoria"""
+        print(f"❌ Error al guardar {os.path.basename(path)}: {error}")
+
+    def on_ring_indexed(self):
+        """El índice del archivo mapeado avanzó: F2/F3 pueden mostrar más líneas"""
+        if self.current_view != 0:
+            self.stack.currentWidget().update()
+
     def setup_voider_logic(self):
         """Inicializa la lógica de voider (archivos, controles)"""
         self.current_file_path = self.file_to_open or os.path.join(self.void_dir, '0.txt')
@@ -194,6 +372,24 @@ class FullscreenCircleApp(QMainWindow):
         self.scan_txt_files()
         setup_file_handling(self)
         setup_controls(self)
+        # Las ediciones de F1 en un archivo mapeado se vuelcan con el mismo guardado que las de F2
+        set_mapped_saver(lambda lines: self.schedule_mapped_save(lines=lines))
+        # Cambios en void_dir (de otras herramientas u otra instancia) llegan como eventos
+        self.file_event.connect(self.on_file_event)
+        self.ring_indexed.connect(self.on_ring_indexed)
+        self.watcher = VoidWatcher(self.void_dir, self.file_event.emit).start()
+        # El índice de búsqueda (?término) se arma en segundo plano desde el inicio; las
+        # búsquedas (y la espera a ese armado) corren en el hilo de search_finder
+        self.search_results.connect(lambda *result: show_search_command_results(self, *result))
+        self.search_finder = SearchFinder(open_search_index(self.void_dir), self.search_results.emit)
+        # Líneas relacionadas (Ctrl+R): la matriz guardada se abre con mmap, o se arma en segundo plano
+        self.related_results.connect(lambda *result: show_related_results(self, *result))
+        self.related_finder = RelatedFinder(open_related_index(self.void_dir), self.related_results.emit)
+        # Búsqueda aproximada en F1: el texto tipeado se consulta fuera del hilo de la interfaz
+        self.fuzzy_results.connect(self.on_fuzzy_results)
+        self.fuzzy_finder = FuzzyFinder(open_fuzzy_index(self.void_dir), self.fuzzy_results.emit)
+        self.entry.textEdited.connect(self.on_entry_edited)
+        self.entry.textChanged.connect(self.on_entry_changed)
 
     def scan_txt_files(self):
         """Escanea archivos .txt en el directorio void"""
@@ -212,8 +408,85 @@ class FullscreenCircleApp(QMainWindow):
             self.txt_files.sort()
             self.current_file_index = self.txt_files.index(self.current_file_path)
 
+    def on_file_event(self, kind, path):
+        """Aplica un evento del watcher: índice de líneas, lista de archivos y ring visible."""
+        open_corpus_index(self.void_dir).note_change(path)
+        open_search_index(self.void_dir).note_change(path)
+        open_fuzzy_index(self.void_dir).note_change(path)
+        open_related_index(self.void_dir).note_change(path)
+
+        # Lista de archivos para Alt+Up/Down (solo la carpeta del archivo actual)
+        if os.path.dirname(os.path.abspath(path)) == os.path.dirname(os.path.abspath(self.current_file_path)):
+            path = os.path.join(os.path.dirname(self.current_file_path), os.path.basename(path))
+            if kind == ADDED and path not in self.txt_files:
+                bisect.insort(self.txt_files, path)
+            elif kind == REMOVED and path in self.txt_files and path != self.current_file_path:
+                self.txt_files.remove(path)
+            if self.current_file_path in self.txt_files:
+                self.current_file_index = self.txt_files.index(self.current_file_path)
+
+        # El archivo actual cambió por fuera: actualizar el ring si F2/F3 lo están mostrando
+        if kind == MODIFIED and os.path.abspath(path) == os.path.abspath(self.current_file_path):
+            if self.current_view == 0 or self.line_ring in (self.search_ring, self.block_ring):
+                return
+            if self.circular_view and self.circular_view.edit_mode:
+                return
+            ring = self.line_ring
+            sync_ring_with_file(self)
+            if self.line_ring is not ring:
+                if self.circular_view:
+                    self.circular_view.ring = self.line_ring
+                if self.verses_view:
+                    self.verses_view.ring = self.line_ring
+                self.stack.currentWidget().update()
+
+    def on_entry_edited(self, text):
+        """F1: cada tecla manda el texto a la búsqueda aproximada (los comandos no)"""
+        if self.related_finder:
+            # Un Ctrl+R en curso ya no corresponde a lo tipeado
+            self.related_finder.cancel()
+        if self.search_finder:
+            # Ni una búsqueda ?término que todavía no llegó a F2
+            self.search_finder.cancel()
+        query = text.strip()
+        if len(query) < MIN_QUERY_CHARS or query.startswith(('?', '/')):
+            self._clear_fuzzy()
+            return
+        self.fuzzy_finder.submit(query)
+
+    def on_entry_changed(self, text):
+        # setText/clear (navegación, void) no son tipeo: los candidatos dejan de valer
+        if not self.entry.isModified():
+            self._clear_fuzzy()
+
+    def _clear_fuzzy(self):
+        if self.fuzzy_finder:
+            self.fuzzy_finder.cancel()
+        if self.fuzzy_matches:
+            self.fuzzy_matches = []
+            self.normal_view.update()
+
+    def on_fuzzy_results(self, generation, text, results):
+        """Resultados de la búsqueda aproximada; los de una consulta vieja se descartan"""
+        if generation != self.fuzzy_finder.generation:
+            return
+        self.fuzzy_matches = results
+        self.normal_view.update()
+
+    def show_fuzzy_results(self):
+        """Ctrl+Enter en F1: los candidatos de la búsqueda aproximada se abren en F2"""
+        if not self.fuzzy_matches:
+            return
+        query = self.entry.text().strip()
+        results = self.fuzzy_matches
+        self.entry.clear()
+        self.show_search_results(query, results)
+
     def switch_to_file(self, file_path):
         """Cambia al archivo especificado y resetea índice al inicio"""
+        self._leave_search()
+        self._leave_block_loop()
+        self.flush_mapped_ring()
         if not os.path.exists(file_path):
             with open(file_path, 'w', encoding='utf-8') as f:
                 f.write('')
@@ -263,6 +536,23 @@ class FullscreenCircleApp(QMainWindow):
         self.noise_overlay.show()
         self.noise_overlay.raise_()
 
+    def closeEvent(self, event):
+        """Al salir, vuelca el journal pendiente a los .txt y cierra los índices"""
+        if self.watcher:
+            self.watcher.stop()
+        if self.fuzzy_finder:
+            self.fuzzy_finder.stop()
+        if self.related_finder:
+            self.related_finder.stop()
+        if self.search_finder:
+            self.search_finder.stop()
+        self.flush_mapped_ring()
+        self.saver.stop()
+        close_documents()
+        close_corpus_indexes()
+        close_related_indexes()
+        super().closeEvent(event)
+
     def resizeEvent(self, event):
         """Maneja redimensionamiento de ventana"""
         super().resizeEvent(event)
@@ -334,6 +624,11 @@ class FullscreenCircleApp(QMainWindow):
             self.entry.setText(self.line_ring.current())
             self.entry.setCursorPosition(0)
             print(f"⬇️ F1: Índice={self.line_ring.index}")
+        elif key in (Qt.Key.Key_PageUp, Qt.Key.Key_PageDown):
+            self.line_ring.move(-PAGE_LINES if key == Qt.Key.Key_PageUp else PAGE_LINES)
+            self.entry.setText(self.line_ring.current())
+            self.entry.setCursorPosition(0)
+            print(f"⏭️ F1: Índice={self.line_ring.index}")
 
     def _handle_f2_keys(self, key, modifiers, event):
         """Manejo de teclas en vista F2"""
@@ -350,10 +645,17 @@ class FullscreenCircleApp(QMainWindow):
                 self.circular_view.animate_move(1)
                 print(f"⬇️ F2: Índice={self.line_ring.index}")
                 event.accept()
+            elif key in (Qt.Key.Key_PageUp, Qt.Key.Key_PageDown):
+                self.circular_view.animate_move(-PAGE_LINES if key == Qt.Key.Key_PageUp else PAGE_LINES)
+                print(f"⏭️ F2: Índice={self.line_ring.index}")
+                event.accept()
             elif key == Qt.Key.Key_Return or key == Qt.Key.Key_Enter:
                 # Enter → Insertar línea debajo
                 # Shift+Enter → Editar línea actual
-                if modifiers & Qt.KeyboardModifier.ShiftModifier:
+                # En resultados de búsqueda: Enter → abrir el archivo en esa línea
+                if self.line_ring.read_only:
+                    self.open_search_result()
+                elif modifiers & Qt.KeyboardModifier.ShiftModifier:
                     self.circular_view.enter_edit_mode()
                     print("✏️ F2: Editando línea actual")
                 else:
@@ -385,35 +687,37 @@ class FullscreenCircleApp(QMainWindow):
         
         # Up/Down: Navegar BLOQUES (no líneas individuales)
         elif key == Qt.Key.Key_Up:
-            verses = self.verses_view.calculate_verses()
+            # Versos cacheados (se recalculan solo si cambiaron los separadores)
+            self.verses_view.recalculate_verses_if_needed()
+            verses = self.verses_view.verses
             if not verses:
                 return
             
-            current = self.verses_view.find_current_verse()
+            current = self.verses_view.current_verse_index
             new_verse = (current - 1) % len(verses)
             
-            # Mover índice al INICIO del bloque anterior
-            self.line_ring.index = verses[new_verse]['start']
-            self.verses_view.update()
+            # Mover índice al INICIO del bloque anterior (con animación)
+            self.verses_view.animate_to_verse(new_verse)
             print(f"⬆️ F3: Bloque {new_verse+1}/{len(verses)} | Índice={self.line_ring.index}")
             
         elif key == Qt.Key.Key_Down:
-            verses = self.verses_view.calculate_verses()
+            # Versos cacheados (se recalculan solo si cambiaron los separadores)
+            self.verses_view.recalculate_verses_if_needed()
+            verses = self.verses_view.verses
             if not verses:
                 return
             
-            current = self.verses_view.find_current_verse()
+            current = self.verses_view.current_verse_index
             new_verse = (current + 1) % len(verses)
             
-            # Mover índice al INICIO del bloque siguiente
-            self.line_ring.index = verses[new_verse]['start']
-            self.verses_view.update()
+            # Mover índice al INICIO del bloque siguiente (con animación)
+            self.verses_view.animate_to_verse(new_verse)
             print(f"⬇️ F3: Bloque {new_verse+1}/{len(verses)} | Índice={self.line_ring.index}")
         
-        # Enter: Ir a F2 para editar la línea actual
+        # Enter: Ir a F2 loopeando solo el bloque actual (Esc en F2 vuelve al archivo entero)
         elif key == Qt.Key.Key_Return or key == Qt.Key.Key_Enter:
             print(f"↩️ F3→F2: Editando índice={self.line_ring.index}")
-            self.switch_to_view(1)
+            self.loop_current_block()
 
 
 if __name__ == '__main__':
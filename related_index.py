@@ -0,0 +1,603 @@
+# related_index.py - Líneas relacionadas: TF-IDF disperso sobre todo el corpus void, en NumPy
+import json
+import os
+import shutil
+import threading
+from collections import Counter
+
+import numpy as np
+
+from journal import file_fingerprint
+from search_index import fold, tokenize, _TOKEN_RE
+
+INDEX_DIR = '.void_related'
+META_NAME = 'meta.json'
+MAX_RELATED = 8
+TAIL_BYTES = 64            # Bytes finales que se recuerdan de cada archivo para detectar appends
+COMPACT_MIN_ROWS = 50_000  # El delta se funde con la base al superar esto (o el 10% de la base)
+COMMON_FRACTION = 0.05     # Un término en más de esta fracción de las filas es común (no aporta candidatos)
+COMMON_MIN_ROWS = 1000
+
+# Una fila por línea válida: archivo (id en la tabla del meta) y offset en bytes
+ROW_DTYPE = np.dtype([('file', '<u4'), ('offset', '<u8')])
+
+
+def _empty(dtype):
+    return np.zeros(0, dtype=dtype)
+
+
+class _Segment:
+    """Términos de un tramo de archivo en forma COO: (término, fila local, tf) y offsets de las filas."""
+
+    __slots__ = ('offsets', 'rows', 'terms', 'tf')
+
+    def __init__(self, offsets, rows, terms, tf):
+        self.offsets = np.array(offsets, dtype='<u8')
+        self.rows = np.array(rows, dtype='<u4')
+        self.terms = np.array(terms, dtype='<u4')
+        self.tf = np.array(tf, dtype='<u2')
+
+
+def scan_terms(path, vocab, start=0):
+    """
+    Lee path desde el byte start y tokeniza cada línea válida (no vacía y que
+    no es solo '.'). Los términos nuevos se agregan a vocab.
+    Devuelve (_Segment, tamaño del archivo, últimos TAIL_BYTES bytes leídos).
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read()
+    folded = fold(data.decode('utf-8', errors='replace')).split('\n')
+    offsets, rows, terms, tf = [], [], [], []
+    pos = start
+    for number, raw in enumerate(data.split(b'\n')):
+        stripped = raw.strip()
+        if stripped and stripped != b'.':
+            counts = Counter(_TOKEN_RE.findall(folded[number]))
+            if counts:
+                row = len(offsets)
+                offsets.append(pos)
+                for token, count in counts.items():
+                    term = vocab.get(token)
+                    if term is None:
+                        term = vocab[token] = len(vocab)
+                    rows.append(row)
+                    terms.append(term)
+                    tf.append(min(count, 0xFFFF))
+        pos += len(raw) + 1
+    return _Segment(offsets, rows, terms, tf), start + len(data), data[-TAIL_BYTES:]
+
+
+class RelatedIndex:
+    """
+    Matriz TF-IDF dispersa de todas las líneas válidas de los .txt de void_dir
+    (con subcarpetas), para traer las líneas más parecidas a un texto.
+
+    La matriz se guarda por columnas (término -> filas y tf, como un índice
+    invertido) en .npy que se abren con mmap: al iniciar no se rearma. Lo que
+    cambia después va a un delta en memoria: si un archivo solo creció (lo
+    habitual al hacer void de una línea), se tokeniza únicamente lo agregado;
+    si cambió de otra forma, sus filas viejas se marcan como muertas y se
+    vuelve a leer entero. Cuando el delta crece, se funde con la base y se
+    guarda.
+
+    Una consulta suma tf * idf² de las columnas de sus términos (bincount sobre
+    las filas) y divide por la norma de cada fila: similitud coseno sin
+    recorrer las filas que no comparten ningún término.
+    """
+
+    def __init__(self, void_dir):
+        self.void_dir = void_dir
+        self.dir_path = os.path.join(void_dir, INDEX_DIR)
+        self.vocab = {}          # término -> id
+        self.files = {}          # ruta relativa -> [id, huella, tamaño, cola en hex]
+        self.file_names = []     # id -> ruta relativa
+        self.watched = False
+        self._pending = set()
+        self._pending_lock = threading.Lock()  # Solo cuida _pending: el hilo de la interfaz nunca toma _lock
+        self._dir_fp = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._compacting = False
+        self._reset()
+
+    def _reset(self):
+        # Base (mmap o resultado de la última compactación)
+        self.rows = _empty(ROW_DTYPE)
+        self.norms = _empty('<f4')
+        self.term_ptr = np.zeros(1, dtype='<u8')
+        self.post_rows = _empty('<u4')
+        self.post_tf = _empty('<u2')
+        # Delta en memoria
+        self._delta_rows = []    # arreglos ROW_DTYPE
+        self._delta_norms = []
+        self._delta_coo = []     # (términos, filas globales, tf)
+        self._delta_cache = None
+        # Comunes
+        self.df = _empty('<u4')
+        self.alive = np.ones(0, dtype=bool)
+
+    def __len__(self):
+        return len(self.alive)
+
+    # --- Persistencia ---
+
+    def _path(self, name):
+        return os.path.join(self.dir_path, name)
+
+    def load(self):
+        """Abre la matriz guardada (si existe) con mmap."""
+        self._reset()
+        self.vocab, self.files, self.file_names = {}, {}, []
+        try:
+            with open(self._path(META_NAME), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            arrays = {name: np.load(self._path(name + '.npy'), mmap_mode='r')
+                      for name in ('rows', 'norms', 'term_ptr', 'post_rows', 'post_tf')}
+            vocab, file_names, file_meta = meta['vocab'], meta['file_names'], meta['files']
+        except (OSError, ValueError, KeyError):
+            return False
+        n = len(arrays['rows'])
+        nnz = len(arrays['post_rows'])
+        if (len(arrays['norms']) != n or len(arrays['term_ptr']) != len(vocab) + 1
+                or int(arrays['term_ptr'][-1]) != nnz or len(arrays['post_tf']) != nnz):
+            print("⚠️ Índice de líneas relacionadas inconsistente, se reconstruye.")
+            return False
+        self.vocab = {term: i for i, term in enumerate(vocab)}
+        self.file_names = file_names
+        ids = {rel: i for i, rel in enumerate(file_names)}
+        self.files = {rel: [ids[rel]] + entry for rel, entry in file_meta.items()}
+        self.rows, self.norms = arrays['rows'], arrays['norms']
+        self.term_ptr, self.post_rows, self.post_tf = arrays['term_ptr'], arrays['post_rows'], arrays['post_tf']
+        self.df = np.diff(self.term_ptr).astype('<u4')
+        self.alive = np.ones(n, dtype=bool)
+        return True
+
+    def save(self):
+        """Funde el delta con la base y guarda todo de forma atómica (directorio temporal + rename)."""
+        self.compact()
+        tmp_dir = self.dir_path + '.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for name in ('rows', 'norms', 'term_ptr', 'post_rows', 'post_tf'):
+            np.save(os.path.join(tmp_dir, name + '.npy'), np.asarray(getattr(self, name)))
+        vocab = [None] * len(self.vocab)
+        for term, i in self.vocab.items():
+            vocab[i] = term
+        meta = {'vocab': vocab, 'file_names': self.file_names,
+                'files': {rel: entry[1:] for rel, entry in self.files.items()}}
+        with open(os.path.join(tmp_dir, META_NAME), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        old_dir = self.dir_path + '.old'
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(self.dir_path):
+            os.replace(self.dir_path, old_dir)
+        os.replace(tmp_dir, self.dir_path)
+        shutil.rmtree(old_dir, ignore_errors=True)
+        self._dir_fp = file_fingerprint(self.void_dir)
+
+    # --- Construcción y actualización ---
+
+    def start(self):
+        threading.Thread(target=self._build, name="void-related-index", daemon=True).start()
+        return self
+
+    def _build(self):
+        try:
+            with self._lock:
+                loaded = self.load()
+                changed = self._refresh_all()
+                if changed or not loaded:
+                    self.save()
+            print(f"🧭 Índice de líneas relacionadas: {len(self)} líneas, {len(self.vocab)} términos")
+        except Exception as e:
+            print(f"❌ Error armando el índice de líneas relacionadas: {e}")
+        finally:
+            self._ready.set()
+
+    def _refresh_all(self):
+        self._dir_fp = file_fingerprint(self.void_dir)
+        current = set()
+        for root, dirs, names in os.walk(self.void_dir):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for name in names:
+                if name.lower().endswith('.txt') and not name.startswith('.'):
+                    current.add(os.path.relpath(os.path.join(root, name), self.void_dir))
+        changed = False
+        for rel in set(self.files) - current:
+            changed = self._refresh_file(rel) or changed
+        for rel in current:
+            changed = self._refresh_file(rel) or changed
+        return changed
+
+    def _refresh_file(self, rel):
+        """Pone al día las filas de un archivo. Devuelve True si cambió algo."""
+        entry = self.files.get(rel)
+        path = os.path.join(self.void_dir, rel)
+        fp = file_fingerprint(path)
+        if entry is not None and entry[1] == fp:
+            return False
+        if fp is None:
+            if entry is None:
+                return False
+            self._kill_file(entry[0])
+            del self.files[rel]
+            return True
+
+        start = 0
+        if entry is not None:
+            start = self._appended_from(path, entry)
+            if start == 0:
+                self._kill_file(entry[0])
+            file_id = entry[0]
+        else:
+            file_id = len(self.file_names)
+            self.file_names.append(rel)
+        try:
+            segment, size, tail = scan_terms(path, self.vocab, start)
+        except OSError:
+            if entry is not None:
+                self._kill_file(entry[0])
+                del self.files[rel]
+            return True
+        if start:
+            # Si se agregó poco, la cola nueva incluye parte de la vieja
+            tail = (bytes.fromhex(entry[3]) + tail)[-TAIL_BYTES:]
+        self._add_segment(file_id, segment)
+        self.files[rel] = [file_id, fp, size, tail.hex()]
+        return True
+
+    @staticmethod
+    def _read_range(path, start, stop):
+        with open(path, 'rb') as f:
+            f.seek(start)
+            return f.read(stop - start)
+
+    def _appended_from(self, path, entry):
+        """
+        Si el archivo solo creció desde que se indexó (lo viejo sigue intacto y
+        terminaba en salto de línea), devuelve el byte desde donde leer; si no, 0.
+        """
+        file_id, fp, size, tail = entry
+        tail = bytes.fromhex(tail)
+        if not size or not tail.endswith(b'\n'):
+            return 0
+        try:
+            if os.path.getsize(path) <= size or self._read_range(path, size - len(tail), size) != tail:
+                return 0
+        except OSError:
+            return 0
+        return size
+
+    def _kill_file(self, file_id):
+        rows = self._all_rows()
+        self.alive[rows['file'] == file_id] = False
+
+    def _add_segment(self, file_id, segment):
+        if not len(segment.offsets):
+            return
+        base = len(self)
+        rows = np.empty(len(segment.offsets), dtype=ROW_DTYPE)
+        rows['file'] = file_id
+        rows['offset'] = segment.offsets
+        global_rows = (segment.rows + base).astype('<u4')
+
+        # df crece con el vocabulario; las filas muertas no se descuentan hasta compactar
+        if len(self.df) < len(self.vocab):
+            self.df = np.concatenate((self.df, np.zeros(len(self.vocab) - len(self.df), dtype='<u4')))
+        np.add.at(self.df, segment.terms, 1)
+        self.alive = np.concatenate((self.alive, np.ones(len(rows), dtype=bool)))
+
+        idf = self._idf(segment.terms)
+        weights = (segment.tf * idf) ** 2
+        norms = np.sqrt(np.bincount(segment.rows, weights=weights, minlength=len(rows))).astype('<f4')
+
+        self._delta_rows.append(rows)
+        self._delta_norms.append(norms)
+        self._delta_coo.append((segment.terms, global_rows, segment.tf))
+        self._delta_cache = None
+
+    def _idf(self, terms):
+        return np.log((len(self) + 1) / (self.df[terms].astype(np.float64) + 1)) + 1
+
+    def _all_rows(self):
+        if not self._delta_rows:
+            return self.rows
+        return np.concatenate([self.rows] + self._delta_rows)
+
+    def _delta(self):
+        """Delta concatenado (términos, filas, tf), cacheado hasta el próximo cambio."""
+        if self._delta_cache is None:
+            if self._delta_coo:
+                self._delta_cache = tuple(np.concatenate(parts) for parts in zip(*self._delta_coo))
+            else:
+                self._delta_cache = (_empty('<u4'), _empty('<u4'), _empty('<u2'))
+        return self._delta_cache
+
+    def compact(self):
+        """Funde base y delta en una matriz por columnas nueva, sin las filas muertas."""
+        if not self._delta_coo and self.alive.all():
+            return
+        # Base en COO: el término de cada entrada sale de los punteros de columna
+        base_terms = np.repeat(np.arange(len(self.term_ptr) - 1, dtype='<u4'), np.diff(self.term_ptr).astype(np.int64))
+        delta_terms, delta_rows, delta_tf = self._delta()
+        terms = np.concatenate((base_terms, delta_terms))
+        rows = np.concatenate((np.asarray(self.post_rows), delta_rows))
+        tf = np.concatenate((np.asarray(self.post_tf), delta_tf))
+        table = self._all_rows()
+
+        # Renumerar filas vivas y archivos que siguen existiendo
+        keep = self.alive[rows]
+        terms, rows, tf = terms[keep], rows[keep], tf[keep]
+        new_row = np.cumsum(self.alive) - 1
+        rows = new_row[rows].astype('<u4')
+        table = table[self.alive]
+
+        live_names = sorted(self.files)
+        remap = np.zeros(max(len(self.file_names), 1), dtype='<u4')
+        for new_id, rel in enumerate(live_names):
+            remap[self.files[rel][0]] = new_id
+            self.files[rel][0] = new_id
+        table = table.copy()
+        table['file'] = remap[table['file']]
+        self.file_names = live_names
+
+        order = np.argsort(terms, kind='stable')
+        self.post_rows, self.post_tf = rows[order], tf[order]
+        counts = np.bincount(terms, minlength=len(self.vocab))
+        self.term_ptr = np.concatenate(([0], np.cumsum(counts))).astype('<u8')
+        self.df = counts.astype('<u4')
+        self.rows = table
+        self.alive = np.ones(len(table), dtype=bool)
+        self._delta_rows, self._delta_norms, self._delta_coo, self._delta_cache = [], [], [], None
+
+        idf = self._idf(terms)
+        self.norms = np.sqrt(np.bincount(rows, weights=(tf * idf) ** 2, minlength=len(table))).astype('<f4')
+
+    def note_change(self, path):
+        """Evento del watcher: path se creó, cambió o se borró."""
+        self.watched = True
+        rel = os.path.relpath(path, self.void_dir)
+        if rel.lower().endswith('.txt'):
+            with self._pending_lock:
+                self._pending.add(rel)
+
+    def _sync(self, also=()):
+        with self._pending_lock:
+            pending, self._pending = self._pending, set()
+        if not self.watched and file_fingerprint(self.void_dir) != self._dir_fp:
+            self._refresh_all()
+        else:
+            for rel in pending | set(also):
+                self._refresh_file(rel)
+        delta = sum(len(rows) for rows in self._delta_rows)
+        if delta > max(COMPACT_MIN_ROWS, len(self.rows) // 10) and not self._compacting:
+            # Compactar y guardar es caro: en su propio hilo, no en la consulta
+            self._compacting = True
+            threading.Thread(target=self._compact, name="void-related-compact", daemon=True).start()
+
+    def _compact(self):
+        try:
+            with self._lock:
+                self.save()
+        except Exception as e:
+            print(f"❌ Error guardando el índice de líneas relacionadas: {e}")
+        finally:
+            self._compacting = False
+
+    # --- Consulta ---
+
+    def _norm(self, rows):
+        base = len(self.rows)
+        norms = np.empty(len(rows), dtype=np.float64)
+        in_base = rows < base
+        norms[in_base] = self.norms[rows[in_base]]
+        if not in_base.all():
+            norms[~in_base] = np.concatenate(self._delta_norms)[rows[~in_base] - base]
+        return norms
+
+    def _row(self, row):
+        if row < len(self.rows):
+            return self.rows[row]
+        return np.concatenate(self._delta_rows)[row - len(self.rows)]
+
+    def _column(self, term):
+        """Filas (ordenadas) y tf de la columna base de un término."""
+        if term >= len(self.term_ptr) - 1:
+            return _empty('<u4'), _empty('<u2')
+        a, b = int(self.term_ptr[term]), int(self.term_ptr[term + 1])
+        return self.post_rows[a:b], self.post_tf[a:b]
+
+    def scores(self, text):
+        """
+        (filas, coseno) de las filas que comparten algún término selectivo con text.
+
+        Los candidatos salen de los términos selectivos (df <= COMMON_FRACTION de
+        las filas, o todos si la consulta solo tiene comunes). Los términos comunes ('de', 'la', 'que') solo suman a esos
+        candidatos, con una búsqueda binaria en su columna en lugar de recorrerla
+        entera: su idf es bajo y casi no cambia el orden.
+        """
+        counts = Counter(token for token in _TOKEN_RE.findall(fold(text)) if token in self.vocab)
+        if not counts:
+            return _empty('<u4'), _empty(np.float64)
+        tokens = sorted(counts, key=self.vocab.get)
+        terms = np.array([self.vocab[token] for token in tokens], dtype='<u4')
+        idf = self._idf(terms)
+        query = np.array([counts[token] for token in tokens], dtype=np.float64) * idf
+        column_weight = query * idf   # peso de cada columna: tf de la fila * esto
+
+        df = self.df[terms]
+        selective = df <= max(COMMON_MIN_ROWS, len(self) * COMMON_FRACTION)
+        if not selective.any():
+            # Solo palabras comunes: se suman todas las columnas
+            selective[:] = True
+
+        delta_terms, delta_rows, delta_tf = self._delta()
+        rows, weights = [], []
+        for term, weight in zip(terms[selective], column_weight[selective]):
+            column_rows, column_tf = self._column(term)
+            rows.append(np.asarray(column_rows))
+            weights.append(column_tf * weight)
+        if len(delta_terms):
+            hit = np.isin(delta_terms, terms[selective])
+            position = np.searchsorted(terms, delta_terms[hit])
+            rows.append(delta_rows[hit])
+            weights.append(delta_tf[hit] * column_weight[position])
+        rows = np.concatenate(rows)
+        if not len(rows):
+            return _empty('<u4'), _empty(np.float64)
+
+        weights = np.concatenate(weights)
+        if len(rows) * 8 < len(self):
+            candidates, inverse = np.unique(rows, return_inverse=True)
+            dot = np.bincount(inverse, weights=weights)
+        else:
+            dot = np.bincount(rows, weights=weights)
+            candidates = np.flatnonzero(dot > 0)
+            dot = dot[candidates]
+        live = self.alive[candidates]
+        candidates, dot = candidates[live], dot[live]
+
+        for term, weight in zip(terms[~selective], column_weight[~selective]):
+            column_rows, column_tf = self._column(term)
+            if len(column_rows):
+                # Las filas de cada columna están ordenadas: búsqueda binaria por candidato
+                position = np.minimum(np.searchsorted(column_rows, candidates), len(column_rows) - 1)
+                found = column_rows[position] == candidates
+                dot[found] += column_tf[position[found]] * weight
+            if len(delta_terms):
+                mine = delta_terms == term
+                found = np.isin(delta_rows[mine], candidates)
+                position = np.searchsorted(candidates, delta_rows[mine][found])
+                np.add.at(dot, position, delta_tf[mine][found] * weight)
+
+        cosine = dot / (self._norm(candidates) * np.sqrt((query ** 2).sum()))
+        return candidates, cosine
+
+    def related(self, text, limit=MAX_RELATED, also=()):
+        """
+        Las líneas más parecidas a text (sin incluir text mismo), de mayor a
+        menor similitud coseno. also: rutas relativas a revisar antes de consultar
+        (p. ej. el archivo activo). Devuelve [(ruta relativa, texto)].
+        """
+        self._ready.wait()
+        with self._lock:
+            self._sync(also)
+            for _ in range(3):
+                candidates, cosine = self.scores(text)
+                if not len(candidates):
+                    return []
+                k = min(len(candidates), limit + 1)
+                best = np.argpartition(-cosine, k - 1)[:k]
+                best = best[np.argsort(-cosine[best], kind='stable')]
+                results = self._read_lines(candidates[best])
+                if results is not None:
+                    own = tokenize(text)
+                    return [r for r in results if tokenize(r[1]) != own][:limit]
+        return []
+
+    def _read_lines(self, rows):
+        """Texto de cada fila (un seek por línea); None si algún archivo cambió y hubo que reindexarlo."""
+        results = []
+        for row in rows:
+            entry = self._row(int(row))
+            rel = self.file_names[int(entry['file'])]
+            path = os.path.join(self.void_dir, rel)
+            if file_fingerprint(path) != self.files.get(rel, [None, None])[1]:
+                self._refresh_file(rel)
+                return None
+            with open(path, 'rb') as f:
+                f.seek(int(entry['offset']))
+                text = f.readline().decode('utf-8', errors='replace').strip()
+            results.append((rel, text))
+        return results
+
+
+class RelatedFinder:
+    """
+    Ctrl+R en segundo plano, como FuzzyFinder: submit(texto, also) encola la
+    consulta y devuelve su generación; un hilo atiende siempre la más reciente
+    y entrega callback(generación, texto, resultados). La consulta puede
+    esperar al armado del índice, a los volcados pedidos (ready: Events, ver
+    document.request_flush) o a un reindexado, nunca en la interfaz.
+    """
+
+    def __init__(self, index, callback):
+        self.index = index
+        self.callback = callback
+        self.generation = 0
+        self._query = None
+        self._wake = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="void-related-finder", daemon=True)
+        self._thread.start()
+
+    def submit(self, text, also=(), ready=()):
+        with self._wake:
+            self.generation += 1
+            self._query = (self.generation, text, also, ready)
+            self._wake.notify()
+            return self.generation
+
+    def cancel(self):
+        """Invalida la consulta en curso (el texto ya no es el que se pidió)."""
+        with self._wake:
+            self.generation += 1
+            self._query = None
+
+    def stop(self):
+        with self._wake:
+            self._stopped = True
+            self._query = None
+            self._wake.notify()
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout=2.0)
+
+    def _run(self):
+        while True:
+            with self._wake:
+                while self._query is None and not self._stopped:
+                    self._wake.wait()
+                if self._stopped:
+                    return
+                generation, text, also, ready = self._query
+                self._query = None
+            try:
+                for done in ready:
+                    done.wait()
+                results = self.index.related(text, also=also)
+            except Exception as e:
+                print(f"❌ Error buscando líneas relacionadas: {e}")
+                continue
+            if generation == self.generation:
+                self.callback(generation, text, results)
+
+
+# --- Registro de índices por directorio ---
+
+_indexes = {}
+
+
+def open_related_index(void_dir):
+    """Devuelve el índice de líneas relacionadas; la primera vez lo abre (o arma) en segundo plano."""
+    key = os.path.abspath(void_dir)
+    index = _indexes.get(key)
+    if index is None:
+        index = RelatedIndex(void_dir).start()
+        _indexes[key] = index
+    return index
+
+
+def close_related_indexes():
+    """Guarda lo que quedó en el delta de cada índice."""
+    for index in _indexes.values():
+        if not index._ready.is_set():
+            # Todavía armándose: no se espera al salir (el próximo inicio lo retoma)
+            continue
+        with index._lock:
+            if index._delta_coo or not index.alive.all():
+                try:
+                    index.save()
+                except OSError as e:
+                    print(f"❌ Error guardando el índice de líneas relacionadas: {e}")
+    _indexes.clear()
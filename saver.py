@@ -0,0 +1,128 @@
+# saver.py - Guardado en segundo plano: agrupa ráfagas de ediciones en una sola escritura
+import threading
+import time
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+SAVE_DELAY_MS = 800  # Espera desde la última edición antes de escribir
+
+
+class BackgroundSaver(QObject):
+    """
+    Servicio de guardado con un hilo de fondo y una cola por clave (la ruta).
+    request(clave, write, commit) programa un guardado: si ya había uno
+    pendiente para esa clave se reemplaza y se reinicia la espera, así una
+    ráfaga de ediciones termina en una sola escritura.
+
+    write() corre en el hilo de fondo (la parte pesada: escribir y hacer
+    fsync del temporal); commit(lo que devolvió write) corre después en el
+    hilo de la interfaz (el reemplazo atómico, que toca estado que usa la
+    interfaz). El resultado llega con las señales saved(clave) y
+    failed(clave, error).
+    """
+
+    saved = pyqtSignal(str)
+    failed = pyqtSignal(str, str)
+    _finished = pyqtSignal()
+
+    def __init__(self, delay_ms=SAVE_DELAY_MS, parent=None):
+        super().__init__(parent)
+        self.delay = delay_ms / 1000
+        self._pending = {}     # clave -> (momento de escribir, write, commit)
+        self._done = []        # (clave, commit, resultado, error) escritos que falta aplicar
+        self._running = None   # Clave que se está escribiendo
+        self._wake = threading.Condition()
+        self._stopped = False
+        self._finished.connect(self._deliver)
+        self._thread = threading.Thread(target=self._run, name="void-saver", daemon=True)
+        self._thread.start()
+
+    def request(self, key, write, commit=None, delay=None):
+        """Programa el guardado de key (reemplaza al pendiente, si había)."""
+        when = time.monotonic() + (self.delay if delay is None else delay / 1000)
+        with self._wake:
+            self._pending[key] = (when, write, commit)
+            self._wake.notify()
+
+    def pending(self, key=None):
+        """Si hay guardados sin terminar (de key, o de cualquiera)."""
+        with self._wake:
+            if key is None:
+                return bool(self._pending or self._running or self._done)
+            return key in self._pending or self._running == key or any(job[0] == key for job in self._done)
+
+    def writing(self, key):
+        """Si key se está escribiendo, o ya se escribió y falta aplicarlo."""
+        with self._wake:
+            return self._running == key or any(job[0] == key for job in self._done)
+
+    def _run(self):
+        while True:
+            with self._wake:
+                while not self._stopped:
+                    if self._pending:
+                        key = min(self._pending, key=lambda k: self._pending[k][0])
+                        wait = self._pending[key][0] - time.monotonic()
+                        if wait <= 0:
+                            break
+                        self._wake.wait(wait)
+                    else:
+                        self._wake.wait()
+                if self._stopped:
+                    return
+                _, write, commit = self._pending.pop(key)
+                self._running = key
+            result, error = None, None
+            try:
+                result = write()
+            except Exception as e:
+                error = e
+            with self._wake:
+                self._done.append((key, commit, result, error))
+                self._running = None
+                self._wake.notify_all()
+            self._finished.emit()
+
+    def _deliver(self):
+        """Aplica (en el hilo de la interfaz) los guardados que el hilo de fondo terminó de escribir."""
+        with self._wake:
+            done, self._done = self._done, []
+        for key, commit, result, error in done:
+            if error is None and commit is not None:
+                try:
+                    commit(result)
+                except Exception as e:
+                    error = e
+            if error is None:
+                self.saved.emit(key)
+            else:
+                self.failed.emit(key, str(error))
+
+    def flush(self, key=None):
+        """
+        Termina ya los guardados pendientes (de key, o todos) en el hilo que
+        llama, sin esperar la demora. Para cerrar o antes de soltar el archivo.
+        """
+        with self._wake:
+            while self._running is not None and (key is None or self._running == key):
+                self._wake.wait()
+            keys = [k for k in self._pending if key is None or k == key]
+            jobs = [(k, self._pending.pop(k)) for k in keys]
+        for k, (_, write, commit) in jobs:
+            result, error = None, None
+            try:
+                result = write()
+            except Exception as e:
+                error = e
+            with self._wake:
+                self._done.append((k, commit, result, error))
+        self._deliver()
+
+    def stop(self):
+        """Vuelca lo pendiente y detiene el hilo."""
+        self.flush()
+        with self._wake:
+            self._stopped = True
+            self._wake.notify_all()
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout=2.0)
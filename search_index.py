@@ -0,0 +1,306 @@
+# search_index.py - Búsqueda de texto completo en el corpus void (índice invertido)
+import os
+import re
+import threading
+import unicodedata
+from array import array
+
+from journal import file_fingerprint
+
+MAX_RESULTS = 500
+TAIL_BYTES = 64   # Bytes finales que se recuerdan de cada archivo para detectar appends
+
+_TOKEN_RE = re.compile(r'\w+')
+_COMBINING_RE = re.compile('[\u0300-\u036f]')
+
+
+def fold(text):
+    """Minúsculas y sin tildes: 'Canción' -> 'cancion', 'Ñandú' -> 'nandu'."""
+    return _COMBINING_RE.sub('', unicodedata.normalize('NFKD', text)).casefold()
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(fold(text))
+
+
+class _FileIndex:
+    """
+    Índice de un archivo: token -> números de línea, y offset en bytes de
+    cada línea. Si el archivo solo creció, se indexa únicamente lo agregado.
+    """
+
+    __slots__ = ('fp', 'offsets', 'postings', 'size', 'tail')
+
+    def __init__(self, path):
+        self.offsets = array('Q')
+        self.postings = {}
+        self.size = 0
+        self.tail = b''
+        self.extend(path, 0)
+
+    def extend(self, path, start):
+        """Indexa el archivo desde el byte start (0, o donde terminaba lo ya indexado)."""
+        fp = file_fingerprint(path)
+        with open(path, 'rb') as f:
+            f.seek(start)
+            data = f.read()
+        number = len(self.offsets)
+        if start:
+            # Lo viejo terminaba en salto de línea: su última "línea" (vacía) es la primera agregada
+            self.offsets.pop()
+            number -= 1
+        # Se normaliza todo lo leído de una vez (NFKD no toca los saltos de línea)
+        folded_lines = fold(data.decode('utf-8', errors='replace')).split('\n')
+        pos = start
+        for k, raw in enumerate(data.split(b'\n')):
+            self.offsets.append(pos)
+            pos += len(raw) + 1
+            for token in set(_TOKEN_RE.findall(folded_lines[k])):
+                postings = self.postings.get(token)
+                if postings is None:
+                    postings = self.postings[token] = array('I')
+                postings.append(number + k)
+        self.fp = fp
+        self.size = start + len(data)
+        self.tail = (self.tail + data)[-TAIL_BYTES:]
+
+    def appended_from(self, path):
+        """
+        Si el archivo solo creció desde que se indexó (lo viejo sigue intacto y
+        terminaba en salto de línea), devuelve el byte desde donde leer; si no, 0.
+        """
+        if not self.size or not self.tail.endswith(b'\n'):
+            return 0
+        try:
+            with open(path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size <= self.size:
+                    return 0
+                f.seek(self.size - len(self.tail))
+                if f.read(len(self.tail)) != self.tail:
+                    return 0
+        except OSError:
+            return 0
+        return self.size
+
+    def matches(self, tokens):
+        """Números de línea que contienen TODOS los tokens, en orden."""
+        lists = []
+        for token in tokens:
+            postings = self.postings.get(token)
+            if postings is None:
+                return []
+            lists.append(postings)
+        lists.sort(key=len)
+        if len(lists) == 1:
+            return lists[0]
+        hits = set(lists[0])
+        for postings in lists[1:]:
+            hits.intersection_update(postings)
+            if not hits:
+                return []
+        return sorted(hits)
+
+
+class SearchIndex:
+    """
+    Índice invertido token -> (archivo, línea) de todos los .txt de void_dir
+    (con subcarpetas). Tokens sin tildes y en minúsculas, así que 'cancion'
+    encuentra 'Canción'. Se mantiene por archivo: cuando un archivo cambia
+    (huella mtime/tamaño o aviso del watcher) solo se reindexa ese archivo,
+    y si solo le agregaron líneas al final, solo lo agregado.
+
+    El primer armado corre en un hilo de fondo; una búsqueda que llega antes
+    espera a que termine (por eso search se llama desde SearchFinder).
+    """
+
+    def __init__(self, void_dir):
+        self.void_dir = void_dir
+        self.files = {}          # ruta relativa -> _FileIndex
+        self.watched = False
+        self._pending = set()
+        self._pending_lock = threading.Lock()  # Solo cuida _pending: el hilo de la interfaz nunca toma _lock
+        self._dir_fp = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._build, name="void-search-index", daemon=True).start()
+        return self
+
+    def _build(self):
+        try:
+            with self._lock:
+                self._refresh_all()
+            print(f"🔎 Índice de búsqueda: {len(self.files)} archivos")
+        except Exception as e:
+            print(f"❌ Error armando el índice de búsqueda: {e}")
+        finally:
+            self._ready.set()
+
+    def _index(self, rel):
+        path = os.path.join(self.void_dir, rel)
+        try:
+            self.files[rel] = _FileIndex(path)
+        except OSError:
+            self.files.pop(rel, None)
+
+    def _refresh_all(self):
+        self._dir_fp = file_fingerprint(self.void_dir)
+        current = set()
+        for root, dirs, names in os.walk(self.void_dir):
+            for name in names:
+                if name.lower().endswith('.txt') and not name.startswith('.'):
+                    current.add(os.path.relpath(os.path.join(root, name), self.void_dir))
+        for rel in set(self.files) - current:
+            del self.files[rel]
+        for rel in current:
+            self._refresh_file(rel)
+
+    def _refresh_file(self, rel):
+        entry = self.files.get(rel)
+        fp = file_fingerprint(os.path.join(self.void_dir, rel))
+        if fp is None:
+            self.files.pop(rel, None)
+        elif entry is None or entry.fp != fp:
+            start = entry.appended_from(os.path.join(self.void_dir, rel)) if entry is not None else 0
+            if not start:
+                self._index(rel)
+                return
+            try:
+                entry.extend(os.path.join(self.void_dir, rel), start)
+            except OSError:
+                self.files.pop(rel, None)
+
+    def note_change(self, path):
+        """Evento del watcher: path se creó, cambió o se borró."""
+        self.watched = True
+        rel = os.path.relpath(path, self.void_dir)
+        if rel.lower().endswith('.txt'):
+            with self._pending_lock:
+                self._pending.add(rel)
+
+    def _sync(self):
+        if not self.watched and file_fingerprint(self.void_dir) != self._dir_fp:
+            self._refresh_all()
+            return
+        # Un stat por archivo: lo editado en esta sesión se reindexa antes de buscar
+        with self._pending_lock:
+            pending, self._pending = self._pending, set()
+        for rel in pending | set(self.files):
+            self._refresh_file(rel)
+
+    def search(self, query, limit=MAX_RESULTS):
+        """
+        Líneas que contienen todas las palabras de query (sin importar tildes ni
+        mayúsculas). Devuelve [(ruta relativa, número de línea, texto)].
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return []
+        self._ready.wait()
+        with self._lock:
+            self._sync()
+            hits = []
+            for rel in sorted(self.files):
+                for number in self.files[rel].matches(tokens):
+                    hits.append((rel, number))
+                    if len(hits) >= limit:
+                        break
+                if len(hits) >= limit:
+                    break
+            return self._read_lines(hits)
+
+    def _read_lines(self, hits):
+        """Lee el texto de cada resultado con un seek por línea (un open por archivo)."""
+        results = []
+        handle, handle_rel = None, None
+        try:
+            for rel, number in hits:
+                if rel != handle_rel:
+                    if handle:
+                        handle.close()
+                    handle = open(os.path.join(self.void_dir, rel), 'rb')
+                    handle_rel = rel
+                handle.seek(self.files[rel].offsets[number])
+                text = handle.readline().decode('utf-8', errors='replace').strip()
+                results.append((rel, number, text))
+        finally:
+            if handle:
+                handle.close()
+        return results
+
+
+class SearchFinder:
+    """
+    ?término en segundo plano, como FuzzyFinder: submit(texto) encola la
+    búsqueda y devuelve su generación; un hilo atiende siempre la más
+    reciente y entrega callback(generación, texto, resultados). La espera al
+    primer armado del índice, la de los volcados pedidos (ready: Events,
+    ver document.request_flush) y la puesta al día de lo editado pasan en
+    ese hilo, nunca en la interfaz.
+    """
+
+    def __init__(self, index, callback):
+        self.index = index
+        self.callback = callback
+        self.generation = 0
+        self._query = None
+        self._wake = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="void-search-finder", daemon=True)
+        self._thread.start()
+
+    def submit(self, text, ready=()):
+        with self._wake:
+            self.generation += 1
+            self._query = (self.generation, text, ready)
+            self._wake.notify()
+            return self.generation
+
+    def cancel(self):
+        """Invalida la búsqueda en curso (ya se pidió otra cosa)."""
+        with self._wake:
+            self.generation += 1
+            self._query = None
+
+    def stop(self):
+        with self._wake:
+            self._stopped = True
+            self._query = None
+            self._wake.notify()
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout=2.0)
+
+    def _run(self):
+        while True:
+            with self._wake:
+                while self._query is None and not self._stopped:
+                    self._wake.wait()
+                if self._stopped:
+                    return
+                generation, text, ready = self._query
+                self._query = None
+            try:
+                for done in ready:
+                    done.wait()
+                results = self.index.search(text)
+            except Exception as e:
+                print(f"❌ Error en la búsqueda: {e}")
+                continue
+            if generation == self.generation:
+                self.callback(generation, text, results)
+
+
+# --- Registro de índices por directorio ---
+
+_indexes = {}
+
+
+def open_search_index(void_dir):
+    """Devuelve el índice de búsqueda del directorio; la primera vez lo arma en segundo plano."""
+    key = os.path.abspath(void_dir)
+    index = _indexes.get(key)
+    if index is None:
+        index = SearchIndex(void_dir).start()
+        _indexes[key] = index
+    return index
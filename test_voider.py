@@ -6,8 +6,11 @@
 # (Asegúrate de tener pytest instalado: pip install pytest)
 
 import os
+import queue
 import random
+import shutil
 import tempfile
+import time
 import pytest
 from unittest.mock import MagicMock, patch
 
@@ -17,11 +20,24 @@ from controls import (
     show_random_line_from_current_file,
     show_random_line_from_random_file,
     show_previous_current_file_line,
-    show_next_current_file_line
+    show_next_current_file_line,
+    show_related_line,
+    show_related_results
 )
-from files import setup_file_handling, void_line
+from files import setup_file_handling, void_line, show_search_command_results
+from document import (VoidDocument, AppendTarget, open_document, open_target, move_lines,
+                      flush_documents, close_documents, replay_journal)
+from journal import VoidJournal
+from corpus_index import CorpusIndex, close_corpus_indexes
+from watcher import VoidWatcher, ADDED, REMOVED, MODIFIED
+from search_index import SearchIndex, SearchFinder, open_search_index
+from fuzzy_index import FuzzyIndex, FuzzyFinder
+from related_index import RelatedIndex, RelatedFinder, open_related_index, close_related_indexes
+from line_rope import LineRope, CompactLineRope
+from line_ring import LineRing, SubRing
 from tools import clean_text, close_program, show_cursor
 from noise_controls import NoiseController
+from saver import BackgroundSaver
 # from new_interface import FullscreenCircleApp  # UI testing es opcional/complejo, se mockea
 # from voider import ...  # Main script, no se testa directamente
 
@@ -41,13 +57,13 @@ def mock_app():
     app.entry.clear = MagicMock()
     app.current_active_line = None
     app.current_active_line_index = None
-    app.last_inserted_index = None
     app.first_up_after_submission = False
     yield app
-    # Cleanup: eliminar directorio temporal
-    for file in os.listdir(app.void_dir):
-        os.remove(os.path.join(app.void_dir, file))
-    os.rmdir(app.void_dir)
+    # Cleanup: detener journals (vuelcan lo pendiente), cerrar índices y eliminar directorio temporal
+    close_documents()
+    close_corpus_indexes()
+    close_related_indexes()
+    shutil.rmtree(app.void_dir)
 
 # Fixture para setup inicial (llama a setup_file_handling y setup_controls)
 @pytest.fixture
@@ -142,7 +158,7 @@ def test_show_previous_current_file_line(setup_app):
     with open(setup_app.current_file_path, 'w', encoding='utf-8') as f:
         f.write("Line1\nLine2\nLine3\n")
     setup_app.first_up_after_submission = True
-    setup_app.last_inserted_index = 1  # "Line2"
+    open_document(setup_app.current_file_path).last_inserted_index = 1  # "Line2"
     show_previous_current_file_line(setup_app)
     assert setup_app.current_active_line == "Line2"
     assert setup_app.current_active_line_index == 1
@@ -172,7 +188,7 @@ def test_show_next_current_file_line(setup_app):
     with open(setup_app.current_file_path, 'w', encoding='utf-8') as f:
         f.write("Line1\nLine2\nLine3\n")
     setup_app.current_active_line_index = None
-    setup_app.last_inserted_index = 0
+    open_document(setup_app.current_file_path).last_inserted_index = 0
     show_next_current_file_line(setup_app)
     assert setup_app.current_active_line == "Line2"
     assert setup_app.current_active_line_index == 1
@@ -203,7 +219,6 @@ def test_setup_file_handling(mock_app):
     assert os.path.exists(mock_app.void_file_path)
     assert mock_app.current_active_line is None
     assert mock_app.current_active_line_index is None
-    assert mock_app.last_inserted_index is None
 
 def test_void_line(setup_app):
     """Prueba procesamiento de líneas: inserción, edición, comandos, formateo, movimientos."""
@@ -211,11 +226,12 @@ def test_void_line(setup_app):
     setup_app.entry.text.return_value = ""
     void_line(setup_app)
     assert setup_app.current_active_line_index is None
-    assert setup_app.last_inserted_index == -1  # Archivo vacío
+    assert open_document(setup_app.current_file_path).last_inserted_index == -1  # Archivo vacío
 
     # Caso: input normal con formateo
     setup_app.entry.text.return_value = "test sentence without period"
     void_line(setup_app)
+    flush_documents()
     with open(setup_app.current_file_path, 'r') as f:
         content = f.read().strip()
     assert content == "Test sentence without period."
@@ -223,6 +239,7 @@ def test_void_line(setup_app):
     # Caso: punto solo, no consecutivo
     setup_app.entry.text.return_value = "."
     void_line(setup_app)
+    flush_documents()
     with open(setup_app.current_file_path, 'r') as f:
         lines = f.readlines()
     assert lines[-1].strip() == "."
@@ -230,6 +247,7 @@ def test_void_line(setup_app):
     # Caso: punto consecutivo evitado
     setup_app.entry.text.return_value = "."
     void_line(setup_app)
+    flush_documents()
     with open(setup_app.current_file_path, 'r') as f:
         lines = f.readlines()
     assert len(lines) == 2  # No se añadió el segundo punto
@@ -243,6 +261,7 @@ def test_void_line(setup_app):
     # Caso: mover línea simple "content /file"
     setup_app.entry.text.return_value = "Move this /2.txt"
     void_line(setup_app)
+    flush_documents()
     target_path = os.path.join(setup_app.void_dir, "2.txt")
     with open(target_path, 'r') as f:
         assert f.read().strip() == "Move this"
@@ -252,6 +271,7 @@ def test_void_line(setup_app):
         f.write(".\nBlock line1\nBlock line2\n")
     setup_app.entry.text.return_value = "/3.txt"
     void_line(setup_app)
+    flush_documents()
     target_path = os.path.join(setup_app.void_dir, "3.txt")
     with open(target_path, 'r') as f:
         assert f.read().strip() == ".\nBlock line1\nBlock line2"
@@ -262,6 +282,7 @@ def test_void_line(setup_app):
     setup_app.current_active_line_index = 0
     setup_app.entry.text.return_value = "New line."
     void_line(setup_app)
+    flush_documents()
     with open(setup_app.current_file_path, 'r') as f:
         assert f.read().strip() == "New line."
 
@@ -271,6 +292,749 @@ def test_void_line(setup_app):
         void_line(setup_app)
         setup_app.entry.clear.assert_called()
 
+# --- Tests para document.py ---
+
+def test_void_document_persists_edits(setup_app):
+    """Prueba que el documento residente persista appends, ediciones intermedias y borrados."""
+    path = setup_app.current_file_path
+    doc = VoidDocument(path)
+    doc.insert(0, ["Uno.", "Dos."])  # append al final
+    doc.insert(1, ["Medio."])          # inserción en el medio
+    doc.replace(0, ["Primero."])
+    doc.delete(2)
+    with open(path, 'r', encoding='utf-8') as f:
+        assert f.read() == "Primero.\nMedio.\n"
+    assert doc.lines == ["Primero.", "Medio."]
+
+def test_open_document_reloads_external_changes(setup_app):
+    """Prueba que open_document detecte cambios hechos por fuera y recargue."""
+    path = setup_app.current_file_path
+    doc = open_document(path)
+    assert doc.lines == []
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("Externa.\n")
+    assert open_document(path) is doc
+    assert doc.lines == ["Externa."]
+
+# --- Tests para journal.py ---
+
+def test_journal_defers_writes_and_compacts(setup_app):
+    """Prueba que las ediciones vayan al journal y el compactador las vuelque al .txt."""
+    path = setup_app.current_file_path
+    doc = open_document(path)
+    doc.insert(0, ["Uno.", "Dos."])
+    with open(path, 'r', encoding='utf-8') as f:
+        assert f.read() == ""  # Todavía solo en el journal
+    flush_documents()
+    with open(path, 'r', encoding='utf-8') as f:
+        assert f.read() == "Uno.\nDos.\n"
+    assert os.path.getsize(doc.journal.path) == 0
+
+def test_journal_replay_after_crash(setup_app):
+    """Prueba que al reabrir se reproduzcan las operaciones que no llegaron al .txt."""
+    path = setup_app.current_file_path
+    doc = open_document(path)
+    doc.insert(0, ["Uno.", "Dos."])
+    doc.replace(1, ["Tres."])
+    doc.journal.commit()
+    # Simular un corte: otro proceso abre el mismo directorio sin que se haya compactado
+    replay_journal(VoidJournal(setup_app.void_dir))
+    with open(path, 'r', encoding='utf-8') as f:
+        assert f.read() == "Uno.\nTres.\n"
+
+def test_move_is_transactional_with_source_removal(setup_app):
+    """Prueba que un movimiento que vacía el origen sea durable como una sola operación."""
+    source_path = os.path.join(setup_app.void_dir, 'origen.txt')
+    target_path = os.path.join(setup_app.void_dir, 'destino.txt')
+    with open(source_path, 'w', encoding='utf-8') as f:
+        f.write("Solo.\n")
+    source = open_document(source_path)
+    assert move_lines(source, 0, 1, [], open_target(target_path), ["Solo."], remove_if_empty=True)
+    # Nada llegó todavía a los .txt, pero el journal ya es durable
+    assert os.path.exists(source_path)
+    # Simular un corte antes de compactar: el replay completa las dos mitades
+    replay_journal(VoidJournal(setup_app.void_dir))
+    assert not os.path.exists(source_path)
+    with open(target_path, 'r', encoding='utf-8') as f:
+        assert f.read() == "Solo.\n"
+
+def test_append_target_reads_only_the_tail(setup_app, monkeypatch):
+    """Prueba que mover a un destino solo lea su final y agregue sin cargarlo."""
+    monkeypatch.setattr(AppendTarget, 'TAIL_BLOCK', 8)
+    path = os.path.join(setup_app.void_dir, 'archivo.txt')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("".join(f"Linea {i}.\n" for i in range(50)) + "Final\n\n   \n")
+    target = open_target(path)
+    assert isinstance(target, AppendTarget)
+    assert target.last_nonblank_line() == "Final"
+
+    setup_app.entry.text.return_value = "Algo nuevo /archivo"
+    void_line(setup_app)
+    assert target.last_nonblank_line() == "Algo nuevo"
+    flush_documents()
+    with open(path, 'r', encoding='utf-8') as f:
+        assert f.read().endswith("Final\n\n   \nAlgo nuevo\n")
+
+def test_navigable_indices_and_lru(setup_app, monkeypatch):
+    """Prueba los índices navegables por versión y que el LRU no desaloje documentos con cambios."""
+    import document
+    path = setup_app.current_file_path
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(".\n\nUno.\n.\nDos.\n")
+    doc = open_document(path)
+    assert list(doc.navigable_indices()) == [2, 4]
+    doc.insert(0, ["Cero."])
+    assert list(doc.navigable_indices()) == [0, 3, 5]
+
+    # Up desde la primera línea navegable vuelve a la última (saltando puntos y vacías)
+    setup_app.current_active_line_index = 0
+    show_previous_current_file_line(setup_app)
+    assert setup_app.current_active_line == "Dos."
+
+    monkeypatch.setattr(document, 'MAX_RESIDENT_DOCUMENTS', 2)
+    for name in ('a.txt', 'b.txt'):
+        open_document(os.path.join(setup_app.void_dir, name))
+    assert open_document(path) is doc  # tenía cambios sin volcar: sigue residente
+    assert len(document._documents) == 2
+
+# --- Tests para corpus_index.py ---
+
+def test_corpus_index_samples_lines(setup_app):
+    """Prueba que el índice de líneas excluya 0.txt, puntos y vacías, y se ponga al día."""
+    with open(os.path.join(setup_app.void_dir, 'a.txt'), 'w', encoding='utf-8') as f:
+        f.write("Uno.\n.\n\nDos.\n")
+    with open(setup_app.void_file_path, 'w', encoding='utf-8') as f:
+        f.write("No va.\n")
+    index = CorpusIndex(setup_app.void_dir).refresh()
+    assert len(index) == 2
+    assert sorted(index.read_line(k)[1] for k in range(len(index))) == ["Dos.", "Uno."]
+    assert index.sample(by_file=True)[0] == 'a.txt'
+
+    # Reabrir usa el arreglo guardado; un archivo nuevo se indexa al muestrear
+    index.close()
+    index = CorpusIndex(setup_app.void_dir)
+    assert len(index) == 2
+    with open(os.path.join(setup_app.void_dir, 'b.txt'), 'w', encoding='utf-8') as f:
+        f.write("Tres.\n")
+    index.sample()
+    assert len(index) == 3
+    index.close()
+
+def test_corpus_index_refresh_reuses_unchanged_files(setup_app):
+    """Prueba que refrescar con un archivo editado y otro sin cambios no deje el índice vacío."""
+    a, b = (os.path.join(setup_app.void_dir, name) for name in ('a.txt', 'b.txt'))
+    with open(a, 'w', encoding='utf-8') as f:
+        f.write("Uno.\n")
+    with open(b, 'w', encoding='utf-8') as f:
+        f.write("Dos.\nTres.\n")
+    index = CorpusIndex(setup_app.void_dir).refresh()
+    assert len(index) == 3
+    with open(a, 'w', encoding='utf-8') as f:
+        f.write("Uno.\nCuatro.\n")
+    os.utime(a, (time.time() + 5, time.time() + 5))
+    index.note_change(a)
+    index.sample()
+    assert len(index) == 4 and not index._pending
+    assert sorted(index.read_line(k)[1] for k in range(len(index))) == ["Cuatro.", "Dos.", "Tres.", "Uno."]
+    index.close()
+
+# --- Tests para search_index.py ---
+
+def test_search_index_ignores_accents_and_case(setup_app):
+    """Prueba la búsqueda sin tildes ni mayúsculas y que se reindexe un archivo modificado."""
+    path = os.path.join(setup_app.void_dir, 'notas.txt')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("La Canción del niño.\n.\nOtra cancion más.\nNada.\n")
+    index = SearchIndex(setup_app.void_dir).start()
+    assert [(r[0], r[1]) for r in index.search("CANCION")] == [('notas.txt', 0), ('notas.txt', 2)]
+    assert [r[2] for r in index.search("nino cancion")] == ["La Canción del niño."]
+    assert index.search("inexistente") == []
+
+    entry = index.files['notas.txt']
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write("Canción nueva.\n")
+    assert index.search("canción")[-1] == ('notas.txt', 4, "Canción nueva.")
+    assert index.files['notas.txt'] is entry  # Solo se indexó lo agregado
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("Reescrito sin canciones.\n")
+    assert index.search("cancion") == [] and index.search("reescrito")[0][1] == 0
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("La Canción del niño.\n.\nOtra cancion más.\nNada.\nCanción nueva.\n")
+
+    # Un aviso del watcher no espera a un armado o una búsqueda en curso
+    with index._lock:
+        index.note_change(path)
+    assert index.search("nueva")[0][2] == "Canción nueva."
+
+def test_void_line_search_command(setup_app):
+    """Prueba que ?término muestre los resultados sin tocar el archivo activo."""
+    with open(os.path.join(setup_app.void_dir, 'a.txt'), 'w', encoding='utf-8') as f:
+        f.write("Él vio el árbol.\n")
+    # Recién enviada: está en el journal, todavía no en el .txt
+    setup_app.entry.text.return_value = "otro arbol"
+    void_line(setup_app)
+    # La búsqueda corre en el hilo del finder (que espera el volcado pedido al compactador);
+    # el resultado se entrega con show_search_command_results
+    delivered = queue.Queue()
+    setup_app.search_finder = SearchFinder(open_search_index(setup_app.void_dir), lambda *result: delivered.put(result))
+    setup_app.entry.text.return_value = "?arbol"
+    try:
+        void_line(setup_app)
+        show_search_command_results(setup_app, *delivered.get(timeout=5))
+    finally:
+        setup_app.search_finder.stop()
+    query, results = setup_app.show_search_results.call_args[0]
+    assert query == "arbol"
+    assert [r[2] for r in results] == ["Otro arbol.", "Él vio el árbol."]
+    assert open_document(setup_app.current_file_path).lines == ["Otro arbol."]
+
+# --- Tests para fuzzy_index.py ---
+
+def test_fuzzy_index_tolerates_typos(setup_app):
+    """Prueba que un fragmento mal escrito encuentre la línea y que se reindexe lo modificado."""
+    path = os.path.join(setup_app.void_dir, 'notas.txt')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("El tiempo muerto al que estás condenado.\n.\nOtra línea cualquiera.\n")
+    index = FuzzyIndex(setup_app.void_dir).start()
+    assert index.match("tiempo muetro")[0] == ('notas.txt', 0, "El tiempo muerto al que estás condenado.")
+    assert index.match("cualqiera")[0][1] == 2
+    assert index.match("zz") == []
+
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write("Un reloj de arena.\n")
+    assert index.match("relog de arena")[0][2] == "Un reloj de arena."
+
+    with index._lock:
+        index.note_change(path)  # No espera al armado ni a una consulta en curso
+    assert index.match("relog de arena")[0][2] == "Un reloj de arena."
+
+def test_fuzzy_finder_drops_stale_queries(setup_app):
+    """Prueba que solo se entreguen los resultados de la última consulta."""
+    with open(os.path.join(setup_app.void_dir, 'a.txt'), 'w', encoding='utf-8') as f:
+        f.write("Canción de cuna.\n")
+    index = FuzzyIndex(setup_app.void_dir)
+    delivered = queue.Queue()
+    finder = FuzzyFinder(index, lambda generation, text, results: delivered.put((generation, text, results)))
+    try:
+        # El índice todavía no está armado: las consultas se acumulan y solo corre la última
+        for text in ("can", "canc", "cancion de"):
+            generation = finder.submit(text)
+        index.start()
+        assert delivered.get(timeout=5) == (generation, "cancion de", [('a.txt', 0, "Canción de cuna.")])
+        assert delivered.empty()
+    finally:
+        finder.stop()
+
+# --- Tests para related_index.py ---
+
+def test_related_index_is_incremental_and_persistent(setup_app, monkeypatch):
+    """Prueba el ranking por coseno, que un append solo indexe lo nuevo y que se guarde en disco."""
+    path = os.path.join(setup_app.void_dir, 'notas.txt')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("El mar de noche.\n.\nLa noche sin luna sobre el mar.\nUn árbol en el patio.\n")
+    index = RelatedIndex(setup_app.void_dir).start()
+    related = [r[1] for r in index.related("el mar de noche")]
+    assert related[0] == "La noche sin luna sobre el mar." and "El mar de noche." not in related
+
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write("Otro árbol, otro patio.\n")
+    assert index.related("arbol del patio", also=['notas.txt'])[0] == ('notas.txt', "Un árbol en el patio.")
+    assert len(index._delta_rows) == 1 and index.alive.all()  # Solo se leyó la línea agregada
+
+    index.save()
+    reopened = RelatedIndex(setup_app.void_dir)
+    assert reopened.load() and len(reopened) == 4
+    reopened.start()
+    assert reopened.related("arbol del patio") == index.related("arbol del patio")
+
+    # Un delta grande se compacta en su propio hilo, fuera de la consulta
+    import related_index
+    monkeypatch.setattr(related_index, 'COMPACT_MIN_ROWS', 0)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write("Un patio con luna.\n")
+    assert index.related("patio con luna", also=['notas.txt'])[0][1] == "Un patio con luna."
+    deadline = time.time() + 5
+    while (index._compacting or index._delta_rows) and time.time() < deadline:
+        time.sleep(0.01)
+    assert not index._delta_rows and len(index) == 5
+
+def test_show_related_line_cycles_results(setup_app):
+    """Prueba que Ctrl+R copie la línea más parecida y que repetirlo recorra las siguientes."""
+    with open(os.path.join(setup_app.void_dir, 'a.txt'), 'w', encoding='utf-8') as f:
+        f.write("La lluvia cae.\nCae la lluvia fría.\nSol.\n")
+    # La consulta corre en el hilo del finder; el resultado se entrega con show_related_results
+    delivered = queue.Queue()
+    setup_app.related_finder = RelatedFinder(open_related_index(setup_app.void_dir),
+                                             lambda *result: delivered.put(result))
+    setup_app.entry.text.return_value = "lluvia"
+    try:
+        show_related_line(setup_app)
+        show_related_results(setup_app, *delivered.get(timeout=5))
+    finally:
+        setup_app.related_finder.stop()
+    first = setup_app.entry.setText.call_args[0][0]
+    setup_app.entry.text.return_value = first
+    show_related_line(setup_app)
+    second = setup_app.entry.setText.call_args[0][0]
+    assert {first, second} == {"La lluvia cae.", "Cae la lluvia fría."}
+
+def test_show_related_line_sees_unflushed_lines(setup_app):
+    """Prueba que Ctrl+R encuentre una línea recién enviada (todavía en el journal)."""
+    with open(os.path.join(setup_app.void_dir, 'a.txt'), 'w', encoding='utf-8') as f:
+        f.write("Sol de mañana.\nNoche cerrada.\n")
+    setup_app.entry.text.return_value = "granizo sobre el techo"
+    void_line(setup_app)
+    delivered = queue.Queue()
+    setup_app.related_finder = RelatedFinder(open_related_index(setup_app.void_dir),
+                                             lambda *result: delivered.put(result))
+    setup_app.entry.text.return_value = "granizo"
+    try:
+        show_related_line(setup_app)
+        show_related_results(setup_app, *delivered.get(timeout=5))
+    finally:
+        setup_app.related_finder.stop()
+    assert setup_app.entry.setText.call_args[0][0] == "Granizo sobre el techo."
+
+# --- Tests para watcher.py ---
+
+@pytest.mark.parametrize("polling", [False, True])
+def test_watcher_publishes_file_events(setup_app, monkeypatch, polling):
+    """Prueba que el watcher (inotify o sondeo) publique altas, cambios y bajas de .txt."""
+    if polling:
+        monkeypatch.setattr('watcher._load_libc', lambda: None)
+    events = queue.Queue()
+    watcher = VoidWatcher(setup_app.void_dir, lambda kind, path: events.put((kind, os.path.basename(path))),
+                          poll_interval=0.05).start()
+    try:
+        path = os.path.join(setup_app.void_dir, 'nuevo.txt')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("Hola.\n")
+        assert events.get(timeout=2) == (ADDED, 'nuevo.txt')
+        time.sleep(0.05)  # mtime distinto para el sondeo
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write("Chau.\n")
+        assert events.get(timeout=2) == (MODIFIED, 'nuevo.txt')
+        os.remove(path)
+        while True:
+            event = events.get(timeout=2)
+            if event[0] != MODIFIED:
+                break
+        assert event == (REMOVED, 'nuevo.txt')
+    finally:
+        watcher.stop()
+
+# --- Tests para line_rope.py / line_ring.py ---
+
+def test_line_rope_behaves_like_list(monkeypatch):
+    """Prueba que LineRope dé los mismos resultados que una lista con bloques chicos."""
+    monkeypatch.setattr(LineRope, 'LOAD', 4)
+    rnd = random.Random(7)
+    expected = [str(i) for i in range(25)]
+    rope = LineRope(expected)
+    for _ in range(400):
+        n = len(expected)
+        op = rnd.random()
+        if op < 0.4:
+            i = rnd.randint(0, n)
+            expected.insert(i, f"n{i}")
+            rope.insert(i, f"n{i}")
+        elif op < 0.6 and n:
+            i = rnd.randrange(n)
+            del expected[i]
+            del rope[i]
+        elif op < 0.8:
+            a, b = sorted((rnd.randint(0, n), rnd.randint(0, n)))
+            items = [f"s{k}" for k in range(rnd.randint(0, 12))]
+            expected[a:b] = items
+            rope[a:b] = items
+        elif n:
+            i = rnd.randrange(n)
+            expected[i] = "x"
+            rope[i] = "x"
+        assert rope == expected
+    assert [rope[i] for i in range(len(rope))] == expected
+    assert rope[3:9] == expected[3:9]
+
+def test_line_ring_move_skips_dots_by_rank(monkeypatch):
+    """Prueba move (cualquier delta) contra avanzar de a una línea saltando puntos, con bloques chicos."""
+    monkeypatch.setattr(LineRope, 'LOAD', 4)
+
+    def step(lines, index, direction):
+        # Referencia: de a una línea hasta la primera que no es punto
+        for _ in range(len(lines)):
+            index = (index + direction) % len(lines)
+            if lines[index] != '.':
+                break
+        return index
+
+    rnd = random.Random(7)
+    for _ in range(30):
+        lines = [rnd.choice(['.', '.', 'x', 'y']) for _ in range(rnd.randint(1, 60))]
+        ring = LineRing(lines)
+        if '.' in lines and lines.count('.') < len(lines):
+            ring.lines.insert(0, '.')  # Empezar parado en un punto
+            lines.insert(0, '.')
+        for delta in (1, -1, 3, -7, 25, -40):
+            expected = ring.index
+            for _ in range(abs(delta)):
+                expected = step(lines, expected, 1 if delta > 0 else -1)
+            if lines.count('.') == len(lines):
+                expected = ring.index
+            ring.move(delta)
+            assert ring.index == expected
+
+def test_compact_line_rope_matches_list():
+    """Prueba que CompactLineRope (blobs UTF-8) se comporte como una lista ante ediciones al azar."""
+    rnd = random.Random(3)
+    rope = CompactLineRope([f"línea {i}" if i % 5 else "." for i in range(3000)])
+    reference = list(rope)
+    for step in range(400):
+        i = rnd.randrange(len(reference) + 1)
+        op = rnd.random()
+        if op < 0.4:
+            new = [rnd.choice(["ñandú", ".", "x" * rnd.randint(0, 30)]) for _ in range(rnd.randint(1, 700))]
+            rope[i:i] = new
+            reference[i:i] = new
+        elif op < 0.7 and reference:
+            j = min(len(reference), i + rnd.randint(1, 900))
+            del rope[i:j]
+            del reference[i:j]
+        elif reference:
+            i = min(i, len(reference) - 1)
+            rope[i] = reference[i] = rnd.choice(["editada", "."])
+    assert list(rope) == reference and rope[5:9] == reference[5:9]
+    assert list(rope.separator_positions()) == [k for k, line in enumerate(reference) if line == "."]
+    ring = LineRing((line for line in ["", "a"] if line), compact=True)
+    assert isinstance(ring.lines, CompactLineRope) and ring.lines == ["a"]
+
+def test_mapped_lines_index_edit_and_save(tmp_path, monkeypatch):
+    """Prueba MappedLines: índice por ventanas, navegación, ediciones en piezas y volcado al archivo."""
+    import mapped_lines
+    monkeypatch.setattr(mapped_lines, 'WINDOW', 37)  # Ventanas chicas: líneas partidas entre ventanas
+    rnd = random.Random(5)
+    raw = [rnd.choice(["", "  ", " .", "línea ñ %d" % i, "  sangría %d " % i]) for i in range(600)]
+    path = tmp_path / "grande.txt"
+    path.write_text("\n".join(raw), encoding="utf-8")
+    reference = [line.strip() for line in raw if line.strip()]
+
+    ring = LineRing.mapped(mapped_lines.MappedLines(str(path)))
+    assert ring.current() == reference[0]
+    ring.lines.wait()
+    assert list(ring.lines) == reference
+    assert list(ring.lines.separator_positions()) == [k for k, line in enumerate(reference) if line == "."]
+    for step in range(60):
+        op = rnd.random()
+        i = rnd.randrange(len(reference))
+        if op < 0.4:
+            new = rnd.choice(["nueva", "."])
+            ring.lines.insert(i, new)
+            reference.insert(i, new)
+        elif op < 0.7:
+            del ring.lines[i]
+            del reference[i]
+        else:
+            ring.lines[i] = reference[i] = rnd.choice(["editada", "."])
+    assert list(ring.lines) == reference
+    for k in range(len(reference)):
+        assert ring.lines.count_separators(k) == reference[:k].count(".")
+    compact = LineRing(reference, compact=True)
+    for delta in (1, -1, 7, -13):
+        ring.index = compact.index = 3
+        ring.move(delta)
+        compact.move(delta)
+        assert ring.index == compact.index
+
+    ring.lines.save()
+    # Los tramos sin editar se copian tal cual (con su sangría); lo editado, línea por línea
+    assert "  sangría" in path.read_text(encoding="utf-8")
+    assert [l.strip() for l in path.read_text(encoding="utf-8").split("\n") if l.strip()] == reference
+    # El índice del archivo escrito se instala sin volver a recorrerlo, igual al de un indexado nuevo
+    assert ring.lines.indexed and not ring.lines.dirty and list(ring.lines) == reference
+    fresh = mapped_lines.MappedLines(str(path))
+    fresh.wait()
+    for name in ('_starts', '_ends', '_seps', '_sep_rank', '_numbers'):
+        assert getattr(ring.lines, name).view().tolist() == getattr(fresh, name).view().tolist()
+    fresh.close()
+    ring.lines.close()
+
+def test_mapped_lines_edits_before_index_finishes(tmp_path, monkeypatch):
+    """Prueba que editar al principio no espere al indexado del archivo entero."""
+    import threading
+    import mapped_lines
+    monkeypatch.setattr(mapped_lines, 'WINDOW', 64)
+    raw = ["verso %d" % i if i % 5 else "." for i in range(400)]
+    path = tmp_path / "grande.txt"
+    path.write_text("\n".join(raw), encoding="utf-8")
+    gate = threading.Event()
+    lines = mapped_lines.MappedLines(str(path), on_progress=lambda: gate.wait(5))
+    lines.wait(3)
+    lines[1] = "editada"
+    lines.insert(2, ".")
+    del lines[0]
+    assert not lines.indexed and lines[0] == "editada" and lines[1] == "."
+    gate.set()
+    lines.wait()
+    reference = ["editada", "."] + raw[2:]
+    assert list(lines) == reference and len(lines) == len(reference)
+    assert list(lines.separator_positions()) == [k for k, line in enumerate(reference) if line == "."]
+    assert lines.navigable_position(3) == 4 and lines.count_separators(6) == 2
+    lines.close()
+
+def test_mapped_document_single_writer(setup_app, monkeypatch):
+    """Prueba que F1 (void_line) y F2 (el ring) editen la misma tabla de piezas de un archivo mapeado."""
+    import document
+    monkeypatch.setattr(document, 'MAPPED_MIN_BYTES', 64)
+    path = setup_app.current_file_path
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("\n".join(["Uno.", "", "Dos.", ".", "Tres."] * 10) + "\n")
+    doc = open_document(path)
+    assert isinstance(doc, document.MappedDocument) and open_document(path) is doc
+    ring = LineRing.mapped(doc.mapped)  # El ring de F2 muestra las mismas líneas que edita F1
+    ring.lines.wait()
+    ring.lines[0] = "Editada en F2."
+    setup_app.entry.text.return_value = "agregada en f1"
+    void_line(setup_app)
+    # La navegación de F1 responde desde el mismo índice
+    show_previous_current_file_line(setup_app)
+    assert setup_app.current_active_line == "Agregada en f1."
+    ring.lines.insert(1, "Otra de F2.")
+    doc.mapped.save()
+    flush_documents()  # El journal no tiene nada de este archivo: no pisa lo volcado
+    with open(path, encoding='utf-8') as f:
+        content = [l for l in f.read().split("\n") if l.strip()]
+    assert content[:2] == ["Editada en F2.", "Otra de F2."] and content[-1] == "Agregada en f1."
+    assert list(ring.lines) == content and open_document(path) is doc
+    assert os.path.abspath(path) not in document._documents
+
+def test_mapped_document_answers_from_index(setup_app, monkeypatch):
+    """Prueba que un archivo mapeado responda números de línea, Up/Down y Ctrl+. sin un VoidDocument."""
+    import document
+    import mapped_lines
+    monkeypatch.setattr(document, 'MAPPED_MIN_BYTES', 64)
+    monkeypatch.setattr(mapped_lines, 'WINDOW', 41)
+    raw = ["", "Uno.", "  ", "Dos.", ".", "", "Tres.", "Cuatro."] * 6
+    path = setup_app.current_file_path
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("\n".join(raw))
+    doc = open_document(path)
+    # Número de línea del archivo (como los da ?término) -> posición en el ring
+    for number in range(len(raw)):
+        assert doc.ring_position(number) == sum(1 for l in raw[:number] if l.strip())
+    doc.delete(0)  # Sin saver de la app: se vuelca en el acto y el índice se reinstala
+    with open(path, encoding='utf-8') as f:
+        written = f.read().split("\n")
+    for number in range(len(written)):
+        assert doc.ring_position(number) == sum(1 for l in written[:number] if l.strip())
+    doc.mapped.insert(0, "Nueva.")  # Con ediciones sin volcar, los números son los del archivo en disco
+    assert doc.ring_position(0) == 1
+    navigable = doc.navigable_indices()
+    assert len(navigable) == len(doc.lines) - 6 and list(navigable)[:3] == [0, 1, 3]
+    setup_app.current_active_line_index = 3
+    show_previous_current_file_line(setup_app)
+    assert setup_app.current_active_line == "Dos." and setup_app.current_active_line_index == 1
+    setup_app.entry.text.return_value = ""
+    show_random_line_from_current_file(setup_app)
+    assert setup_app.entry.setText.call_args[0][0] in ("Uno.", "Dos.", "Tres.", "Cuatro.")
+    assert os.path.abspath(path) not in document._documents
+
+def test_sub_ring_loops_block_and_writes_through():
+    """Prueba SubRing: navegación en loop dentro del bloque y ediciones directas en el ring padre."""
+    parent = LineRing(["a1", "a2", ".", "b1", "b2", "b3", ".", "c1"])
+    parent.index = 4
+    block = SubRing(parent, 3, 6)
+    assert block.lines is parent.lines and block.current() == "b2"
+    block.move(1)
+    assert block.current() == "b3"
+    block.move(1)
+    assert block.current() == "b1"  # Da la vuelta sin salir del bloque
+    assert block.get(-1) == "b3" and block.get(3) == "b1"
+    block.insert_below("nueva")
+    assert parent.lines[4] == "nueva" and (block.start, block.end) == (3, 7)
+    block.replace_current("editada")
+    assert list(parent.lines) == ["a1", "a2", ".", "b1", "editada", "b2", "b3", ".", "c1"]
+    block.move(-2)
+    assert block.current() == "b3"
+    block.remove_current()
+    assert block.end == 6 and block.to_list_from_current() == ["b2", "b1", "editada"]
+
+def test_line_ring_apply_diff_keeps_logical_line():
+    """Prueba que apply_diff edite el ring en su lugar y el índice siga en la misma línea lógica."""
+    ring = LineRing([f"l{i}" for i in range(20)], compact=True)
+    rope = ring.lines
+    ring.index = 10
+    new = ["arriba 1", "arriba 2"] + [f"l{i}" for i in range(20) if i not in (3, 15)] + ["abajo"]
+    new[8] = "editada"  # l7
+    assert ring.apply_diff(new) > 0
+    assert ring.lines is rope and list(ring.lines) == new
+    assert ring.current() == "l10"
+    ring.index = new.index("editada")
+    assert ring.apply_diff([line for line in new if line != "editada"]) == 1
+    assert ring.current() == "l8"  # La línea borrada deja en su lugar a la siguiente
+    rnd = random.Random(8)
+    for step in range(50):
+        target = [rnd.choice(["a", "b", ".", "c"]) for _ in range(rnd.randint(1, 40))]
+        ring.index = rnd.randrange(len(ring.lines))
+        ring.apply_diff(target)
+        assert list(ring.lines) == target and 0 <= ring.index < len(target)
+
+def test_line_ring_apply_changes_follows_document(tmp_path):
+    """Prueba que los cambios registrados por el documento lleven el ring al mismo estado que un diff."""
+    path = str(tmp_path / "doc.txt")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("")
+    doc = VoidDocument(path)
+    ring = LineRing([""], compact=True)
+    rnd = random.Random(17)
+    pool = ["", "  ", ".", "a", " b ", "c"]
+    for step in range(60):
+        version = doc.version
+        for _ in range(rnd.randint(1, 4)):
+            n = len(doc.lines)
+            start = rnd.randint(0, n)
+            stop = min(n, start + rnd.randint(0, 3))
+            doc._apply(start, stop, [rnd.choice(pool) for _ in range(rnd.randint(0, 4))])
+        ring.index = rnd.randrange(len(ring.lines))
+        ring.apply_changes(doc.ring_changes_since(version))
+        assert list(ring.lines) == ([l.strip() for l in doc.lines if l.strip()] or [""])
+        assert 0 <= ring.index < len(ring.lines)
+    version = doc.version
+    doc.load()
+    assert doc.ring_changes_since(version) is None  # Recargado desde disco: hay que comparar todo
+    assert doc.ring_changes_since(doc.version) == []
+
+def test_line_ring_version_counts_mutations():
+    """Prueba que la versión del ring suba con cada edición y no al navegar."""
+    for compact in (False, True):
+        ring = LineRing(["a", ".", "b", "c"], compact=compact)
+        seen = [ring.version]
+        ring.move(1)
+        assert ring.version == seen[-1]
+        for edit in (lambda: ring.insert_below("x"), lambda: ring.replace_current("y"),
+                     lambda: ring.remove_current(), lambda: ring.apply_diff(["a", "b"])):
+            edit()
+            assert ring.version > seen[-1]
+            seen.append(ring.version)
+
+def test_line_ring_index_after_matches_move():
+    """Prueba que index_after calcule el destino de move sin moverse, y distance/index_at den la vuelta."""
+    ring = LineRing(["a", ".", "b", "c", ".", "d"], compact=True)
+    for start in range(6):
+        for delta in (-7, -2, -1, 1, 3, 8):
+            ring.index = start
+            expected = ring.index_after(delta)
+            assert ring.index == start
+            ring.move(delta)
+            assert ring.index == expected
+    ring.index = 5
+    assert ring.index_at(2) == 1 and ring.get(2) == "."
+    assert ring.distance(5, 2) == 3 and ring.distance(2, 5, forward=False) == -3
+    block = SubRing(ring, 2, 4)
+    assert block.index_at(3) == 2 and block.distance(3, 2) == 1
+
+def test_line_ring_on_rope():
+    """Prueba la API de LineRing sobre LineRope: navegación saltando puntos, insertar y borrar."""
+    ring = LineRing(["A", ".", "B", "C"])
+    ring.move(1)
+    assert ring.current() == "B"
+    ring.insert("Nueva", after_current=True)
+    assert ring.current() == "Nueva"
+    assert ring.lines == ["A", ".", "B", "Nueva", "C"]
+    ring.remove_current()
+    assert ring.current() == "C"
+    assert ring.get(1) == "A"
+
+def test_line_rope_separator_index(monkeypatch):
+    """Prueba que el índice de separadores '.' siga al día con las ediciones."""
+    monkeypatch.setattr(LineRope, 'LOAD', 4)
+    rnd = random.Random(11)
+    expected = [rnd.choice(["a", ".", " . ", "b"]) for _ in range(30)]
+    rope = LineRope(expected)
+    for _ in range(300):
+        n = len(expected)
+        op = rnd.random()
+        if op < 0.4:
+            i = rnd.randint(0, n)
+            value = rnd.choice([".", "x"])
+            expected.insert(i, value)
+            rope.insert(i, value)
+        elif op < 0.7:
+            a, b = sorted((rnd.randint(0, n), rnd.randint(0, n)))
+            items = [rnd.choice([".", "y"]) for _ in range(rnd.randint(0, 10))]
+            expected[a:b] = items
+            rope[a:b] = items
+        elif n:
+            i = rnd.randrange(n)
+            expected[i] = rnd.choice([".", "z"])
+            rope[i] = expected[i]
+        positions = [i for i, l in enumerate(expected) if l.strip() == '.']
+        assert list(rope.separator_positions()) == positions
+    for i in range(len(expected) + 1):
+        before = [p for p in positions if p < i]
+        assert rope.prev_separator(i) == (before[-1] if before else None)
+        assert rope.count_separators(i) == len(before)
+
+def test_line_rope_nonblank_index(monkeypatch):
+    """Prueba que el índice de líneas vacías traduzca posiciones del documento y del ring."""
+    monkeypatch.setattr(LineRope, 'LOAD', 4)
+    rnd = random.Random(12)
+    expected = [rnd.choice(["a", "", "  ", "."]) for _ in range(30)]
+    rope = LineRope(expected)
+    for _ in range(300):
+        n = len(expected)
+        op = rnd.random()
+        if op < 0.35:
+            i = rnd.randint(0, n)
+            expected.insert(i, rnd.choice(["", "x"]))
+            rope.insert(i, expected[i])
+        elif op < 0.6:
+            a, b = sorted((rnd.randint(0, n), rnd.randint(0, n)))
+            items = [rnd.choice(["", " ", "y"]) for _ in range(rnd.randint(0, 10))]
+            expected[a:b] = items
+            rope[a:b] = items
+        elif op < 0.8 and n:
+            i = rnd.randrange(n)
+            del expected[i]
+            del rope[i]
+        elif n:
+            i = rnd.randrange(n)
+            expected[i] = rnd.choice(["", "z"])
+            rope[i] = expected[i]
+        filled = [i for i, l in enumerate(expected) if l.strip()]
+        assert rope.nonblank_count() == len(filled)
+        assert [rope.nonblank_position(k) for k in range(len(filled))] == filled
+    for i in range(len(expected) + 1):
+        assert rope.count_nonblank(i) == sum(1 for l in expected[:i] if l.strip())
+
+# --- Tests para saver.py ---
+
+def test_background_saver_coalesces_bursts():
+    """Prueba BackgroundSaver: una ráfaga de pedidos es una sola escritura, en el hilo de fondo."""
+    saver = BackgroundSaver(delay_ms=10_000)
+    written, committed, saved, failed = [], [], [], []
+    saver.saved.connect(saved.append)
+    saver.failed.connect(lambda key, error: failed.append((key, error)))
+    for n in range(5):
+        saver.request("a.txt", lambda n=n: written.append(n) or n, committed.append)
+    assert saver.pending("a.txt") and written == []
+    saver.flush()
+    assert written == [4] and committed == [4] and saved == ["a.txt"]
+    assert not saver.pending()
+
+    # Con demora corta lo escribe el hilo de fondo; el commit espera al hilo de la interfaz
+    saver.request("b.txt", lambda: written.append("b") or "b", committed.append, delay=10)
+    deadline = time.time() + 5
+    while "b" not in written and time.time() < deadline:
+        time.sleep(0.01)
+    assert written[-1] == "b" and committed[-1] == 4 and saver.writing("b.txt")
+    saver.flush()
+    assert committed[-1] == "b"
+
+    def broken():
+        raise OSError("disco lleno")
+    saver.request("c.txt", broken, committed.append)
+    saver.stop()
+    assert failed == [("c.txt", "disco lleno")] and committed[-1] == "b"
+
 # --- Tests para tools.py ---
 
 def test_clean_text():
@@ -1,7 +1,15 @@
 # views.py - Vistas F1, F2, F3 con sincronización de índice
+import os
+from bisect import bisect_right
+from collections import OrderedDict
+from itertools import accumulate
+
 from PyQt6.QtWidgets import QWidget
-from PyQt6.QtGui import QColor, QPainter, QFont, QPen
-from PyQt6.QtCore import Qt
+from PyQt6.QtGui import QColor, QPainter, QFont, QPen, QPixmap
+from PyQt6.QtCore import Qt, QPropertyAnimation, QEasingCurve, pyqtProperty
+
+from document import open_document, close_mapped, MappedDocument
+from mapped_lines import MappedLines
 
 
 class NormalView(QWidget):
@@ -36,168 +44,304 @@ class NormalView(QWidget):
         
         painter.drawEllipse(center_x - radius, center_y - radius, radius * 2, radius * 2)
 
+        # Candidatos de la búsqueda aproximada, debajo del entry y cada vez más tenues
+        matches = getattr(self.parent_app, 'fuzzy_matches', None)
+        if matches:
+            painter.setFont(QFont("Consolas", 10))
+            painter.setPen(QColor("white"))
+            text_width = radius * 2 - 120
+            metrics = painter.fontMetrics()
+            line_height = 22
+            for i, (rel, number, text) in enumerate(matches):
+                painter.setOpacity(max(0.15, 0.6 - i * 0.07))
+                elided = metrics.elidedText(text, Qt.TextElideMode.ElideRight, text_width)
+                painter.drawText(center_x - text_width // 2, center_y + 30 + i * line_height,
+                                 text_width, line_height, Qt.AlignmentFlag.AlignCenter, elided)
+
 
 class VersesView(QWidget):
     """Vista F3: Muestra versos/párrafos separados por puntos"""
+
+    line_height = 25
+    verse_spacing = 60
+    PIXMAP_BUDGET = 24_000_000   # Píxeles en total de los versos cacheados (~96 MB en ARGB)
+    MAX_PIXMAP_HEIGHT = 4096     # Versos más altos se dibujan línea a línea (solo lo visible)
     
     def __init__(self, ring, parent=None):
         super().__init__(parent)
         self.ring = ring
         self.verses = []
         self.current_verse_index = 0
-        self._cached_ring_lines = None  # Cache para detectar cambios
+        self._verse_starts = []     # 'start' de cada verso, para bisect
+        self._verse_tops = [0]      # Suma de alturas: y de cada verso respecto del primero (+ total)
+        self._cached_key = None     # Cache para detectar cambios
+        # Cada verso se dibuja una vez en un QPixmap: (contenido, actual, ancho, escala) -> pixmap
+        self._pixmaps = OrderedDict()
+        self._pixmap_pixels = 0
+        self._content_keys = {}     # (start, end) -> hash del texto, válido para la versión cacheada
+        self._scroll = 0.0
+        self.current_animation = None
         self.setStyleSheet("background: black; color: white;")
+
+    @pyqtProperty(float)
+    def scroll(self):
+        return self._scroll
+
+    @scroll.setter
+    def scroll(self, value):
+        self._scroll = value
+        self.update()
+
+    def animate_to_verse(self, verse_index):
+        """
+        Mueve el índice al inicio del verso y desliza la vista desde donde
+        estaba (como animate_move en F2). Durante la animación solo se
+        componen los pixmaps cacheados.
+        """
+        self.recalculate_verses_if_needed()
+        old = self.verses[self.current_verse_index]
+        new = self.verses[verse_index]
+        old_center = self._verse_tops[self.current_verse_index] + (old['end'] - old['start'] + 1) * self.line_height // 2
+        new_center = self._verse_tops[verse_index] + (new['end'] - new['start'] + 1) * self.line_height // 2
+        self.ring.index = new['start']
+        self.current_verse_index = verse_index
+
+        # Un salto largo (la vuelta del último al primero) se anima como una pantalla
+        limit = max(1, self.height())
+        start = max(-limit, min(limit, self._scroll + new_center - old_center))
+        if self.current_animation:
+            self.current_animation.stop()
+        anim = QPropertyAnimation(self, b"scroll")
+        anim.setDuration(180)
+        anim.setEasingCurve(QEasingCurve.Type.OutQuad)
+        anim.setStartValue(float(start))
+        anim.setEndValue(0.0)
+        anim.finished.connect(self._animation_finished)
+        anim.start()
+        self.current_animation = anim
+
+    def _animation_finished(self):
+        self._scroll = 0.0
+        self.current_animation = None
+        self.update()
     
     def recalculate_verses_if_needed(self):
-        """Solo recalcula si el ring cambió"""
-        if self._cached_ring_lines != self.ring.lines:
+        """Solo recalcula si el ring cambió (por su versión: no se recorre nada en cada repintado)"""
+        lines = self.ring.lines
+        key = (id(lines), self.ring.version)
+        if self._cached_key != key:
             self.verses = self.calculate_verses()
-            self._cached_ring_lines = self.ring.lines[:]
+            self._verse_starts = [v['start'] for v in self.verses]
+            self._verse_tops = [0]
+            self._verse_tops.extend(accumulate(
+                (v['end'] - v['start'] + 1) * self.line_height + self.verse_spacing for v in self.verses))
+            self._cached_key = key
+            self._content_keys = {}
             print(f"🔍 Calculados {len(self.verses)} bloques")
         self.current_verse_index = self.find_current_verse()
 
-    def calculate_verses(self):
+    def calculate_verses(self, separators=None):
         """
         Calcula los versos basándose en puntos '.' como separadores.
         SOLO '.' es separador válido. Todo lo demás es contenido normal.
-        Retorna lista de dicts con 'lines', 'start', 'end'.
+        Usa el índice de separadores del LineRope: no recorre las líneas.
+        Retorna lista de dicts con 'start', 'end' (índices inclusivos en el ring).
         """
+        if separators is None:
+            separators = self.ring.lines.separator_positions()
         verses = []
-        current_verse = []
         start_index = 0
-        
-        for idx, line in enumerate(self.ring.lines):
-            if line.strip() == '.':
-                if current_verse:
-                    verses.append({
-                        'lines': current_verse, 
-                        'start': start_index, 
-                        'end': idx - 1
-                    })
-                    current_verse = []
-                start_index = idx + 1
-            else:
-                current_verse.append(line)
+        for idx in separators:
+            if idx > start_index:
+                verses.append({'start': start_index, 'end': idx - 1})
+            start_index = idx + 1
         
         # Último verso si no termina con punto
-        if current_verse:
-            verses.append({
-                'lines': current_verse, 
-                'start': start_index, 
-                'end': len(self.ring.lines) - 1
-            })
+        if start_index < len(self.ring.lines):
+            verses.append({'start': start_index, 'end': len(self.ring.lines) - 1})
         
         # Fallback si no hay versos
         if not verses:
-            verses.append({'lines': [""], 'start': 0, 'end': 0})
+            verses.append({'start': 0, 'end': -1})
         
         return verses
 
+    def verse_lines(self, verse):
+        """Líneas de un verso (vacío para el verso de fallback)"""
+        return self.ring.lines[verse['start']:verse['end'] + 1]
+
+    def _draw_verse_lines(self, painter, lines, top, first_line, is_current, w):
+        """Dibuja lines a partir de la línea first_line del verso, que empieza en y=top"""
+        font = QFont("Consolas", 12 if is_current else 10)
+        painter.setFont(font)
+        painter.setPen(QColor("white"))
+        line_height = self.line_height
+        for line_idx, line in enumerate(lines, first_line):
+            text_y = top + line_idx * line_height
+            # Resaltar TODO el bloque actual: línea vertical para todo el bloque
+            if is_current:
+                painter.drawLine(50, text_y, 50, text_y + line_height - 5)
+            painter.drawText(0, text_y, w, line_height,
+                             Qt.AlignmentFlag.AlignCenter | Qt.AlignmentFlag.AlignVCenter,
+                             line)
+
+    def _verse_pixmap(self, verse, is_current, w):
+        """Pixmap del verso, de la cache (LRU por presupuesto de píxeles) o dibujado ahora"""
+        span = (verse['start'], verse['end'])
+        content = self._content_keys.get(span)
+        lines = None
+        if content is None:
+            lines = self.verse_lines(verse)
+            content = self._content_keys[span] = hash(tuple(lines))
+        ratio = self.devicePixelRatioF()
+        key = (content, is_current, w, ratio)
+        pixmap = self._pixmaps.get(key)
+        if pixmap is not None:
+            self._pixmaps.move_to_end(key)
+            return pixmap
+
+        if lines is None:
+            lines = self.verse_lines(verse)
+        height = len(lines) * self.line_height
+        pixmap = QPixmap(int(w * ratio), int(height * ratio))
+        pixmap.setDevicePixelRatio(ratio)
+        pixmap.fill(Qt.GlobalColor.transparent)
+        painter = QPainter(pixmap)
+        painter.setRenderHint(QPainter.RenderHint.TextAntialiasing)
+        self._draw_verse_lines(painter, lines, 0, 0, is_current, w)
+        painter.end()
+
+        self._pixmaps[key] = pixmap
+        self._pixmap_pixels += pixmap.width() * pixmap.height()
+        while self._pixmap_pixels > self.PIXMAP_BUDGET and len(self._pixmaps) > 1:
+            _, old = self._pixmaps.popitem(last=False)
+            self._pixmap_pixels -= old.width() * old.height()
+        return pixmap
+
     def find_current_verse(self):
-        """Encuentra qué verso contiene el índice actual del ring"""
-        for idx, verse in enumerate(self.verses):
-            if verse['start'] <= self.ring.index <= verse['end']:
-                return idx
+        """Encuentra qué verso contiene el índice actual del ring (bisect sobre los inicios)"""
+        idx = bisect_right(self._verse_starts, self.ring.index) - 1
+        if idx >= 0 and self.ring.index <= self.verses[idx]['end']:
+            return idx
         return 0
 
     def paintEvent(self, event):
-        """Dibuja todos los versos con el actual centrado y resaltado"""
+        """
+        Dibuja los versos visibles con el actual centrado y resaltado. Con la
+        suma de alturas precalculada, el primer verso visible es un bisect y
+        se dibujan solo los que caen en pantalla: el costo no depende del
+        tamaño del archivo. Cada verso sale de su pixmap cacheado; solo cambia
+        la opacidad con que se compone.
+        """
         painter = QPainter(self)
         painter.setRenderHint(QPainter.RenderHint.TextAntialiasing)
-        font = QFont("Consolas", 11)
         painter.setPen(QColor("white"))
         
         w = self.width()
         h = self.height()
-        line_height = 25
-        verse_spacing = 60
+        line_height = self.line_height
+        verse_spacing = self.verse_spacing
 
         # Usar cache en vez de recalcular siempre
         self.recalculate_verses_if_needed()
+        tops = self._verse_tops
 
-        # Calcular altura acumulada hasta el bloque actual
-        height_before_current = 0
-        for idx in range(self.current_verse_index):
-            verse_height = len(self.verses[idx]['lines']) * line_height
-            height_before_current += verse_height + verse_spacing
-        
         # Altura del bloque actual
-        current_verse_height = len(self.verses[self.current_verse_index]['lines']) * line_height
+        current = self.verses[self.current_verse_index]
+        current_verse_height = (current['end'] - current['start'] + 1) * line_height
         
-        # Centrar: poner el MEDIO del bloque actual en h//2
-        y_offset = h // 2 - height_before_current - (current_verse_height // 2)
+        # Centrar: poner el MEDIO del bloque actual en h//2 (más el desplazamiento de la animación)
+        base = h // 2 - tops[self.current_verse_index] - (current_verse_height // 2) + int(self._scroll)
 
-        for verse_idx, verse in enumerate(self.verses):
+        # Primer verso que termina por debajo del borde superior
+        first = max(0, bisect_right(tops, -base) - 1)
+        for verse_idx in range(first, len(self.verses)):
+            verse_y = base + tops[verse_idx]
+            if verse_y >= h:
+                break
+            verse = self.verses[verse_idx]
             is_current = (verse_idx == self.current_verse_index)
-            verse_y = y_offset
+            count = verse['end'] - verse['start'] + 1
 
-            # TODO el bloque actual se resalta, no solo una línea
-            if is_current:
-                painter.setOpacity(1.0)
-                font.setPointSize(12)
-            else:
-                painter.setOpacity(0.3)
-                font.setPointSize(10)
-
-            painter.setFont(font)
-
-            # Dibujar cada línea del verso
-            for line_idx, line in enumerate(verse['lines']):
-                text_y = verse_y + (line_idx * line_height)
-
-                # Resaltar TODO el bloque actual
-                if is_current:
-                    painter.setOpacity(1.0)
-                    painter.setPen(QColor("white"))
-                    # Línea vertical para TODO el bloque
-                    painter.drawLine(50, text_y, 50, text_y + line_height - 5)
-                else:
-                    painter.setOpacity(0.3)
-                    painter.setPen(QColor("white"))
-
-                # Dibujar texto centrado
-                painter.drawText(0, text_y, w, line_height,
-                                Qt.AlignmentFlag.AlignCenter | Qt.AlignmentFlag.AlignVCenter,
-                                line)
+            painter.setOpacity(1.0 if is_current else 0.3)
+            if 0 < count * line_height <= self.MAX_PIXMAP_HEIGHT:
+                painter.drawPixmap(0, verse_y, self._verse_pixmap(verse, is_current, w))
+            elif count > 0:
+                # Verso enorme: solo las líneas que están en pantalla
+                top_line = max(0, -verse_y // line_height)
+                bottom_line = min(count, (h - verse_y) // line_height + 1)
+                if bottom_line > top_line:
+                    visible = self.ring.lines[verse['start'] + top_line:verse['start'] + bottom_line]
+                    self._draw_verse_lines(painter, visible, verse_y, top_line, is_current, w)
 
-            # Avanzar offset DESPUÉS del verso
-            y_offset += len(verse['lines']) * line_height
-            
             # Dibujar punto separador DESPUÉS del verso (si no es el último)
             if verse_idx < len(self.verses) - 1:
-                dot_y = y_offset + verse_spacing // 2
+                dot_y = verse_y + count * line_height + verse_spacing // 2
                 painter.setOpacity(0.5)  # Puntos con opacidad media
+                painter.setFont(QFont("Consolas", 12 if is_current else 10))
                 painter.drawText(0, dot_y, w, line_height,
                                 Qt.AlignmentFlag.AlignCenter | Qt.AlignmentFlag.AlignVCenter,
                                 ".")
-            
-            # Añadir espacio después del punto
-            y_offset += verse_spacing
 
 
 def sync_ring_with_file(app):
     """
     Sincroniza el line_ring con el archivo actual, preservando el índice.
     Los puntos SÍ se cargan (son visibles), pero se saltean al navegar.
+    Si el documento no cambió desde la última sincronización (misma versión),
+    el ring actual ya está al día y no se reconstruye; si es el mismo archivo
+    en otra versión, se le aplican los cambios que registró el documento desde
+    entonces (LineRing.apply_changes), o el diff de líneas si se recargó desde
+    disco (LineRing.apply_diff).
+    Los archivos de MAPPED_MIN_BYTES o más son un MappedDocument: el ring
+    muestra sus mismas líneas mapeadas (ver sync_mapped_ring).
     """
+    view = getattr(app, 'circular_view', None)
+    if view is not None:
+        # Un desplazamiento animado a medio camino termina antes: su destino pasa al
+        # índice del ring, que los cambios de abajo llevan a la misma línea lógica
+        view.settle()
     try:
-        with open(app.current_file_path, 'r', encoding='utf-8') as f:
-            # Cargar TODAS las líneas incluyendo puntos
-            lines = [l.strip() for l in f if l.strip()]
-            
-        # Debug: contar puntos
-        num_dots = sum(1 for l in lines if l == '.')
-        print(f"   📊 Líneas cargadas: {len(lines)} (incluyendo {num_dots} puntos)")
+        # Cargar TODAS las líneas incluyendo puntos, desde el documento residente
+        doc = open_document(app.current_file_path)
+        if isinstance(doc, MappedDocument):
+            return sync_mapped_ring(app, doc)
+        sync_key = (doc.path, id(doc), doc.version)
+        previous_key = getattr(app, 'ring_sync_key', None)
+        if app.line_ring and previous_key == sync_key:
+            return app.line_ring
+        if previous_key and previous_key[0] == doc.path and not isinstance(app.line_ring.lines, MappedLines):
+            # Mismo archivo, otra versión: aplicarle al ring lo que cambió en lugar de armar otro
+            changes = doc.ring_changes_since(previous_key[2]) if previous_key[1] == id(doc) else None
+            if changes is not None:
+                changed = app.line_ring.apply_changes(changes)
+            if changes is None or len(app.line_ring.lines) != max(1, doc.lines.nonblank_count()):
+                # Recargado desde disco (o sin registro hasta esa versión): comparar el archivo entero
+                changed = app.line_ring.apply_diff([l.strip() for l in doc.lines if l.strip()] or [""])
+            if app.line_ring.lines and app.line_ring.current().strip() == '.':
+                app.line_ring.move(1)
+            app.ring_sync_key = sync_key
+            print(f"🔄 Ring actualizado: {changed} líneas cambiadas, índice={app.line_ring.index}")
+            return app.line_ring
+        # Generador: el ring compacto lo consume por bloques, sin una lista de str intermedia
+        lines = (l.strip() for l in doc.lines if l.strip())
+        num_dots = doc.lines.separator_count()
     except Exception as e:
         print(f"⚠️ Error leyendo archivo: {e}")
         lines = []
+        sync_key = None
+        num_dots = 0
 
     # Preservar índice si existe y es válido
     old_index = app.line_ring.index if app.line_ring and hasattr(app.line_ring, 'index') else 0
+    if app.line_ring and isinstance(app.line_ring.lines, MappedLines):
+        release_mapped(app, app.line_ring.lines)
     
-    # Crear nuevo ring con TODAS las líneas (puntos incluidos)
+    # Crear nuevo ring con TODAS las líneas (puntos incluidos), en almacenamiento compacto
     from line_ring import LineRing
-    app.line_ring = LineRing(lines or [""])
+    app.line_ring = LineRing(lines, compact=True)
+    # Debug: contar puntos (del índice de separadores, sin recorrer)
+    print(f"   📊 Líneas cargadas: {len(app.line_ring.lines)} (incluyendo {num_dots} puntos)")
     
     # Restaurar índice si sigue siendo válido
     if old_index < len(app.line_ring.lines):
@@ -210,5 +354,44 @@ def sync_ring_with_file(app):
         print(f"   ⚠️ Índice apunta a punto, avanzando...")
         app.line_ring.move(1)  # Esto saltea puntos automáticamente
     
+    app.ring_sync_key = sync_key
     print(f"🔄 Ring sincronizado: {len(app.line_ring.lines)} líneas, índice={app.line_ring.index}")
-    return app.line_ring
\ No newline at end of file
+    return app.line_ring
+
+
+def release_mapped(app, lines):
+    """Suelta un archivo mapeado, terminando antes un guardado de fondo que lo esté leyendo."""
+    saver = getattr(app, 'saver', None)
+    if saver:
+        saver.flush(lines.path)
+    close_mapped(lines)
+
+
+def sync_mapped_ring(app, doc):
+    """
+    Ring de un archivo más grande que la memoria: muestra las líneas del
+    MappedDocument (las mismas que edita F1), así que se abre al instante y
+    la primera pantalla se ve mientras el índice de líneas se arma en
+    segundo plano. Se reusa mientras el documento no se vuelva a mapear
+    (cambio por fuera sin ediciones pendientes).
+    """
+    path = app.current_file_path
+    lines = app.line_ring.lines if app.line_ring else None
+    if lines is doc.mapped:
+        return app.line_ring
+
+    doc.mapped.on_progress = getattr(app, 'ring_indexed', None) and app.ring_indexed.emit
+    if isinstance(lines, MappedLines):
+        release_mapped(app, lines)
+    old_index = app.line_ring.index if app.line_ring else 0
+    from line_ring import LineRing
+    app.line_ring = LineRing.mapped(doc.mapped)
+    if old_index:
+        # Esperar solo hasta la línea que se estaba mostrando, no el archivo entero
+        app.line_ring.lines.wait(old_index + 1)
+        app.line_ring.index = min(old_index, max(0, len(app.line_ring.lines) - 1))
+    if app.line_ring.lines and app.line_ring.current().strip() == '.':
+        app.line_ring.move(1)
+    app.ring_sync_key = (path, 'mapped', tuple(app.line_ring.lines.fp))
+    print(f"🗺️ Ring mapeado: {os.path.basename(path)} (índice de líneas en segundo plano)")
+    return app.line_ring
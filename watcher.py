@@ -0,0 +1,222 @@
+# watcher.py - Observa el directorio void y publica altas, bajas y cambios de archivos .txt
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+
+from journal import file_fingerprint
+
+ADDED = 'added'
+REMOVED = 'removed'
+MODIFIED = 'modified'
+
+# Constantes de inotify (linux/inotify.h)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def is_watched_file(path):
+    """Solo interesan los .txt (los temporales y los índices ocultos no)."""
+    return path.lower().endswith('.txt') and not os.path.basename(path).startswith('.')
+
+
+def _snapshot(void_dir):
+    """ruta -> huella de todos los .txt del directorio (con subcarpetas)."""
+    files = {}
+    for root, dirs, names in os.walk(void_dir):
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        for name in names:
+            path = os.path.join(root, name)
+            if is_watched_file(path):
+                fp = file_fingerprint(path)
+                if fp is not None:
+                    files[path] = fp
+    return files
+
+
+def _load_libc():
+    if not hasattr(os, 'O_DIRECTORY'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class VoidWatcher:
+    """
+    Hilo de fondo que observa void_dir (incluyendo subcarpetas) y llama a
+    callback(tipo, ruta) con tipo ADDED, REMOVED o MODIFIED para cada .txt.
+
+    Usa inotify cuando está disponible (Linux). Si no, cae a un sondeo
+    periódico que compara mtime y tamaño. El callback corre en el hilo del
+    watcher: la interfaz lo pasa a su hilo con una señal de Qt.
+    """
+
+    def __init__(self, void_dir, callback, poll_interval=1.0):
+        self.void_dir = void_dir
+        self.callback = callback
+        self.poll_interval = poll_interval
+        self.backend = None
+        self._known = set()
+        self._initial = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._libc = None
+        self._fd = None
+        self._watches = {}  # wd -> directorio
+
+    def start(self):
+        # La misma foto inicial para _known y para el sondeo: lo creado mientras
+        # arranca el hilo aparece como cambio en lugar de perderse
+        self._initial = _snapshot(self.void_dir)
+        self._known = set(self._initial)
+        libc = _load_libc()
+        if libc is not None and self._init_inotify(libc):
+            self.backend = 'inotify'
+            target = self._run_inotify
+        else:
+            self.backend = 'polling'
+            target = self._run_polling
+        self._thread = threading.Thread(target=target, name="void-watcher", daemon=True)
+        self._thread.start()
+        print(f"👁️ Observando {self.void_dir} ({self.backend})")
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2.0)
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _publish(self, kind, path):
+        if kind == REMOVED:
+            if path not in self._known:
+                return
+            self._known.discard(path)
+        elif path not in self._known:
+            self._known.add(path)
+            kind = ADDED
+        try:
+            self.callback(kind, path)
+        except Exception as e:
+            print(f"❌ Error procesando evento {kind} de {os.path.basename(path)}: {e}")
+
+    # --- inotify ---
+
+    def _init_inotify(self, libc):
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return False
+        self._libc = libc
+        self._fd = fd
+        for root, dirs, names in os.walk(self.void_dir):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            if not self._add_watch(root):
+                os.close(fd)
+                self._fd = None
+                return False
+        return True
+
+    def _add_watch(self, directory):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            print(f"⚠️ inotify no pudo observar {directory} (errno {ctypes.get_errno()})")
+            return False
+        self._watches[wd] = directory
+        return True
+
+    def _run_inotify(self):
+        while not self._stop.is_set():
+            ready, _, _ = select.select([self._fd], [], [], self.poll_interval)
+            if not ready:
+                continue
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            except OSError:
+                return
+            self._dispatch(data)
+
+    def _dispatch(self, data):
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # Se perdieron eventos: comparar contra el disco
+                self._resync()
+                continue
+            directory = self._watches.get(wd)
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, name)
+
+            if mask & IN_ISDIR:
+                if name.startswith('.'):
+                    # Carpetas ocultas (índices como .void_related): no son del corpus
+                    continue
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # Carpeta nueva: observarla y publicar lo que ya tenga adentro
+                    for root, dirs, names in os.walk(path):
+                        self._add_watch(root)
+                    for file_path in _snapshot(path):
+                        self._publish(ADDED, file_path)
+                elif mask & IN_MOVED_FROM:
+                    prefix = path + os.sep
+                    for file_path in [p for p in self._known if p.startswith(prefix)]:
+                        self._publish(REMOVED, file_path)
+                continue
+
+            if not is_watched_file(path):
+                continue
+            if mask & (IN_DELETE | IN_MOVED_FROM):
+                self._publish(REMOVED, path)
+            elif mask & (IN_CREATE | IN_MOVED_TO | IN_CLOSE_WRITE):
+                self._publish(MODIFIED, path)
+
+    def _resync(self):
+        current = _snapshot(self.void_dir)
+        for path in self._known - set(current):
+            self._publish(REMOVED, path)
+        for path in current:
+            self._publish(MODIFIED, path)
+
+    # --- Sondeo ---
+
+    def _run_polling(self):
+        previous = self._initial
+        while not self._stop.wait(self.poll_interval):
+            current = _snapshot(self.void_dir)
+            for path in previous.keys() - current.keys():
+                self._publish(REMOVED, path)
+            for path, fp in current.items():
+                if previous.get(path) != fp:
+                    self._publish(MODIFIED, path)
+            previous = current
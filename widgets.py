@@ -2,7 +2,7 @@
 import numpy as np
 from PyQt6.QtWidgets import QLineEdit, QWidget
 from PyQt6.QtGui import QPainter, QPixmap, QImage
-from PyQt6.QtCore import Qt, QTimer, pyqtSignal
+from PyQt6.QtCore import Qt, QPoint, QRect, QTimer, pyqtSignal
 
 class CustomLineEdit(QLineEdit):
     """QLineEdit personalizado con soporte para spacebar como tecla de void"""
@@ -26,7 +26,11 @@ class CustomLineEdit(QLineEdit):
             return
         
         # Atajos con Ctrl
-        if key == Qt.Key.Key_0 and (modifiers & Qt.KeyboardModifier.ControlModifier):
+        if key in (Qt.Key.Key_Return, Qt.Key.Key_Enter) and (modifiers & Qt.KeyboardModifier.ControlModifier):
+            # Abrir en F2 los candidatos de la búsqueda aproximada
+            self.parent.show_fuzzy_results()
+            event.accept()
+        elif key == Qt.Key.Key_0 and (modifiers & Qt.KeyboardModifier.ControlModifier):
             from controls import show_random_line_from_random_file
             show_random_line_from_random_file(self.parent, event)
             event.accept()
@@ -34,47 +38,78 @@ class CustomLineEdit(QLineEdit):
             from controls import show_random_line_from_current_file
             show_random_line_from_current_file(self.parent, event)
             event.accept()
+        elif key == Qt.Key.Key_R and (modifiers & Qt.KeyboardModifier.ControlModifier):
+            from controls import show_related_line
+            show_related_line(self.parent, event)
+            event.accept()
         else:
             super().keyPressEvent(event)
 
 
 class NoiseOverlay(QWidget):
-    """Overlay de ruido visual generativo en tiempo real"""
-    
+    """
+    Overlay de ruido visual tipo TV sin señal. En lugar de generar ruido del
+    tamaño de la pantalla en cada cuadro, al crearse arma un pool de mosaicos
+    chicos (con la opacidad ya aplicada). Cada cuadro divide el widget en
+    celdas de TILE_SIZE y a cada una le toca un recorte al azar de un mosaico
+    del pool, así no se ve una grilla que se repite.
+    """
+
+    TILE_SIZE = 256   # Lado de cada celda del cuadro, en píxeles (los mosaicos miden el doble)
+    TILE_POOL = 4     # Mosaicos distintos entre los que se alterna
+    OPACITY = 0.09    # Opacidad del ruido sobre lo que hay debajo
+    FRAME_MS = 50     # Un cuadro nuevo cada 50ms
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setAttribute(Qt.WidgetAttribute.WA_TransparentForMouseEvents)
         self.setAttribute(Qt.WidgetAttribute.WA_TranslucentBackground)
-        self.noise_pixmap = None
-        
-        # Timer para generar nuevo ruido cada 50ms
+        self._rng = np.random.default_rng()
+        self.tiles = [self._make_tile() for _ in range(self.TILE_POOL)]
+        self.cells = None  # (filas, columnas, 3): mosaico y desplazamiento de cada celda del cuadro
+
+        # Timer para pasar al siguiente cuadro de ruido
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.generate_noise)
-        self.timer.start(50)
-    
+        self.timer.start(self.FRAME_MS)
+
+    def _make_tile(self):
+        """Mosaico de ruido gris premultiplicado por la opacidad: se dibuja sin setOpacity"""
+        size = self.TILE_SIZE * 2
+        alpha = round(self.OPACITY * 255)
+        gray = self._rng.integers(0, 256, (size, size), dtype=np.uint32) * alpha // 255
+        argb = np.uint32(alpha << 24) | (gray << 16) | (gray << 8) | gray
+        image = QImage(argb.data, size, size, size * 4, QImage.Format.Format_ARGB32_Premultiplied)
+        return QPixmap.fromImage(image.copy())
+
     def generate_noise(self):
-        """Genera un patrón de ruido aleatorio tipo TV sin señal"""
-        block_size = 1
-        w, h = self.width(), self.height()
-        
-        if w == 0 or h == 0:
+        """Pasa a otro cuadro: cada celda sortea de nuevo su mosaico y su desplazamiento"""
+        if self.width() == 0 or self.height() == 0:
             return
-            
-        h_blocks, w_blocks = h // block_size, w // block_size
-        noise_gray = np.random.randint(0, 256, (h_blocks, w_blocks), dtype=np.uint8)
-        
-        image = QImage(noise_gray.data, w_blocks, h_blocks, w_blocks, 
-                      QImage.Format.Format_Grayscale8)
-        image = image.scaled(w, h, 
-                           Qt.AspectRatioMode.IgnoreAspectRatio, 
-                           Qt.TransformationMode.FastTransformation)
-        
-        self.noise_pixmap = QPixmap.fromImage(image)
+        size = self.TILE_SIZE
+        rows, cols = -(-self.height() // size), -(-self.width() // size)
+        self.cells = self._rng.integers((len(self.tiles), size, size), size=(rows, cols, 3))
+        # Cambia todo el ruido, no una parte: la región sucia es el widget entero
         self.update()
-    
+
+    def resizeEvent(self, event):
+        # Las celdas del cuadro actual tienen que cubrir el tamaño nuevo
+        self.generate_noise()
+        super().resizeEvent(event)
+
     def paintEvent(self, event):
-        """Dibuja el ruido con opacidad baja"""
-        if self.noise_pixmap:
-            painter = QPainter(self)
-            painter.setOpacity(0.09)
-            painter.drawPixmap(0, 0, self.noise_pixmap)
\ No newline at end of file
+        """Dibuja solo las celdas que tocan la región expuesta"""
+        if self.cells is None:
+            return
+        rect = event.rect()
+        size = self.TILE_SIZE
+        rows, cols = self.cells.shape[:2]
+        painter = QPainter(self)
+        for row in range(max(0, rect.top() // size), min(rows, rect.bottom() // size + 1)):
+            for col in range(max(0, rect.left() // size), min(cols, rect.right() // size + 1)):
+                tile, ox, oy = self.cells[row, col]
+                cell = QRect(col * size, row * size, size, size).intersected(rect)
+                # El mosaico mide el doble que la celda: el recorte se copia de una vez, sin dar la vuelta.
+                # Se mide desde la esquina de la celda, así una región parcial sigue el mismo cuadro
+                source = cell.translated(int(ox) - col * size, int(oy) - row * size)
+                painter.drawPixmap(cell, self.tiles[tile], source)